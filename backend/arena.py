@@ -0,0 +1,433 @@
+"""
+Arenas: several snakes, each steered by its own host, on one board.
+
+Every update moves all snakes at once and resolves the moves against the
+shared OccupancyGrid, whose snake cells hold the number of the snake on
+them. A tick costs a few lookups per snake, however long the bodies are:
+
+- a head that leaves the board is eliminated;
+- heads meeting on a tile: the longest snake takes it (and any fruit on it),
+  equal lengths are all eliminated;
+- tails move out before heads move in, so a head may take the tile a tail
+  is leaving, unless that snake is growing;
+- a head on any other snake cell is eliminated, credited to the cell's owner.
+
+Eliminated snakes are taken off the board, which costs their length once.
+"""
+from core import Direction, SnakeBody, queue_turn, take_turn
+from game_logic import ChangeLog, MultiplayerSnakeGame
+from protocol import KEYFRAME_INTERVAL, DeltaStream
+
+# Most snakes in one arena (snake cells store their number in a byte)
+MAX_SNAKES = 64
+# Random tiles tried when looking for room to spawn a snake
+SPAWN_ATTEMPTS = 32
+# Reach of the fruit bots' distance field; it is searched from every head,
+# so arenas keep it short
+ARENA_FIELD_RADIUS = 8
+
+
+class ArenaSnake:
+    __slots__ = ('snake_id', 'body', 'direction', 'turns', 'input_ack', 'score', 'alive', 'eliminated_by')
+    
+    def __init__(self, snake_id, body):
+        """
+        One snake of an arena, with its host's queued turns and its score.
+        
+        Args:
+            snake_id: Number of the snake (1 to MAX_SNAKES), also stored on its board cells
+            body: Empty SnakeBody for its segments
+        """
+        self.snake_id = snake_id
+        self.body = body
+        self.direction = Direction.RIGHT
+        # Pending turns and the last input handled, as in SnakeCore
+        self.turns = []
+        self.input_ack = None
+        self.score = 0
+        self.alive = False
+        # Snake it ran into (None for the border or a head-on tie)
+        self.eliminated_by = None
+    
+    def state(self):
+        return {
+            'id': self.snake_id,
+            'body': list(self.body),
+            'score': self.score,
+            'alive': self.alive,
+            'ack': self.input_ack
+        }
+    
+    def copy(self):
+        clone = ArenaSnake(self.snake_id, self.body.copy())
+        clone.direction = self.direction
+        clone.turns = list(self.turns)
+        clone.input_ack = self.input_ack
+        clone.score = self.score
+        clone.alive = self.alive
+        clone.eliminated_by = self.eliminated_by
+        return clone
+
+
+class ArenaChangeLog(ChangeLog):
+    """ChangeLog of an arena: moves are kept per snake instead of for the one snake."""
+    
+    def clear(self):
+        super().clear()
+        self.moves = {}       # snake_id -> [new head cells, tail cells removed]
+        self.spawned = {}     # Ordered set of snake_ids laid out afresh
+        self.eliminated = {}  # snake_id -> (eliminated_by, score)
+        self.left = {}        # Ordered set of snake_ids taken away for good
+    
+    def move_head(self, snake_id, position):
+        # A snake spawned since the last drain goes out whole
+        if snake_id not in self.spawned:
+            self.moves.setdefault(snake_id, [[], 0])[0].append(position)
+    
+    def move_tail(self, snake_id):
+        if snake_id not in self.spawned:
+            self.moves.setdefault(snake_id, [[], 0])[1] += 1
+    
+    def spawn_snake(self, snake_id):
+        self.moves.pop(snake_id, None)
+        self.spawned[snake_id] = None
+    
+    def eliminate(self, snake_id, eliminated_by, score):
+        self.moves.pop(snake_id, None)
+        self.spawned.pop(snake_id, None)
+        self.eliminated[snake_id] = (eliminated_by, score)
+    
+    def remove_snake(self, snake_id):
+        self.moves.pop(snake_id, None)
+        self.spawned.pop(snake_id, None)
+        self.eliminated.pop(snake_id, None)
+        self.left[snake_id] = None
+
+
+class SnakeArena(MultiplayerSnakeGame):
+    __slots__ = ('snakes', 'free_ids', 'eliminations', 'generation')
+    
+    def __init__(self, grid_width=20, grid_height=20, track_changes=False, seed=None):
+        """
+        Several snakes and the fruits on one board (the fruit rules are MultiplayerSnakeGame's).
+        
+        The game's own snake stays empty; snakes are added with add_snake()
+        and steered with steer(). The arena never ends: eliminated snakes
+        wait off the board until respawn().
+        
+        Args:
+            grid_width: Number of tiles horizontally
+            grid_height: Number of tiles vertically
+            track_changes: Record an ArenaChangeLog for delta broadcasts
+            seed: Seed for the game's own random generator
+        """
+        super().__init__(grid_width, grid_height, track_changes, seed)
+        if track_changes:
+            self.changes = ArenaChangeLog()
+            self.changes.require_keyframe()
+        self.snakes = {}  # snake_id -> ArenaSnake
+        # Numbers of snakes not in the arena, lowest last
+        self.free_ids = list(range(MAX_SNAKES, 0, -1))
+        # (snake_id, eliminated_by, score, length) of snakes eliminated since the room last took them
+        self.eliminations = []
+        # Bumped whenever a body changes, to key the fruit bots' distance field
+        self.generation = 0
+    
+    def spawn_snake(self):
+        # Arenas have no snake of their own; the core's body stays empty
+        self.direction = Direction.RIGHT
+        self.turns.clear()
+    
+    def add_snake(self):
+        """Spawn a new snake. Returns its snake_id, or None if the arena has no room for it."""
+        if not self.free_ids:
+            return None
+        spawn = self.find_spawn()
+        if spawn is None:
+            return None
+        snake_id = self.free_ids.pop()
+        snake = self.snakes[snake_id] = ArenaSnake(
+            snake_id, SnakeBody(self.grid_width, self.grid_width * self.grid_height))
+        self.lay(snake, *spawn)
+        return snake_id
+    
+    def respawn(self, snake_id):
+        """Bring an eliminated snake back with a fresh body and score. Returns True if it is back."""
+        snake = self.snakes.get(snake_id)
+        if snake is None or snake.alive:
+            return False
+        spawn = self.find_spawn()
+        if spawn is None:
+            return False
+        self.lay(snake, *spawn)
+        return True
+    
+    def remove_snake(self, snake_id):
+        """Take a snake out of the arena for good (its host left)."""
+        snake = self.snakes.pop(snake_id, None)
+        if snake is None:
+            return
+        if snake.alive:
+            self.clear_body(snake)
+        self.free_ids.append(snake_id)
+        if self.changes is not None:
+            self.changes.remove_snake(snake_id)
+    
+    def steer(self, snake_id, direction_str, seq=None):
+        """Queue a turn for one snake (see SnakeCore.set_direction). Returns True if it was queued."""
+        snake = self.snakes.get(snake_id)
+        return snake is not None and queue_turn(snake, direction_str, seq)
+    
+    def find_spawn(self):
+        """
+        Room for a three-segment snake: a straight line of empty tiles with a
+        free tile ahead of the head. Returns (segments head first, direction),
+        or None if a few random tries find nothing.
+        """
+        occupancy = self.occupancy
+        for _ in range(SPAWN_ATTEMPTS):
+            head = occupancy.random_empty(self.rng)
+            if head is None:
+                return None
+            x, y = head
+            for direction in Direction:
+                dx, dy = direction.value
+                segments = [(x - i * dx, y - i * dy) for i in range(3)]
+                ahead = (x + dx, y + dy)
+                if all(occupancy.in_bounds(p) and not occupancy.is_snake(p) and not occupancy.has_fruit(p)
+                       for p in segments) and occupancy.in_bounds(ahead) and not occupancy.is_snake(ahead):
+                    return segments, direction
+        return None
+    
+    def lay(self, snake, segments, direction):
+        """Put a snake on the board with the given segments (head first), alive and scoreless."""
+        body = snake.body
+        body.clear()
+        for segment in reversed(segments):
+            body.push_head(self.occupancy.index(segment))
+            self.occupancy.add_snake(segment, snake.snake_id)
+        snake.direction = direction
+        # Queued turns still count as handled when a respawn drops them
+        if snake.turns and snake.turns[-1][1] is not None:
+            snake.input_ack = snake.turns[-1][1]
+        snake.turns.clear()
+        snake.score = 0
+        snake.alive = True
+        snake.eliminated_by = None
+        self.generation += 1
+        if self.changes is not None:
+            self.changes.spawn_snake(snake.snake_id)
+    
+    def clear_body(self, snake):
+        """Take every segment of a snake off the board."""
+        occupancy = self.occupancy
+        for position in snake.body:
+            occupancy.remove_snake(position)
+        snake.body.clear()
+        self.generation += 1
+        if self.unplaced_fruits:
+            self.place_unplaced_fruits()
+    
+    def eliminate(self, snake, eliminated_by, length):
+        self.eliminations.append((snake.snake_id, eliminated_by, snake.score, length))
+        self.clear_body(snake)
+        snake.alive = False
+        snake.eliminated_by = eliminated_by
+        if self.changes is not None:
+            self.changes.eliminate(snake.snake_id, eliminated_by, snake.score)
+    
+    def update(self):
+        """Move every snake one step at once and resolve what they run into (see the module docstring)."""
+        occupancy = self.occupancy
+        changes = self.changes
+        moving = []  # (snake, new head, length before the move)
+        arrivals = {}  # new head -> snakes moving onto it
+        contested = []  # new heads more than one snake moves onto
+        eliminated = []  # (snake, eliminated_by, length)
+        for snake in self.snakes.values():
+            if not snake.alive:
+                continue
+            take_turn(snake)
+            dx, dy = snake.direction.value
+            x, y = snake.body[0]
+            head = (x + dx, y + dy)
+            length = len(snake.body)
+            if not occupancy.in_bounds(head):
+                eliminated.append((snake, None, length))
+                continue
+            moving.append((snake, head, length))
+            contenders = arrivals.get(head)
+            if contenders is None:
+                arrivals[head] = [snake]
+            else:
+                if len(contenders) == 1:
+                    contested.append(head)
+                contenders.append(snake)
+        if not moving and not eliminated:
+            return
+        self.generation += 1
+        
+        # Heads meeting on a tile: the longest snake takes it, equal lengths all lose
+        for head in contested:
+            contenders = arrivals[head]
+            longest = max(len(snake.body) for snake in contenders)
+            winners = [snake for snake in contenders if len(snake.body) == longest]
+            winner = winners[0] if len(winners) == 1 else None
+            for snake in contenders:
+                if snake is not winner:
+                    eliminated.append((snake, winner.snake_id if winner else None, len(snake.body)))
+        out = {entry[0] for entry in eliminated}
+        
+        # Tails move out first, except for snakes about to eat
+        fruit_owners = self.fruit_owners
+        for snake, head, _ in moving:
+            if snake in out or head not in fruit_owners:
+                occupancy.remove_snake(occupancy.position(snake.body.pop_tail()))
+                if changes is not None:
+                    changes.move_tail(snake.snake_id)
+        
+        # Heads on whatever snake cells are left
+        for snake, head, length in moving:
+            if snake not in out:
+                owner = occupancy.snake_owner(head)
+                if owner:
+                    eliminated.append((snake, owner, length))
+                    out.add(snake)
+        
+        # Survivors move in and eat; eaten fruits respawn once every head is in
+        eaten_fruits = []
+        for snake, head, _ in moving:
+            if snake in out:
+                continue
+            snake.body.push_head(occupancy.index(head))
+            occupancy.add_snake(head, snake.snake_id)
+            if changes is not None:
+                changes.move_head(snake.snake_id, head)
+            owners = fruit_owners.get(head)
+            if owners:
+                snake.score += 10 * len(owners)
+                eaten_fruits += owners
+        for player_id in eaten_fruits:
+            self.clear_fruit(player_id)
+        for player_id in eaten_fruits:
+            self.place_fruit(player_id, self.generate_fruit_position())
+        
+        for snake, eliminated_by, length in eliminated:
+            self.eliminate(snake, eliminated_by, length)
+        if self.unplaced_fruits:
+            self.place_unplaced_fruits()
+    
+    def enable_bots(self, radius=ARENA_FIELD_RADIUS, seed=None):
+        return super().enable_bots(radius, seed)
+    
+    def threats(self):
+        heads = [snake.body.cells[snake.body.head] for snake in self.snakes.values() if snake.alive]
+        return heads, self.generation
+    
+    def get_game_state(self):
+        """Get the current arena state as a dictionary."""
+        return {
+            'snakes': [snake.state() for snake in self.snakes.values()],
+            'fruits': {pid: pos for pid, pos in self.fruits.items()},
+            'grid_width': self.grid_width,
+            'grid_height': self.grid_height
+        }
+    
+    def snapshot_extra(self):
+        # Bodies roll back through their own undo journals, like the core's snake
+        snakes = []
+        for snake in self.snakes.values():
+            body = snake.body
+            if body.journal is None:
+                body.journal = []
+            snakes.append((snake, len(body.journal), body.head, body.length, snake.direction, tuple(snake.turns),
+                           snake.input_ack, snake.score, snake.alive, snake.eliminated_by))
+        return super().snapshot_extra(), snakes, tuple(self.free_ids), tuple(self.eliminations)
+    
+    def restore_extra(self, extra):
+        fruits, snakes, free_ids, eliminations = extra
+        self.snakes = {}
+        for (snake, body_mark, head, length, snake.direction, turns,
+             snake.input_ack, snake.score, snake.alive, snake.eliminated_by) in snakes:
+            snake.body.undo(body_mark)
+            snake.body.head = head
+            snake.body.length = length
+            snake.turns = list(turns)
+            self.snakes[snake.snake_id] = snake
+        self.free_ids = list(free_ids)
+        self.eliminations = list(eliminations)
+        # Every body may have changed; a new generation also keeps the bots off their old field
+        self.generation += 1
+        super().restore_extra(fruits)
+    
+    def release_snapshots(self):
+        super().release_snapshots()
+        for snake in self.snakes.values():
+            snake.body.journal = None
+    
+    def clone_extra(self, clone):
+        super().clone_extra(clone)
+        clone.snakes = {snake_id: snake.copy() for snake_id, snake in self.snakes.items()}
+        clone.free_ids = list(self.free_ids)
+        clone.eliminations = []
+        clone.generation = self.generation
+
+
+class ArenaDeltaStream(DeltaStream):
+    def __init__(self, game, keyframe_interval=KEYFRAME_INTERVAL):
+        """
+        Sequence-numbered diffs of an arena ('arena_delta') with periodic keyframes ('arena_state').
+        
+        Args:
+            game: SnakeArena created with track_changes=True
+            keyframe_interval: Sequence numbers between forced keyframes
+        """
+        super().__init__(game, keyframe_interval)
+        self.moves = {}
+        self.spawned = []
+        self.eliminated = {}
+        self.left = []
+    
+    def advance(self):
+        changes = self.game.changes
+        self.moves = changes.moves
+        self.spawned = list(changes.spawned)
+        self.eliminated = changes.eliminated
+        self.left = list(changes.left)
+        return super().advance()
+    
+    def delta(self):
+        """
+        Diff message from the previous sequence number to the current one.
+        
+        Clients apply 'left', 'eliminated' ([snake_id, eliminated_by, score])
+        and 'spawned' (whole snakes) first, then 'moves': one entry
+        [snake_id, new heads oldest first, tail cells removed, score, input ack]
+        per snake that moved, so a frame grows with the number of snakes,
+        not their length.
+        """
+        snakes = self.game.snakes
+        message = {'type': 'arena_delta', 'seq': self.seq}
+        if self.left:
+            message['left'] = self.left
+        if self.eliminated:
+            message['eliminated'] = [[snake_id, eliminated_by, score]
+                                     for snake_id, (eliminated_by, score) in self.eliminated.items()]
+        if self.spawned:
+            message['spawned'] = [snakes[snake_id].state() for snake_id in self.spawned]
+        if self.moves:
+            message['moves'] = [[snake_id, pushed, popped, snakes[snake_id].score, snakes[snake_id].input_ack]
+                                for snake_id, (pushed, popped) in self.moves.items()]
+        if self.fruits:
+            message['fruits'] = self.fruits
+        if self.removed:
+            message['removed'] = self.removed
+        return message
+    
+    def keyframe(self):
+        """Full arena state at the current sequence number."""
+        return {
+            'type': 'arena_state',
+            'seq': self.seq,
+            **self.game.get_game_state()
+        }
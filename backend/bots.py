@@ -0,0 +1,159 @@
+import random
+import time
+from array import array
+
+# Steps (in BFS moves from the head) the shared distance field reaches; the
+# field costs at most about 2 * FIELD_RADIUS ** 2 cells per tick whatever the board size
+FIELD_RADIUS = 24
+
+# Neighbouring tiles a bot may step to
+STEPS = ((0, -1), (0, 1), (-1, 0), (1, 0))
+
+
+class DistanceField:
+    def __init__(self, grid_width, grid_height, radius=FIELD_RADIUS):
+        """
+        BFS distances from the nearest snake head around the bodies, shared by every bot.
+        
+        Only cells within radius steps are searched, and only the cells the
+        last search reached are cleared before the next one, so a search costs
+        O(radius^2) per head regardless of the board. Searches are keyed by
+        the game (see MultiplayerSnakeGame.threats); until the key changes
+        (moves between ticks, a hibernating or finished game) the last field
+        is reused as it is.
+        
+        Args:
+            grid_width: Number of tiles horizontally
+            grid_height: Number of tiles vertically
+            radius: Deepest BFS level searched; farther cells read as unreached (-1)
+        """
+        self.width = grid_width
+        self.height = grid_height
+        self.radius = radius
+        self.dist = array('i', [-1]) * (grid_width * grid_height)
+        self.reached = []
+        self.key = None
+        self.searches = 0
+    
+    def compute(self, occupancy, heads, key):
+        """Search from every head (cell indices) at once unless key matches the last search."""
+        if key == self.key:
+            return
+        dist = self.dist
+        for cell in self.reached:
+            dist[cell] = -1
+        width = self.width
+        last_row = width * (self.height - 1)
+        blocked = occupancy.snake
+        for head in heads:
+            dist[head] = 0
+        reached = list(heads)
+        frontier = list(heads)
+        depth = 0
+        while frontier and depth < self.radius:
+            depth += 1
+            next_frontier = []
+            for cell in frontier:
+                x = cell % width
+                if x > 0 and dist[cell - 1] < 0 and not blocked[cell - 1]:
+                    dist[cell - 1] = depth
+                    next_frontier.append(cell - 1)
+                if x < width - 1 and dist[cell + 1] < 0 and not blocked[cell + 1]:
+                    dist[cell + 1] = depth
+                    next_frontier.append(cell + 1)
+                if cell >= width and dist[cell - width] < 0 and not blocked[cell - width]:
+                    dist[cell - width] = depth
+                    next_frontier.append(cell - width)
+                if cell < last_row and dist[cell + width] < 0 and not blocked[cell + width]:
+                    dist[cell + width] = depth
+                    next_frontier.append(cell + width)
+            reached += next_frontier
+            frontier = next_frontier
+        self.reached = reached
+        self.key = key
+        self.searches += 1
+
+
+def evade(field, occupancy, position, rng):
+    """
+    Step to the neighbouring tile (or stay) that is farthest from the head.
+    
+    Tiles the field didn't reach are too far away or walled off by the body,
+    which is as safe as it gets. Bots standing on such a tile stay put.
+    Returns the new position, or None to stay.
+    """
+    dist = field.dist
+    width = field.width
+    x, y = position
+    best = dist[y * width + x]
+    if best < 0:
+        return None
+    choices = [position]
+    for dx, dy in STEPS:
+        nx = x + dx
+        ny = y + dy
+        if 0 <= nx < width and 0 <= ny < field.height:
+            cell = ny * width + nx
+            if occupancy.snake[cell]:
+                continue
+            value = dist[cell]
+            if value < 0:
+                value = field.radius + 1
+            if value > best:
+                best = value
+                choices = [(nx, ny)]
+            elif value == best:
+                choices.append((nx, ny))
+    return choices[0] if len(choices) == 1 else rng.choice(choices)
+
+
+class FruitBots:
+    def __init__(self, grid_width, grid_height, radius=FIELD_RADIUS, seed=None):
+        """
+        Server-controlled fruits of one game, all steered by one shared distance field.
+        
+        Each bot has a policy: a function (field, occupancy, position, rng)
+        returning the tile to move to, or None to stay. Bots move at most
+        once per tick, so a tick pays for one field search plus a few table
+        lookups per bot.
+        
+        Args:
+            grid_width: Number of tiles horizontally
+            grid_height: Number of tiles vertically
+            radius: Reach of the distance field
+            seed: Seed for the bots' tie-breaking (separate from the game's generator)
+        """
+        self.field = DistanceField(grid_width, grid_height, radius)
+        self.policies = {}  # player_id -> policy
+        self.rng = random.Random(seed)
+        # Seconds the last move() took, for benchmarks and metrics
+        self.last_duration = 0.0
+    
+    def __len__(self):
+        return len(self.policies)
+    
+    def add(self, player_id, policy=evade):
+        self.policies[player_id] = policy
+    
+    def remove(self, player_id):
+        self.policies.pop(player_id, None)
+    
+    def move(self, game):
+        """Move every placed bot one step. Returns the moves made as [(player_id, x, y)]."""
+        start = time.perf_counter()
+        moves = []
+        heads, key = game.threats()
+        if self.policies and heads:
+            occupancy = game.occupancy
+            self.field.compute(occupancy, heads, key)
+            fruits = game.fruits
+            for player_id, policy in self.policies.items():
+                position = fruits.get(player_id)
+                if position is None:
+                    continue
+                target = policy(self.field, occupancy, position, self.rng)
+                if target is not None and target != position and \
+                        game.update_fruit_position(player_id, target[0], target[1]):
+                    moves.append((player_id, target[0], target[1]))
+        self.last_duration = time.perf_counter() - start
+        return moves
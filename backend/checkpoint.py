@@ -0,0 +1,105 @@
+"""
+Checkpoints of every room on a server, for restarts that don't end matches.
+
+A checkpoint holds a headless clone of each room's game (see SnakeCore.clone)
+plus what the room needs to take its players back: their resume tokens,
+binary handles and where its replay log had got to. Rooms are cloned on the
+event loop, which only copies a few board-sized arrays; pickling, compressing
+and writing the file happen on a background thread.
+
+Checkpoints are pickles, so only load files this server wrote.
+"""
+import os
+import pickle
+import queue
+import threading
+import zlib
+
+CHECKPOINT_VERSION = 1
+CHECKPOINT_FILE = 'rooms.ckpt'
+# Seconds between periodic checkpoints
+CHECKPOINT_INTERVAL = 5
+# Seconds a restored room holds its players' fruits and its host slot for them to come back
+RESUME_TIMEOUT = 30
+# Environment variable through which a restarting server passes on its listening socket
+LISTEN_FD_ENV = 'SNAKE_LISTEN_FD'
+
+
+def checkpoint_path(directory):
+    return os.path.join(directory, CHECKPOINT_FILE)
+
+
+def write_checkpoint(path, rooms):
+    """Write a checkpoint atomically: readers see the previous file or the new one, never half of one."""
+    data = zlib.compress(pickle.dumps((CHECKPOINT_VERSION, rooms), pickle.HIGHEST_PROTOCOL), 1)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as checkpoint:
+        checkpoint.write(data)
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+    os.replace(temporary, path)
+
+
+def read_checkpoint(path):
+    """Room states from a checkpoint file, or None if there is no usable one."""
+    try:
+        with open(path, 'rb') as checkpoint:
+            version, rooms = pickle.loads(zlib.decompress(checkpoint.read()))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, zlib.error, pickle.UnpicklingError, EOFError) as e:
+        print(f"Ignoring unreadable checkpoint {path}: {e}")
+        return None
+    if version != CHECKPOINT_VERSION:
+        print(f"Ignoring version {version} checkpoint {path}")
+        return None
+    return rooms
+
+
+class CheckpointWriter:
+    def __init__(self):
+        """
+        Background thread that writes checkpoints.
+        
+        Only the newest checkpoint matters, so when the thread falls behind
+        it skips straight to the latest one queued.
+        """
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+    
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='checkpoint-writer', daemon=True)
+            self.thread.start()
+    
+    def write(self, path, rooms):
+        """Queue room states (from Room.checkpoint) to be written to path."""
+        self.start()
+        self.queue.put((path, rooms))
+    
+    def stop(self):
+        """Write out the last checkpoint queued and stop the thread."""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+    
+    def run(self):
+        while True:
+            item = self.queue.get()
+            stopping = item is None
+            # Skip to the newest checkpoint queued
+            while not self.queue.empty():
+                newer = self.queue.get()
+                if newer is None:
+                    stopping = True
+                else:
+                    item = newer
+            if item is not None:
+                path, rooms = item
+                try:
+                    write_checkpoint(path, rooms)
+                except OSError as e:
+                    print(f"Checkpoint {path} write failed: {e}")
+            if stopping:
+                break
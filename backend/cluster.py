@@ -0,0 +1,464 @@
+"""
+Run the game server on every core: worker processes behind one gateway.
+
+Each worker is a server.py process taking clients on its own unix socket.
+The gateway listens on localhost:8765, reads a client's handshake and first
+message to learn its room, then connects it to the worker that owns the
+room on a consistent-hash ring (see sharding.py) and from there on only
+copies bytes both ways. Workers report their load to the gateway over a
+control socket; GET /status on the gateway port shows it.
+
+SIGUSR1 adds a worker. The rooms the ring gives it are checkpointed by their
+old workers, whose clients are closed with CLOSE_SERVICE_RESTART, restored
+by the new worker, and resumed there when the clients reconnect. Workers
+that exit are started again under the same id, so they keep their rooms.
+
+Usage: python cluster.py [--workers N] [server.py options...]
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import signal
+import sys
+import tempfile
+import time
+
+from server import CLOSE_SERVICE_RESTART, DEFAULT_ROOM
+from sharding import HashRing, read_message, send_message
+
+# Seconds a client has to send its handshake and first message
+HANDSHAKE_TIMEOUT = 10
+# Largest first message read to route a client
+MAX_FIRST_MESSAGE = 64 * 1024
+# Bytes copied at a time between a client and its worker
+PIPE_CHUNK = 256 * 1024
+# Seconds rooms have to change hands when a worker is added before routing moves on without them
+MIGRATION_TIMEOUT = 5
+# Seconds before a worker that exited is started again
+RESPAWN_DELAY = 1
+# Seconds workers get to shut down before they are killed
+STOP_TIMEOUT = 5
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+
+
+def websocket_key(request):
+    """Sec-WebSocket-Key of an HTTP upgrade request, or None if it isn't a WebSocket handshake."""
+    headers = {}
+    for line in request.decode('latin-1').split('\r\n')[1:]:
+        name, separator, value = line.partition(':')
+        if separator:
+            headers[name.strip().lower()] = value.strip()
+    if headers.get('upgrade', '').lower() != 'websocket':
+        return None
+    return headers.get('sec-websocket-key')
+
+
+def accept_response(key):
+    accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+    return (f'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {accept}\r\n\r\n').encode()
+
+
+def http_response(status, body=b'', content_type='text/plain'):
+    return (f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n'
+            f'Connection: close\r\n\r\n').encode() + body
+
+
+def close_frame(code, reason):
+    """Unmasked (server) close frame."""
+    payload = code.to_bytes(2, 'big') + reason.encode()
+    return bytes((0x80 | OPCODE_CLOSE, len(payload))) + payload
+
+
+async def read_first_frame(reader):
+    """
+    The client's first WebSocket frame, as received and unmasked.
+    
+    Returns (frame, payload), or None if it isn't a whole data message of
+    at most MAX_FIRST_MESSAGE bytes (the handshake message always is).
+    """
+    head = await reader.readexactly(2)
+    frame = bytearray(head)
+    length = head[1] & 0x7F
+    if length >= 126:
+        extended = await reader.readexactly(2 if length == 126 else 8)
+        frame += extended
+        length = int.from_bytes(extended, 'big')
+    if not head[0] & 0x80 or head[0] & 0x0F not in (OPCODE_TEXT, OPCODE_BINARY) or not head[1] & 0x80 \
+            or length > MAX_FIRST_MESSAGE:
+        return None
+    mask = await reader.readexactly(4)
+    data = await reader.readexactly(length)
+    frame += mask + data
+    payload = bytes(byte ^ mask[index % 4] for index, byte in enumerate(data))
+    return bytes(frame), payload
+
+
+def room_of(payload):
+    """Room a client's first message asks for; the worker checks it properly."""
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return ''
+    room_id = data.get('room', DEFAULT_ROOM) if isinstance(data, dict) else None
+    return room_id if isinstance(room_id, str) else ''
+
+
+async def open_upstream(path):
+    """WebSocket connection to a worker, left for the client's own frames to go through."""
+    reader, writer = await asyncio.open_unix_connection(path, limit=PIPE_CHUNK)
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write((f'GET / HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                  f'Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n').encode())
+    try:
+        response = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), HANDSHAKE_TIMEOUT)
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+        response = b''
+    if not response.startswith(b'HTTP/1.1 101'):
+        writer.close()
+        raise ConnectionError(f'worker at {path} refused the connection')
+    return reader, writer
+
+
+async def pipe(reader, writer):
+    """Copy bytes until either side closes."""
+    try:
+        while True:
+            data = await reader.read(PIPE_CHUNK)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+
+
+class Worker:
+    def __init__(self, worker_id, client_path):
+        """
+        The gateway's view of one worker process.
+        
+        Args:
+            worker_id: Id of the worker on the ring
+            client_path: Unix socket the worker takes clients on
+        """
+        self.worker_id = worker_id
+        self.client_path = client_path
+        self.process = None
+        self.writer = None  # control connection; None while the worker is down
+        self.pid = None
+        # From the worker's last load report
+        self.rooms = 0
+        self.active_rooms = 0
+        self.connections = 0
+        self.reported = None
+    
+    def status(self, now):
+        return {
+            'worker': self.worker_id,
+            'pid': self.pid,
+            'up': self.writer is not None,
+            'rooms': self.rooms,
+            'active_rooms': self.active_rooms,
+            'connections': self.connections,
+            'report_age': round(now - self.reported, 1) if self.reported is not None else None
+        }
+
+
+class Gateway:
+    def __init__(self, socket_dir, server_args, checkpoint_dir=None, metrics_port=None):
+        """
+        Routes clients to workers and starts, restarts and adds the workers.
+        
+        Args:
+            socket_dir: Private directory for the control and worker sockets
+            server_args: Options every worker's server.py is started with
+            checkpoint_dir: Directory under which each worker checkpoints its rooms (None to not)
+            metrics_port: Port of worker 0's metrics endpoint; worker N serves on the Nth port after it
+        """
+        self.socket_dir = socket_dir
+        self.control_path = os.path.join(socket_dir, 'control.sock')
+        self.server_args = server_args
+        self.checkpoint_dir = checkpoint_dir
+        self.metrics_port = metrics_port
+        self.workers = {}  # worker id -> Worker
+        self.ring = HashRing()
+        # While a new worker's rooms change hands: the ring being moved to, and when the move is done
+        self.next_ring = None
+        self.migrated = None
+        self.migration_handle = None
+        self.awaiting_release = set()  # workers yet to hand their rooms over
+        self.moving = set()  # rooms handed over but not restored yet
+        self.joining = []  # workers up and waiting for the ring, one migration at a time
+        # Rooms kept off their ring owner (arenas can't move): room_id -> worker id
+        self.kept = {}
+        # Rooms handed over to workers that were down at the time: worker id -> states
+        self.undelivered = {}
+        self.connections = 0
+        # Client handlers and their writers, to close on stop
+        self.clients = {}
+        self.stopping = False
+    
+    async def start(self, workers):
+        """Listen for workers, start the first ones and wait for them to come up."""
+        self.control_server = await asyncio.start_unix_server(self.handle_worker, self.control_path)
+        # The first workers are on the ring from the start: rooms only move when workers are added
+        self.ring = HashRing(range(workers))
+        for worker_id in range(workers):
+            self.spawn(worker_id)
+    
+    def add_worker(self):
+        """Start one more worker; it joins the ring once it is up."""
+        self.spawn(max(self.workers, default=-1) + 1)
+    
+    def spawn(self, worker_id):
+        worker = self.workers.get(worker_id)
+        if worker is None:
+            client_path = os.path.join(self.socket_dir, f'worker-{worker_id}.sock')
+            worker = self.workers[worker_id] = Worker(worker_id, client_path)
+        asyncio.create_task(self.run_worker(worker))
+    
+    async def run_worker(self, worker):
+        """Keep a worker process running until the gateway stops."""
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+        while not self.stopping:
+            args = [sys.executable, script] + self.server_args + [
+                '--worker', str(worker.worker_id), '--unix-socket', worker.client_path, '--gateway', self.control_path]
+            if self.checkpoint_dir:
+                args += ['--checkpoint-dir', os.path.join(self.checkpoint_dir, f'worker-{worker.worker_id}')]
+            if self.metrics_port:
+                args += ['--metrics-port', str(self.metrics_port + worker.worker_id)]
+            worker.process = await asyncio.create_subprocess_exec(*args)
+            code = await worker.process.wait()
+            if self.stopping:
+                break
+            print(f"Worker {worker.worker_id} exited with code {code}, starting it again")
+            await asyncio.sleep(RESPAWN_DELAY)
+    
+    async def stop(self):
+        """Close the control connections (workers exit with them) and wait for the workers."""
+        self.stopping = True
+        self.control_server.close()
+        for writer in self.clients.values():
+            writer.close()
+        if self.clients:
+            await asyncio.wait(list(self.clients), timeout=STOP_TIMEOUT)
+        for worker in self.workers.values():
+            if worker.writer:
+                worker.writer.close()
+        processes = [worker.process for worker in self.workers.values()
+                     if worker.process and worker.process.returncode is None]
+        if processes:
+            await asyncio.wait([asyncio.ensure_future(process.wait()) for process in processes],
+                               timeout=STOP_TIMEOUT)
+            for process in processes:
+                if process.returncode is None:
+                    process.kill()
+    
+    async def handle_worker(self, reader, writer):
+        """Control connection of one worker: its hello, load reports and room handovers."""
+        hello = await read_message(reader)
+        worker = self.workers.get(hello['worker']) if hello else None
+        if worker is None:
+            writer.close()
+            return
+        worker.writer = writer
+        worker.pid = hello['pid']
+        # A restarted worker comes back without its kept rooms
+        for room_id in [room_id for room_id, worker_id in self.kept.items() if worker_id == worker.worker_id]:
+            del self.kept[room_id]
+        print(f"Worker {worker.worker_id} up (pid {worker.pid})")
+        if worker.worker_id in self.ring:
+            # Rooms it restored that the ring now gives to others are handed over
+            self.send_ring(worker, self.next_ring or self.ring)
+            states = self.undelivered.pop(worker.worker_id, None)
+            if states:
+                send_message(writer, {'type': 'adopt', 'rooms': states})
+        else:
+            self.joining.append(worker)
+            self.start_migration()
+        
+        try:
+            while True:
+                message = await read_message(reader)
+                if message is None:
+                    break
+                kind = message['type']
+                if kind == 'load':
+                    worker.rooms = message['rooms']
+                    worker.active_rooms = message['active_rooms']
+                    worker.connections = message['connections']
+                    worker.reported = time.monotonic()
+                    for room_id in message['gone']:
+                        if self.kept.get(room_id) == worker.worker_id:
+                            del self.kept[room_id]
+                elif kind == 'released':
+                    self.released(worker, message['rooms'], message['kept'])
+                elif kind == 'adopted':
+                    self.moving.difference_update(message['rooms'])
+                    self.check_migration()
+        finally:
+            worker.writer = None
+            writer.close()
+            if not self.stopping:
+                print(f"Worker {worker.worker_id} down")
+            self.awaiting_release.discard(worker.worker_id)
+            self.check_migration()
+    
+    def send_ring(self, worker, ring):
+        send_message(worker.writer, {'type': 'ring', 'workers': ring.workers})
+    
+    def start_migration(self):
+        """Put the next joining worker on the ring: every worker hands over the rooms it gives the newcomer."""
+        if self.next_ring is not None or not self.joining:
+            return
+        worker = self.joining.pop(0)
+        self.next_ring = self.ring.with_worker(worker.worker_id)
+        self.migrated = asyncio.Event()
+        self.awaiting_release = set()
+        for other in self.workers.values():
+            if other.writer is not None and other.worker_id in self.next_ring:
+                self.awaiting_release.add(other.worker_id)
+                self.send_ring(other, self.next_ring)
+        self.migration_handle = asyncio.get_running_loop().call_later(MIGRATION_TIMEOUT, self.finish_migration)
+        print(f"Worker {worker.worker_id} joining the ring")
+    
+    def released(self, worker, states, kept):
+        """Pass rooms a worker handed over on to their owners on the ring."""
+        for room_id in kept:
+            self.kept[room_id] = worker.worker_id
+        ring = self.next_ring or self.ring
+        adoptions = {}
+        for state in states:
+            adoptions.setdefault(ring.owner(state['room_id']), []).append(state)
+        for owner, rooms in adoptions.items():
+            target = self.workers[owner]
+            if target.writer is None:
+                self.undelivered.setdefault(owner, []).extend(rooms)
+                continue
+            self.moving.update(state['room_id'] for state in rooms)
+            send_message(target.writer, {'type': 'adopt', 'rooms': rooms})
+        self.awaiting_release.discard(worker.worker_id)
+        self.check_migration()
+    
+    def check_migration(self):
+        if self.next_ring is not None and not self.awaiting_release and not self.moving:
+            self.finish_migration()
+    
+    def finish_migration(self):
+        """Route by the new ring (on time or not) and let held connections through."""
+        if self.next_ring is None:
+            return
+        self.migration_handle.cancel()
+        self.ring = self.next_ring
+        self.next_ring = None
+        self.awaiting_release = set()
+        self.moving = set()
+        self.migrated.set()
+        for room_id in [room_id for room_id, worker_id in self.kept.items() if self.ring.owner(room_id) == worker_id]:
+            del self.kept[room_id]
+        print(f"Ring now has {len(self.ring.workers)} workers")
+        self.start_migration()
+    
+    async def route(self, room_id):
+        """Worker a room's clients go to; rooms changing hands wait until they have."""
+        while self.next_ring is not None and self.next_ring.owner(room_id) != self.ring.owner(room_id):
+            await self.migrated.wait()
+        worker_id = self.kept.get(room_id)
+        if worker_id is None:
+            worker_id = self.ring.owner(room_id)
+        return self.workers[worker_id]
+    
+    def status(self):
+        now = time.monotonic()
+        return {
+            'connections': self.connections,
+            'ring': self.ring.workers,
+            'migrating': self.next_ring is not None,
+            'kept_rooms': len(self.kept),
+            'workers': [worker.status(now) for worker in self.workers.values()]
+        }
+    
+    async def handle_client(self, reader, writer):
+        """Route one client by its first message, then copy bytes between it and its worker."""
+        upstream = None
+        self.clients[asyncio.current_task()] = writer
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), HANDSHAKE_TIMEOUT)
+            key = websocket_key(request)
+            if key is None:
+                if request.startswith(b'GET /status '):
+                    writer.write(http_response('200 OK', json.dumps(self.status()).encode(), 'application/json'))
+                else:
+                    writer.write(http_response('426 Upgrade Required', b'WebSocket only\n'))
+                return
+            writer.write(accept_response(key))
+            first = await asyncio.wait_for(read_first_frame(reader), HANDSHAKE_TIMEOUT)
+            if first is None:
+                writer.write(close_frame(1002, 'Expected a handshake message'))
+                return
+            frame, payload = first
+            worker = await self.route(room_of(payload))
+            try:
+                upstream_reader, upstream = await open_upstream(worker.client_path)
+            except OSError:
+                # The worker is starting again; clients with a resume token come back shortly
+                writer.write(close_frame(CLOSE_SERVICE_RESTART, 'Server restarting'))
+                return
+            upstream.write(frame)
+            self.connections += 1
+            try:
+                copies = [asyncio.create_task(pipe(reader, upstream)),
+                          asyncio.create_task(pipe(upstream_reader, writer))]
+                await asyncio.wait(copies, return_when=asyncio.FIRST_COMPLETED)
+                for copy in copies:
+                    copy.cancel()
+            finally:
+                self.connections -= 1
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            del self.clients[asyncio.current_task()]
+            if upstream:
+                upstream.close()
+            writer.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description='Run snake game server workers behind one gateway on localhost:8765',
+        epilog='Other options are passed on to every worker (see server.py --help).')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes to start with')
+    parser.add_argument('--checkpoint-dir', help='checkpoint each worker\'s rooms to a subdirectory of this one')
+    parser.add_argument('--metrics-port', type=int, help='serve worker N\'s metrics on localhost:PORT+N')
+    args, server_args = parser.parse_known_args()
+    if '--unix-socket' in server_args:
+        parser.error('workers get their unix sockets from the gateway')
+    if args.checkpoint_dir:
+        os.makedirs(args.checkpoint_dir, exist_ok=True)
+    
+    with tempfile.TemporaryDirectory(prefix='snake-cluster-') as socket_dir:
+        gateway = Gateway(socket_dir, server_args, args.checkpoint_dir, args.metrics_port)
+        await gateway.start(max(1, args.workers))
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGUSR1, gateway.add_worker)
+        loop.add_signal_handler(signal.SIGINT, stop.set)
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+        server = await asyncio.start_server(gateway.handle_client, 'localhost', 8765, limit=PIPE_CHUNK)
+        print(f"Gateway on ws://localhost:8765 for {args.workers} workers (SIGUSR1 adds one)")
+        try:
+            await stop.wait()
+        finally:
+            server.close()
+            await gateway.stop()
+
+if __name__ == '__main__':
+    asyncio.run(main())
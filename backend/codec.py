@@ -0,0 +1,188 @@
+import json
+import struct
+import sys
+from array import array
+from itertools import chain
+
+# Encodings a client can ask for in its initial handshake message
+ENCODING_JSON = 'json'
+ENCODING_BINARY = 'binary'
+ENCODINGS = (ENCODING_JSON, ENCODING_BINARY)
+
+# Binary message headers (first byte of every binary frame)
+MSG_STATE = 0x01
+MSG_DELTA = 0x02
+MSG_GAME_OVER = 0x03
+MSG_VIEW = 0x04
+MSG_DIRECTION = 0x10
+MSG_MOVE = 0x11
+MSG_RESET = 0x12
+MSG_RESYNC = 0x13
+
+FLAG_GAME_OVER = 0x01
+FLAG_RESET = 0x02
+
+DIRECTIONS = ('UP', 'DOWN', 'LEFT', 'RIGHT')
+DIRECTION_CODES = {name: code for code, name in enumerate(DIRECTIONS)}
+
+# Fixed-size parts of the binary messages (little-endian)
+STATE_HEADER = struct.Struct('<BIIBHHII')  # type, seq, score, flags, width, height, snake length, input ack
+DELTA_HEADER = struct.Struct('<BIIBHI')    # type, seq, score, flags, pushed count, input ack
+COUNT = struct.Struct('<H')
+GAME_OVER = struct.Struct('<BI')           # type, score
+VIEW_HEADER = struct.Struct('<BIIBHHHHI') # type, seq, score, flags, view x0, y0, x1, y1, input ack
+DIRECTION = struct.Struct('<BB')           # type, direction code
+DIRECTION_SEQ = struct.Struct('<BBI')      # type, direction code, client input seq
+MOVE = struct.Struct('<BHH')               # type, x, y
+
+
+def pack_u16(values):
+    """Pack an iterable of ints as little-endian u16s."""
+    packed = array('H', values)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+class HandleRegistry:
+    def __init__(self):
+        """Small integer handles standing in for player UUIDs on the binary wire."""
+        self.handles = {}  # player_id -> handle
+        self.free = []
+        self.next_handle = 0
+    
+    def acquire(self, player_id):
+        """Return the player's handle, assigning one if needed."""
+        handle = self.handles.get(player_id)
+        if handle is None:
+            if self.free:
+                handle = self.free.pop()
+            else:
+                handle = self.next_handle
+                self.next_handle += 1
+            self.handles[player_id] = handle
+        return handle
+    
+    def release(self, player_id):
+        """Free the player's handle for reuse."""
+        handle = self.handles.pop(player_id, None)
+        if handle is not None:
+            self.free.append(handle)
+
+
+class JsonCodec:
+    """Text frames with JSON objects (the default)."""
+    
+    name = ENCODING_JSON
+    
+    def encode(self, message):
+        return json.dumps(message)
+
+
+class BinaryCodec:
+    name = ENCODING_BINARY
+    
+    def __init__(self, handles):
+        """
+        Packed binary frames for state, delta, view and game_over messages.
+        
+        Coordinates are u16 pairs and fruits are keyed by u16 player handles.
+        Other messages (registration, errors) are rare and stay JSON text.
+        
+        Args:
+            handles: HandleRegistry of the room the messages describe
+        """
+        self.handles = handles
+    
+    def encode(self, message):
+        msg_type = message.get('type')
+        if msg_type == 'game_state':
+            return self.encode_state(message)
+        if msg_type == 'game_delta':
+            return self.encode_delta(message)
+        if msg_type == 'game_view':
+            return self.encode_view(message)
+        if msg_type == 'game_over':
+            return GAME_OVER.pack(MSG_GAME_OVER, message['score'])
+        return json.dumps(message)
+    
+    def encode_cells(self, cells):
+        return pack_u16(chain.from_iterable(cells))
+    
+    def encode_fruits(self, fruits):
+        acquire = self.handles.acquire
+        packed = pack_u16(chain.from_iterable(
+            (acquire(player_id), x, y) for player_id, (x, y) in fruits.items()
+        ))
+        return COUNT.pack(len(fruits)) + packed
+    
+    def encode_state(self, message):
+        snake = message['snake']
+        return b''.join((
+            STATE_HEADER.pack(MSG_STATE, message.get('seq', 0), message['score'],
+                              FLAG_GAME_OVER if message['game_over'] else 0,
+                              message['grid_width'], message['grid_height'], len(snake),
+                              message.get('ack') or 0),
+            self.encode_cells(snake),
+            self.encode_fruits(message['fruits'])
+        ))
+    
+    def encode_delta(self, message):
+        pushed = message.get('push', ())
+        removed = message.get('removed', ())
+        handles = self.handles.handles
+        removed_handles = [handles[player_id] for player_id in removed if player_id in handles]
+        return b''.join((
+            DELTA_HEADER.pack(MSG_DELTA, message['seq'], message['score'],
+                              FLAG_GAME_OVER if message['game_over'] else 0, len(pushed), message.get('ack') or 0),
+            self.encode_cells(pushed),
+            COUNT.pack(message.get('pop', 0)),
+            self.encode_fruits(message.get('fruits', {})),
+            COUNT.pack(len(removed_handles)),
+            pack_u16(removed_handles)
+        ))
+    
+    def encode_view(self, message):
+        entered = message.get('snake_enter', ())
+        left = message.get('snake_leave', ())
+        handles = self.handles.handles
+        gone_handles = [handles[player_id] for player_id in message.get('fruits_leave', ()) if player_id in handles]
+        flags = (FLAG_GAME_OVER if message['game_over'] else 0) | (FLAG_RESET if message.get('reset') else 0)
+        return b''.join((
+            VIEW_HEADER.pack(MSG_VIEW, message['seq'], message['score'], flags, *message['view'],
+                             message.get('ack') or 0),
+            COUNT.pack(len(entered)),
+            self.encode_cells(entered),
+            COUNT.pack(len(left)),
+            self.encode_cells(left),
+            self.encode_fruits(message.get('fruits', {})),
+            COUNT.pack(len(gone_handles)),
+            pack_u16(gone_handles)
+        ))
+
+
+def decode_message(message):
+    """
+    Decode a client message: text frames are JSON, binary frames use the
+    typed headers above. Raises ValueError for malformed messages.
+    """
+    if isinstance(message, str):
+        return json.loads(message)
+    try:
+        msg_type = message[0]
+        if msg_type == MSG_DIRECTION:
+            if len(message) == DIRECTION_SEQ.size:
+                _, code, seq = DIRECTION_SEQ.unpack(message)
+                return {'type': 'direction', 'direction': DIRECTIONS[code], 'seq': seq}
+            _, code = DIRECTION.unpack(message)
+            return {'type': 'direction', 'direction': DIRECTIONS[code]}
+        if msg_type == MSG_MOVE:
+            _, x, y = MOVE.unpack(message)
+            return {'type': 'move', 'x': x, 'y': y}
+        if msg_type == MSG_RESET:
+            return {'type': 'reset'}
+        if msg_type == MSG_RESYNC:
+            return {'type': 'resync'}
+    except (IndexError, struct.error) as e:
+        raise ValueError(f"Malformed binary message: {e}")
+    raise ValueError(f"Unknown binary message type: {msg_type}")
@@ -0,0 +1,164 @@
+import asyncio
+import time
+from collections import deque
+
+import websockets
+
+from codec import ENCODING_JSON
+from protocol import PROTOCOL_DELTA, PROTOCOL_FULL, PROTOCOL_VIEW
+
+# State frames a connection may have queued before old ones are dropped
+OUTBOUND_QUEUE_SIZE = 8
+# Control messages a connection may have queued; they are never dropped, so a
+# client this far behind is disconnected instead
+CONTROL_QUEUE_SIZE = 256
+# Close code for a client that stopped reading its control messages
+CLOSE_TOO_SLOW = 1008
+
+# Inbound messages per second a client may send, and how many it may burst
+INBOUND_RATE = 20
+INBOUND_BURST = 10
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        """
+        Token-bucket rate limiter.
+        
+        Args:
+            rate: Tokens added per second
+            burst: Maximum number of tokens held
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+    
+    def consume(self):
+        """Take one token if available. Returns False if the caller is over its rate."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class ClientConnection:
+    def __init__(self, websocket, protocol=PROTOCOL_FULL, encoding=ENCODING_JSON,
+                 max_queue=OUTBOUND_QUEUE_SIZE, max_control=CONTROL_QUEUE_SIZE, metrics=None):
+        """
+        A client websocket with its own bounded outbound queue and sender task.
+        
+        Broadcasts only enqueue already-encoded payloads, so a slow or stalled
+        socket never holds up the game loop or the other clients. Only state
+        frames are ever dropped, since the next keyframe makes up for them;
+        control messages are kept, and a client that lets max_control of them
+        pile up is disconnected.
+        
+        Args:
+            websocket: The underlying websocket connection
+            protocol: Protocol mode chosen in the handshake
+            encoding: Wire encoding chosen in the handshake
+            max_queue: Maximum number of queued state frames
+            max_control: Maximum number of queued control messages
+            metrics: GameMetrics to report send latency and rate limiting to, if enabled
+        """
+        self.websocket = websocket
+        self.protocol = protocol
+        self.encoding = encoding
+        self.max_queue = max_queue
+        self.max_control = max_control
+        self.outbound = deque()  # (payload, is_frame, time queued or 0 without metrics)
+        self.metrics = metrics
+        self.queued_frames = 0
+        self.needs_keyframe = True  # Delta clients start from a keyframe
+        # Viewport of a 'view' protocol client, set by the server
+        self.view = None
+        self.closed = False
+        self.closing_task = None
+        self.inbound_limit = TokenBucket(INBOUND_RATE, INBOUND_BURST)
+        self.dropped_inbound = 0
+        self.wakeup = asyncio.Event()
+        self.sender_task = asyncio.create_task(self.run_sender())
+    
+    @property
+    def wants_delta(self):
+        """True if this client takes diffs instead of full states."""
+        return self.protocol == PROTOCOL_DELTA or self.protocol == PROTOCOL_VIEW
+    
+    def allow_inbound(self):
+        """Check an inbound message against the rate limit, counting rejections."""
+        if self.inbound_limit.consume():
+            return True
+        self.dropped_inbound += 1
+        if self.metrics:
+            self.metrics.inbound_dropped.inc()
+        return False
+    
+    def send(self, payload):
+        """Queue an encoded control message, disconnecting the client if too many are queued."""
+        if self.closed:
+            return
+        if len(self.outbound) - self.queued_frames >= self.max_control:
+            # Dropping it would lose it for good, so the client goes instead
+            self.close()
+            self.closing_task = asyncio.create_task(self.websocket.close(CLOSE_TOO_SLOW, 'Too far behind'))
+            return
+        self.outbound.append((payload, False, time.monotonic() if self.metrics else 0))
+        self.wakeup.set()
+    
+    def send_frame(self, payload):
+        """
+        Queue an encoded state frame.
+        
+        Only the newest full state matters, so older queued full-state frames
+        are discarded. Deltas can't be skipped: if too many pile up, they are
+        all dropped and the client gets a keyframe on the next broadcast.
+        """
+        if self.closed:
+            return
+        is_delta = self.wants_delta and not self.needs_keyframe
+        if not is_delta:
+            # A full state supersedes every frame queued before it
+            self.drop_frames()
+        elif self.queued_frames >= self.max_queue:
+            self.drop_frames()
+            self.needs_keyframe = True
+            return
+        self.outbound.append((payload, True, time.monotonic() if self.metrics else 0))
+        self.queued_frames += 1
+        self.needs_keyframe = False
+        self.wakeup.set()
+    
+    def drop_frames(self):
+        """Discard all queued state frames, keeping control messages."""
+        if self.queued_frames:
+            self.outbound = deque(entry for entry in self.outbound if not entry[1])
+            self.queued_frames = 0
+    
+    async def run_sender(self):
+        """Write queued messages to the socket one at a time."""
+        try:
+            while True:
+                while not self.outbound:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                payload, is_frame, queued = self.outbound.popleft()
+                if is_frame:
+                    self.queued_frames -= 1
+                await self.websocket.send(payload)
+                if self.metrics:
+                    self.metrics.send_latency.observe(time.monotonic() - queued)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self.closed = True
+    
+    def close(self):
+        """Stop sending; pending messages are discarded."""
+        self.closed = True
+        self.outbound.clear()
+        self.queued_frames = 0
+        self.sender_task.cancel()
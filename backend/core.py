@@ -0,0 +1,359 @@
+import random
+from array import array
+from enum import Enum
+
+from occupancy import OccupancyGrid
+
+class Direction(Enum):
+    UP = (0, -1)
+    DOWN = (0, 1)
+    LEFT = (-1, 0)
+    RIGHT = (1, 0)
+
+OPPOSITE_DIRECTIONS = {
+    Direction.UP: Direction.DOWN,
+    Direction.DOWN: Direction.UP,
+    Direction.LEFT: Direction.RIGHT,
+    Direction.RIGHT: Direction.LEFT
+}
+
+# Turns that can wait for upcoming updates; further ones are dropped
+MAX_QUEUED_TURNS = 3
+
+def queue_turn(snake, direction_str, seq=None):
+    """
+    Queue a turn on anything with direction, turns and input_ack (see SnakeCore.set_direction).
+    
+    Returns True if the turn was queued.
+    """
+    new_direction = Direction.__members__.get(direction_str) if isinstance(direction_str, str) else None
+    turns = snake.turns
+    last = turns[-1][0] if turns else snake.direction
+    if new_direction is not None and new_direction != last and \
+            new_direction != OPPOSITE_DIRECTIONS[last] and len(turns) < MAX_QUEUED_TURNS:
+        turns.append((new_direction, seq))
+        return True
+    if seq is not None:
+        if turns:
+            turns[-1] = (turns[-1][0], seq)
+        else:
+            snake.input_ack = seq
+    return False
+
+def take_turn(snake):
+    """Apply the next queued turn, if any, acknowledging its input."""
+    if snake.turns:
+        snake.direction, seq = snake.turns.pop(0)
+        if seq is not None:
+            snake.input_ack = seq
+
+class SnakeBody:
+    __slots__ = ('width', 'cells', 'head', 'length', 'journal')
+    
+    def __init__(self, width, capacity):
+        """
+        Snake segments as a ring buffer of cell indices (y * width + x).
+        
+        Indexing and iteration yield (x, y) positions, head first, like the
+        deque this replaces. The head advances one slot per move, so moving
+        never shifts the body.
+        
+        Args:
+            width: Board width, to convert cells back to positions
+            capacity: Maximum length (the number of cells on the board)
+        """
+        self.width = width
+        self.cells = array('i', [0]) * capacity
+        # Undo journal of overwritten slots while a snapshot is outstanding
+        self.journal = None
+        self.clear()
+    
+    def clear(self):
+        """Drop every segment (the head's slot is restored with the length on undo)."""
+        self.head = len(self.cells) - 1
+        self.length = 0
+    
+    def __len__(self):
+        return self.length
+    
+    def slot(self, i):
+        """Ring buffer slot of the i-th segment counted from the head."""
+        return (self.head - i) % len(self.cells)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.length))]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('snake index out of range')
+        return divmod(self.cells[self.slot(index)], self.width)[::-1]
+    
+    def __iter__(self):
+        width = self.width
+        start = self.head - self.length + 1
+        if start >= 0:
+            cells = self.cells[start:self.head + 1][::-1]
+        else:
+            # The body wraps around the end of the buffer
+            cells = self.cells[:self.head + 1][::-1] + self.cells[start:][::-1]
+        return ((cell % width, cell // width) for cell in cells)
+    
+    def push_head(self, cell):
+        head = (self.head + 1) % len(self.cells)
+        if self.journal is not None:
+            self.journal.append((head, self.cells[head]))
+        self.cells[head] = cell
+        self.head = head
+        self.length += 1
+    
+    def pop_tail(self):
+        """Remove the tail segment and return its cell."""
+        cell = self.cells[self.slot(self.length - 1)]
+        self.length -= 1
+        return cell
+    
+    def undo(self, mark):
+        """Put back slots overwritten since the journal was mark entries long."""
+        journal = self.journal
+        while len(journal) > mark:
+            slot, cell = journal.pop()
+            self.cells[slot] = cell
+    
+    def copy(self):
+        clone = SnakeBody.__new__(SnakeBody)
+        clone.width = self.width
+        clone.cells = array('i', self.cells)
+        clone.head = self.head
+        clone.length = self.length
+        clone.journal = None
+        return clone
+
+
+class SnakeCore:
+    __slots__ = ('grid_width', 'grid_height', 'occupancy', 'snake', 'direction',
+                 'turns', 'input_ack', 'score', 'game_over', 'rng')
+    
+    # Class clone() builds; subclasses that carry rendering point this at a headless one
+    sim_class = None
+    
+    def __init__(self, grid_width=20, grid_height=20, seed=None):
+        """
+        Board, snake and rules shared by the server game and the local game.
+        
+        All state lives in flat arrays and a few scalars, so a game can be
+        rolled back with snapshot()/restore() or copied with clone() at a
+        cost that doesn't depend on the snake's length.
+        
+        Args:
+            grid_width: Number of tiles horizontally
+            grid_height: Number of tiles vertically
+            seed: Seed for the game's own random generator
+        """
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.rng = random.Random(seed)
+        # Pending turns as (Direction, client seq or None), applied one per update
+        self.turns = []
+        # Client sequence number of the last input that took effect or was dropped
+        self.input_ack = None
+        
+        # Occupied cells, kept in step with the snake (and fruits in subclasses)
+        self.occupancy = OccupancyGrid(grid_width, grid_height)
+        self.snake = SnakeBody(grid_width, grid_width * grid_height)
+        self.spawn_snake()
+        
+        self.score = 0
+        self.game_over = False
+    
+    def lay_snake(self, segments):
+        """Replace the snake with the given segments (head first) on an empty board."""
+        self.occupancy.clear()
+        self.snake.clear()
+        for segment in reversed(segments):
+            self.snake.push_head(self.occupancy.index(segment))
+            self.occupancy.add_snake(segment)
+    
+    def spawn_snake(self):
+        """Place a fresh three-segment snake in the middle of an empty board."""
+        start_x = self.grid_width // 2
+        start_y = self.grid_height // 2
+        self.lay_snake([(start_x, start_y), (start_x - 1, start_y), (start_x - 2, start_y)])
+        self.direction = Direction.RIGHT
+        # Queued turns still count as handled when a respawn drops them
+        if self.turns and self.turns[-1][1] is not None:
+            self.input_ack = self.turns[-1][1]
+        self.turns.clear()
+    
+    def push_head(self, position):
+        """Move the head onto a position."""
+        self.snake.push_head(self.occupancy.index(position))
+        self.occupancy.add_snake(position)
+    
+    def pop_tail(self):
+        """Remove the tail segment and return its position."""
+        position = self.occupancy.position(self.snake.pop_tail())
+        self.occupancy.remove_snake(position)
+        return position
+    
+    def eat(self, head):
+        """Handle whatever the head landed on. Returns True if the snake grows."""
+        return False
+    
+    def check_border_collision(self, head):
+        """Check if the snake head hits the border."""
+        x, y = head
+        return x < 0 or x >= self.grid_width or y < 0 or y >= self.grid_height
+    
+    def check_self_collision(self, head):
+        """Check if the snake head hits its own body."""
+        return head != self.snake[0] and self.occupancy.is_snake(head)
+    
+    def update(self):
+        """Update game state."""
+        if self.game_over:
+            return
+        
+        # Take the next queued turn
+        take_turn(self)
+        
+        # Calculate new head position
+        dx, dy = self.direction.value
+        head_x, head_y = self.snake[0]
+        new_head = (head_x + dx, head_y + dy)
+        
+        # Check border collision
+        if self.check_border_collision(new_head):
+            self.game_over = True
+            return
+        
+        # Check self collision
+        if self.check_self_collision(new_head):
+            self.game_over = True
+            return
+        
+        # Move snake; the tail follows unless something was eaten
+        self.push_head(new_head)
+        if not self.eat(new_head):
+            self.pop_tail()
+    
+    def set_direction(self, direction_str, seq=None):
+        """
+        Queue a turn from a string. Returns True if it was queued.
+        
+        Each update takes one queued turn, so quick presses within a tick
+        aren't lost. A turn is checked against the last queued direction:
+        reversing into it, repeating it or overflowing the queue drops the
+        turn. seq is the client's input number; it becomes input_ack once
+        the turn is applied, or once the turns ahead of a dropped one are.
+        """
+        return queue_turn(self, direction_str, seq)
+    
+    def snapshot(self):
+        """
+        Capture the current state for restore().
+        
+        The first snapshot turns on undo journaling in the board and body, so
+        taking one and restoring it later only costs the moves in between.
+        Snapshots nest: restore the most recent one first. Call
+        release_snapshots() when done so the journals stop growing.
+        """
+        if self.occupancy.journal is None:
+            self.occupancy.journal = []
+            self.snake.journal = []
+        return (len(self.occupancy.journal), len(self.snake.journal),
+                self.snake.head, self.snake.length, self.direction, tuple(self.turns), self.input_ack,
+                self.score, self.game_over, self.rng.getstate(), self.snapshot_extra())
+    
+    def restore(self, snapshot):
+        """Roll the game back to a snapshot taken earlier."""
+        (board_mark, body_mark, self.snake.head, self.snake.length, self.direction,
+         turns, self.input_ack, self.score, self.game_over, rng_state, extra) = snapshot
+        self.turns = list(turns)
+        self.occupancy.undo(board_mark)
+        self.snake.undo(body_mark)
+        self.rng.setstate(rng_state)
+        self.restore_extra(extra)
+    
+    def release_snapshots(self):
+        """Stop journaling; outstanding snapshots can no longer be restored."""
+        self.occupancy.journal = None
+        self.snake.journal = None
+    
+    def snapshot_extra(self):
+        """Subclass state to keep in a snapshot."""
+        return None
+    
+    def restore_extra(self, extra):
+        """Put back the state returned by snapshot_extra()."""
+    
+    def clone(self):
+        """
+        Independent headless copy of the game, including its random generator.
+        
+        Copies a few arrays the size of the board, whatever the snake's length.
+        """
+        cls = self.sim_class or type(self)
+        clone = cls.__new__(cls)
+        clone.grid_width = self.grid_width
+        clone.grid_height = self.grid_height
+        clone.occupancy = self.occupancy.copy()
+        clone.snake = self.snake.copy()
+        clone.direction = self.direction
+        clone.turns = list(self.turns)
+        clone.input_ack = self.input_ack
+        clone.score = self.score
+        clone.game_over = self.game_over
+        clone.rng = random.Random()
+        clone.rng.setstate(self.rng.getstate())
+        self.clone_extra(clone)
+        return clone
+    
+    def clone_extra(self, clone):
+        """Copy subclass state onto a clone."""
+
+
+class ClassicSnake(SnakeCore):
+    __slots__ = ('food',)
+    
+    def __init__(self, grid_width=20, grid_height=20, seed=None):
+        """
+        Single-player rules: one food, which respawns on a random free tile when eaten.
+        
+        Args:
+            grid_width: Number of tiles horizontally
+            grid_height: Number of tiles vertically
+            seed: Seed for the game's own random generator
+        """
+        super().__init__(grid_width, grid_height, seed)
+        self.food = self.generate_food()
+    
+    def generate_food(self):
+        """Random position that's not on the snake, or None if the snake fills the board."""
+        return self.occupancy.random_open(self.rng)
+    
+    def eat(self, head):
+        if head != self.food:
+            return False
+        self.score += 10
+        self.food = self.generate_food()
+        # A snake that fills the board leaves nowhere for food
+        if self.food is None:
+            self.game_over = True
+        return True
+    
+    def reset(self):
+        """Reset the game."""
+        self.spawn_snake()
+        self.food = self.generate_food()
+        self.score = 0
+        self.game_over = False
+    
+    def snapshot_extra(self):
+        return self.food
+    
+    def restore_extra(self, extra):
+        self.food = extra
+    
+    def clone_extra(self, clone):
+        clone.food = self.food
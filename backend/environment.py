@@ -1,15 +1,15 @@
+import os
+import numpy as np
 import pygame
-import random
-from enum import Enum
+from core import ClassicSnake
 
-class Direction(Enum):
-    UP = (0, -1)
-    DOWN = (0, 1)
-    LEFT = (-1, 0)
-    RIGHT = (1, 0)
+RENDER_MODES = ('human', 'rgb_array')
 
-class SnakeGame:
-    def __init__(self, grid_width=20, grid_height=20, tile_size=30):
+class SnakeGame(ClassicSnake):
+    # clone() hands out the rules without the window
+    sim_class = ClassicSnake
+    
+    def __init__(self, grid_width=20, grid_height=20, tile_size=30, render_mode='human', seed=None):
         """
         Initialize the snake game.
         
@@ -17,9 +17,13 @@ class SnakeGame:
             grid_width: Number of tiles horizontally
             grid_height: Number of tiles vertically
             tile_size: Size of each tile in pixels
+            render_mode: 'human' draws to a window; 'rgb_array' draws offscreen
+                         and render() returns the frame as an array
+            seed: Seed for the game's own random generator
         """
-        self.grid_width = grid_width
-        self.grid_height = grid_height
+        if render_mode not in RENDER_MODES:
+            raise ValueError(f"render_mode must be one of {RENDER_MODES}")
+        self.render_mode = render_mode
         self.tile_size = tile_size
         
         # Calculate window dimensions
@@ -33,91 +37,87 @@ class SnakeGame:
         self.food_color = (255, 0, 0)     # Red
         self.border_color = (0, 0, 0)     # Black
         
-        # Initialize snake - start in the middle
-        start_x = grid_width // 2
-        start_y = grid_height // 2
-        self.snake = [(start_x, start_y), (start_x - 1, start_y), (start_x - 2, start_y)]
-        self.direction = Direction.RIGHT
-        self.next_direction = Direction.RIGHT
-        
-        # Initialize food
-        self.food = self.generate_food()
+        # Cells to redraw on the next render and heads added since the last one;
+        # everything is drawn on the first render
+        self.dirty_cells = []
+        self.new_heads = 0
+        self.full_redraw = True
         
-        # Game state
-        self.score = 0
-        self.game_over = False
+        # Snake, food and game state
+        super().__init__(grid_width, grid_height, seed)
         self.running = True
         
         # Initialize pygame
-        pygame.init()
-        self.screen = pygame.display.set_mode((self.window_width, self.window_height))
-        pygame.display.set_caption('Snake Game')
+        if render_mode == 'rgb_array' and 'SDL_VIDEODRIVER' not in os.environ:
+            # No window needed: use the dummy video driver for this init only, so
+            # the rest of the process still sees the environment it started with
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            try:
+                pygame.init()
+            finally:
+                del os.environ['SDL_VIDEODRIVER']
+        else:
+            pygame.init()
+        if render_mode == 'human':
+            self.screen = pygame.display.set_mode((self.window_width, self.window_height))
+            pygame.display.set_caption('Snake Game')
+        else:
+            self.screen = pygame.Surface((self.window_width, self.window_height))
         self.clock = pygame.time.Clock()
+        
+        # Render caches: the checkerboard is drawn once, the board layer (background,
+        # food and snake) is patched cell by cell, and text is built once per value
+        self.background = pygame.Surface((self.window_width, self.window_height))
+        self.board = pygame.Surface((self.window_width, self.window_height))
+        self.score_font = pygame.font.Font(None, 24)
+        self.game_over_font = pygame.font.Font(None, 36)
+        self.score_text = None
+        self.score_text_value = None
+        self.score_rect = pygame.Rect(0, 0, 0, 0)
+        self.game_over_overlay = None
+        self.draw_checkerboard()
     
     def generate_food(self):
         """Generate food at a random position that's not on the snake."""
-        while True:
-            food_x = random.randint(0, self.grid_width - 1)
-            food_y = random.randint(0, self.grid_height - 1)
-            if (food_x, food_y) not in self.snake:
-                return (food_x, food_y)
-    
-    def check_border_collision(self, head):
-        """Check if the snake head hits the border."""
-        x, y = head
-        return x < 0 or x >= self.grid_width or y < 0 or y >= self.grid_height
-    
-    def check_self_collision(self, head):
-        """Check if the snake head hits its own body."""
-        return head in self.snake[1:]
-    
-    def update(self):
-        """Update game state."""
-        if self.game_over:
-            return
-        
-        # Update direction
-        self.direction = self.next_direction
-        
-        # Calculate new head position
-        dx, dy = self.direction.value
-        head_x, head_y = self.snake[0]
-        new_head = (head_x + dx, head_y + dy)
-        
-        # Check border collision
-        if self.check_border_collision(new_head):
-            self.game_over = True
-            return
-        
-        # Check self collision
-        if self.check_self_collision(new_head):
-            self.game_over = True
-            return
-        
-        # Move snake
-        self.snake.insert(0, new_head)
-        
-        # Check if food is eaten
-        if new_head == self.food:
-            self.score += 10
-            self.food = self.generate_food()
-        else:
-            # Remove tail if no food eaten
-            self.snake.pop()
+        food = super().generate_food()
+        if food is not None:
+            self.dirty_cells.append(food)
+        return food
+    
+    def push_head(self, position):
+        super().push_head(position)
+        self.dirty_cells.append(position)
+        self.new_heads += 1
+    
+    def pop_tail(self):
+        position = super().pop_tail()
+        self.dirty_cells.append(position)
+        return position
     
     def handle_input(self, keys):
         """Handle keyboard input."""
-        if keys[pygame.K_UP] and self.direction != Direction.DOWN:
-            self.next_direction = Direction.UP
-        elif keys[pygame.K_DOWN] and self.direction != Direction.UP:
-            self.next_direction = Direction.DOWN
-        elif keys[pygame.K_LEFT] and self.direction != Direction.RIGHT:
-            self.next_direction = Direction.LEFT
-        elif keys[pygame.K_RIGHT] and self.direction != Direction.LEFT:
-            self.next_direction = Direction.RIGHT
+        # Held keys repeat every frame; set_direction ignores repeats of the last queued turn
+        if keys[pygame.K_UP]:
+            self.set_direction('UP')
+        elif keys[pygame.K_DOWN]:
+            self.set_direction('DOWN')
+        elif keys[pygame.K_LEFT]:
+            self.set_direction('LEFT')
+        elif keys[pygame.K_RIGHT]:
+            self.set_direction('RIGHT')
+    
+    def tile_rect(self, cell):
+        """Pixel rect of a grid cell."""
+        x, y = cell
+        return pygame.Rect(
+            x * self.tile_size,
+            y * self.tile_size,
+            self.tile_size,
+            self.tile_size
+        )
     
     def draw_checkerboard(self):
-        """Draw the checkerboard pattern with two shades of green."""
+        """Pre-render the checkerboard pattern with two shades of green."""
         for y in range(self.grid_height):
             for x in range(self.grid_width):
                 # Alternate colors in checkerboard pattern
@@ -126,86 +126,132 @@ class SnakeGame:
                 else:
                     color = self.green_dark
                 
-                rect = pygame.Rect(
-                    x * self.tile_size,
-                    y * self.tile_size,
-                    self.tile_size,
-                    self.tile_size
-                )
-                pygame.draw.rect(self.screen, color, rect)
+                pygame.draw.rect(self.background, color, self.tile_rect((x, y)))
+    
+    def draw_tile(self, cell, color):
+        """Draw a bordered tile on the board layer."""
+        rect = self.tile_rect(cell)
+        pygame.draw.rect(self.board, color, rect)
+        pygame.draw.rect(self.board, self.border_color, rect, 1)
     
     def draw_snake(self):
-        """Draw the snake."""
+        """Draw the whole snake on the board layer."""
         for segment in self.snake:
-            x, y = segment
-            rect = pygame.Rect(
-                x * self.tile_size,
-                y * self.tile_size,
-                self.tile_size,
-                self.tile_size
-            )
-            pygame.draw.rect(self.screen, self.snake_color, rect)
-            # Add border to snake segments
-            pygame.draw.rect(self.screen, self.border_color, rect, 1)
+            self.draw_tile(segment, self.snake_color)
     
     def draw_food(self):
-        """Draw the food."""
-        x, y = self.food
-        rect = pygame.Rect(
-            x * self.tile_size,
-            y * self.tile_size,
-            self.tile_size,
-            self.tile_size
-        )
-        pygame.draw.rect(self.screen, self.food_color, rect)
-        pygame.draw.rect(self.screen, self.border_color, rect, 1)
+        """Draw the food on the board layer."""
+        if self.food is not None:
+            self.draw_tile(self.food, self.food_color)
+    
+    def draw_board(self):
+        """
+        Bring the board layer up to date. Returns the pixel rects that changed,
+        or None if the whole board was redrawn.
+        """
+        if self.full_redraw:
+            self.board.blit(self.background, (0, 0))
+            self.draw_food()
+            self.draw_snake()
+            self.dirty_cells = []
+            self.new_heads = 0
+            self.full_redraw = False
+            return None
+        
+        # Only new heads, old tails and the food can have changed
+        rects = []
+        for cell in self.dirty_cells:
+            rect = self.tile_rect(cell)
+            self.board.blit(self.background, rect, rect)
+            rects.append(rect)
+        if self.dirty_cells:
+            self.draw_food()
+            for segment in self.snake[:self.new_heads]:
+                self.draw_tile(segment, self.snake_color)
+        self.dirty_cells = []
+        self.new_heads = 0
+        return rects
     
     def draw_game_over(self):
         """Draw game over message."""
-        font = pygame.font.Font(None, 36)
-        text = font.render(f"Game Over! Score: {self.score}", True, (255, 255, 255))
-        text_rect = text.get_rect(center=(self.window_width // 2, self.window_height // 2))
+        if self.game_over_overlay is None or self.game_over_overlay[0] != self.score:
+            overlay = pygame.Surface((self.window_width, self.window_height))
+            overlay.set_alpha(180)
+            overlay.fill((0, 0, 0))
+            text = self.game_over_font.render(f"Game Over! Score: {self.score}", True, (255, 255, 255))
+            restart_text = self.game_over_font.render("Press R to restart or ESC to quit", True, (255, 255, 255))
+            self.game_over_overlay = (self.score, overlay, text, restart_text)
+        _, overlay, text, restart_text = self.game_over_overlay
         
         # Draw semi-transparent background
-        overlay = pygame.Surface((self.window_width, self.window_height))
-        overlay.set_alpha(180)
-        overlay.fill((0, 0, 0))
         self.screen.blit(overlay, (0, 0))
         
+        text_rect = text.get_rect(center=(self.window_width // 2, self.window_height // 2))
         self.screen.blit(text, text_rect)
         
-        restart_text = font.render("Press R to restart or ESC to quit", True, (255, 255, 255))
         restart_rect = restart_text.get_rect(center=(self.window_width // 2, self.window_height // 2 + 40))
         self.screen.blit(restart_text, restart_rect)
     
     def draw_score(self):
-        """Draw the score."""
-        font = pygame.font.Font(None, 24)
-        text = font.render(f"Score: {self.score}", True, (255, 255, 255))
-        self.screen.blit(text, (10, 10))
+        """Draw the score. Returns the pixel rect it covers."""
+        if self.score_text_value != self.score:
+            self.score_text = self.score_font.render(f"Score: {self.score}", True, (255, 255, 255))
+            self.score_text_value = self.score
+        return self.screen.blit(self.score_text, (10, 10))
     
-    def render(self):
-        """Render the game."""
-        self.draw_checkerboard()
-        self.draw_food()
-        self.draw_snake()
-        self.draw_score()
+    def render(self, mode=None):
+        """
+        Render the game.
+        
+        Only cells that changed since the last frame are redrawn. In 'rgb_array'
+        mode the frame is returned as a (height, width, 3) uint8 array.
+        
+        Args:
+            mode: Must be the render_mode the game was created with, if given
+        """
+        if mode is not None and mode != self.render_mode:
+            raise ValueError(f"render mode {mode!r} doesn't match this game's render_mode {self.render_mode!r}")
+        was_game_over = self.game_over_overlay is not None
+        rects = self.draw_board()
+        
+        if rects is None or self.game_over or was_game_over:
+            # Overlay covers (or covered) the whole window
+            self.screen.blit(self.board, (0, 0))
+            rects = None
+        else:
+            # Repaint the changed cells and the area under the old score text
+            rects.append(self.score_rect)
+            for rect in rects:
+                self.screen.blit(self.board, rect, rect)
+        
+        self.score_rect = self.draw_score()
         
         if self.game_over:
             self.draw_game_over()
+        else:
+            self.game_over_overlay = None
+        
+        if self.render_mode == 'rgb_array':
+            # pixels3d is a (width, height) view that locks the surface; copy it out row-major
+            pixels = pygame.surfarray.pixels3d(self.screen)
+            frame = np.ascontiguousarray(pixels.transpose(1, 0, 2))
+            del pixels
+            return frame
         
-        pygame.display.flip()
+        if rects is None:
+            pygame.display.flip()
+        else:
+            rects.append(self.score_rect)
+            pygame.display.update(rects)
     
     def reset(self):
         """Reset the game."""
-        start_x = self.grid_width // 2
-        start_y = self.grid_height // 2
-        self.snake = [(start_x, start_y), (start_x - 1, start_y), (start_x - 2, start_y)]
-        self.direction = Direction.RIGHT
-        self.next_direction = Direction.RIGHT
-        self.food = self.generate_food()
-        self.score = 0
-        self.game_over = False
+        super().reset()
+        self.full_redraw = True
+    
+    def restore_extra(self, extra):
+        super().restore_extra(extra)
+        self.full_redraw = True
     
     def run(self, fps=10):
         """Main game loop."""
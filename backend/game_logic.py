@@ -1,150 +1,211 @@
-import random
-from enum import Enum
+from bots import FIELD_RADIUS, FruitBots, evade
+from core import Direction, SnakeCore
+
+class ChangeLog:
+    def __init__(self):
+        """Changes to a game since the last drain, coalesced for delta broadcasts."""
+        self.clear()
+    
+    def clear(self):
+        """Forget all recorded changes."""
+        self.pushed = []      # New head cells, oldest first
+        self.popped = 0       # Number of tail cells removed
+        self.fruits = {}      # player_id -> latest (x, y)
+        self.removed = {}     # Ordered set of player_ids whose fruit left the board
+        self.keyframe = False # Set when the change can't be expressed as a diff
+    
+    def push_head(self, position):
+        self.pushed.append(position)
+    
+    def pop_tail(self):
+        self.popped += 1
+    
+    def set_fruit(self, player_id, position):
+        self.removed.pop(player_id, None)
+        self.fruits[player_id] = position
+    
+    def remove_fruit(self, player_id):
+        self.fruits.pop(player_id, None)
+        self.removed[player_id] = None
+    
+    def require_keyframe(self):
+        self.clear()
+        self.keyframe = True
 
-class Direction(Enum):
-    UP = (0, -1)
-    DOWN = (0, 1)
-    LEFT = (-1, 0)
-    RIGHT = (1, 0)
 
-class MultiplayerSnakeGame:
-    def __init__(self, grid_width=20, grid_height=20):
+class MultiplayerSnakeGame(SnakeCore):
+    __slots__ = ('changes', 'spatial', 'bots', 'fruits', 'fruit_owners', 'unplaced_fruits', 'running')
+    
+    def __init__(self, grid_width=20, grid_height=20, track_changes=False, seed=None):
         """
         Initialize the multiplayer snake game (server-side logic).
         
         Args:
             grid_width: Number of tiles horizontally
             grid_height: Number of tiles vertically
+            track_changes: Record a ChangeLog for delta broadcasts
+            seed: Seed for the game's own random generator
         """
-        self.grid_width = grid_width
-        self.grid_height = grid_height
+        # Per-tick diff of the state, drained by the server (None when not tracked)
+        self.changes = ChangeLog() if track_changes else None
+        # SpatialHash kept in step with the board for viewport clients (None when not needed)
+        self.spatial = None
         
-        # Initialize snake - start in the middle
-        start_x = grid_width // 2
-        start_y = grid_height // 2
-        self.snake = [(start_x, start_y), (start_x - 1, start_y), (start_x - 2, start_y)]
-        self.direction = Direction.RIGHT
-        self.next_direction = Direction.RIGHT
+        # Board, snake and random generator
+        super().__init__(grid_width, grid_height, seed)
         
         # Multiple fruits - one per connected player
         # Dictionary: player_id -> (x, y)
         self.fruits = {}
+        # Reverse index: (x, y) -> ordered {player_id: None} of fruits on that tile
+        self.fruit_owners = {}
+        # Players whose fruit could not be placed because the snake fills the board
+        self.unplaced_fruits = {}
+        # FruitBots steering the server-controlled fruits (None until the first bot)
+        self.bots = None
         
-        # Game state
-        self.score = 0
-        self.game_over = False
         self.running = True
     
+    def spawn_snake(self):
+        """Place a fresh three-segment snake in the middle of an empty board."""
+        super().spawn_snake()
+        if self.changes is not None:
+            self.changes.require_keyframe()
+    
     def add_fruit_player(self, player_id):
         """Add a new fruit player and generate their initial position."""
-        if player_id not in self.fruits:
-            self.fruits[player_id] = self.generate_fruit_position()
+        if player_id not in self.fruits and player_id not in self.unplaced_fruits:
+            self.place_fruit(player_id, self.generate_fruit_position())
+    
+    def enable_bots(self, radius=FIELD_RADIUS, seed=None):
+        """Set up fruit bots with a distance field of the given reach; returns the FruitBots."""
+        if self.bots is None:
+            self.bots = FruitBots(self.grid_width, self.grid_height, radius, seed)
+        return self.bots
+    
+    def add_fruit_bot(self, player_id, policy=evade):
+        """Add a fruit that the server moves itself (see move_bots)."""
+        self.enable_bots().add(player_id, policy)
+        self.add_fruit_player(player_id)
+    
+    def move_bots(self):
+        """Move every bot's fruit one step. Returns the moves made as [(player_id, x, y)]."""
+        if not self.bots or self.game_over:
+            return []
+        return self.bots.move(self)
+    
+    def threats(self):
+        """Head cells the fruit bots run from, and a key that changes whenever the field might."""
+        snake = self.snake
+        if not len(snake):
+            return [], None
+        head = self.occupancy.index(snake[0])
+        return [head], (head, self.occupancy.index(snake[-1]), len(snake))
     
     def remove_fruit_player(self, player_id):
-        """Remove a fruit player."""
+        """Remove a fruit player (or bot)."""
+        if self.bots is not None:
+            self.bots.remove(player_id)
         if player_id in self.fruits:
-            del self.fruits[player_id]
+            self.clear_fruit(player_id)
+            if self.changes is not None:
+                self.changes.remove_fruit(player_id)
+        self.unplaced_fruits.pop(player_id, None)
+    
+    def place_fruit(self, player_id, position):
+        """Put a player's fruit on a tile, or park it if there is no room (position is None)."""
+        if position is None:
+            self.unplaced_fruits[player_id] = None
+            if self.changes is not None:
+                self.changes.remove_fruit(player_id)
+            return
+        self.unplaced_fruits.pop(player_id, None)
+        self.fruits[player_id] = position
+        self.fruit_owners.setdefault(position, {})[player_id] = None
+        self.occupancy.add_fruit(position)
+        if self.changes is not None:
+            self.changes.set_fruit(player_id, position)
+        if self.spatial is not None:
+            self.spatial.add_fruit(player_id, position)
+    
+    def clear_fruit(self, player_id):
+        """Take a player's fruit off the board."""
+        position = self.fruits.pop(player_id)
+        owners = self.fruit_owners[position]
+        del owners[player_id]
+        if not owners:
+            del self.fruit_owners[position]
+        self.occupancy.remove_fruit(position)
+        if self.spatial is not None:
+            self.spatial.remove_fruit(player_id, position)
+    
+    def place_unplaced_fruits(self):
+        """Retry placing fruits that were parked while the board was full."""
+        for player_id in list(self.unplaced_fruits):
+            position = self.generate_fruit_position()
+            if position is None:
+                break
+            self.place_fruit(player_id, position)
     
     def generate_fruit_position(self):
-        """Generate a fruit position that's not on the snake or other fruits."""
-        max_attempts = 100
-        for _ in range(max_attempts):
-            food_x = random.randint(0, self.grid_width - 1)
-            food_y = random.randint(0, self.grid_height - 1)
-            position = (food_x, food_y)
-            
-            # Check if position is valid (not on snake, not on other fruits)
-            if position not in self.snake and position not in self.fruits.values():
-                return position
+        """
+        Generate a fruit position that's not on the snake or other fruits.
         
-        # Fallback: return a random position if we can't find a good one
-        return (random.randint(0, self.grid_width - 1), random.randint(0, self.grid_height - 1))
+        Falls back to a tile shared with another fruit when no empty tile is
+        left, and returns None when the snake covers the whole board.
+        """
+        position = self.occupancy.random_empty(self.rng)
+        if position is None:
+            position = self.occupancy.random_open(self.rng)
+        return position
     
     def update_fruit_position(self, player_id, new_x, new_y):
         """Update a fruit player's position."""
         if player_id in self.fruits:
             # Validate position is within bounds
             if 0 <= new_x < self.grid_width and 0 <= new_y < self.grid_height:
-                # Check if new position doesn't overlap with snake or other fruits
+                # Check if new position doesn't overlap with snake
                 new_pos = (new_x, new_y)
-                if new_pos not in self.snake:
+                if not self.occupancy.is_snake(new_pos):
                     # Allow overlapping with other fruits (fruits can be on same tile)
-                    self.fruits[player_id] = new_pos
+                    self.clear_fruit(player_id)
+                    self.place_fruit(player_id, new_pos)
                     return True
         return False
     
-    def check_border_collision(self, head):
-        """Check if the snake head hits the border."""
-        x, y = head
-        return x < 0 or x >= self.grid_width or y < 0 or y >= self.grid_height
+    def push_head(self, position):
+        super().push_head(position)
+        if self.changes is not None:
+            self.changes.push_head(position)
+        if self.spatial is not None:
+            self.spatial.add_snake(position)
     
-    def check_self_collision(self, head):
-        """Check if the snake head hits its own body."""
-        return head in self.snake[1:]
+    def pop_tail(self):
+        position = super().pop_tail()
+        if self.changes is not None:
+            self.changes.pop_tail()
+        if self.spatial is not None:
+            self.spatial.remove_snake(position)
+        if self.unplaced_fruits:
+            self.place_unplaced_fruits()
+        return position
     
-    def update(self):
-        """Update game state."""
-        if self.game_over:
-            return
-        
-        # Update direction
-        self.direction = self.next_direction
-        
-        # Calculate new head position
-        dx, dy = self.direction.value
-        head_x, head_y = self.snake[0]
-        new_head = (head_x + dx, head_y + dy)
-        
-        # Check border collision
-        if self.check_border_collision(new_head):
-            self.game_over = True
-            return
-        
-        # Check self collision
-        if self.check_self_collision(new_head):
-            self.game_over = True
-            return
-        
-        # Move snake
-        self.snake.insert(0, new_head)
-        
-        # Check if any fruit is eaten
-        eaten_fruits = []
-        for player_id, fruit_pos in self.fruits.items():
-            if new_head == fruit_pos:
-                eaten_fruits.append(player_id)
-                self.score += 10
+    def eat(self, head):
+        """Eat every fruit on the head's tile and respawn them."""
+        eaten_fruits = list(self.fruit_owners.get(head, ()))
+        self.score += 10 * len(eaten_fruits)
         
         # Regenerate eaten fruits
         for player_id in eaten_fruits:
-            self.fruits[player_id] = self.generate_fruit_position()
-        
-        # If no fruit eaten, remove tail
-        if not eaten_fruits:
-            self.snake.pop()
-    
-    def set_direction(self, direction_str):
-        """Set the snake's direction from a string."""
-        direction_map = {
-            'UP': Direction.UP,
-            'DOWN': Direction.DOWN,
-            'LEFT': Direction.LEFT,
-            'RIGHT': Direction.RIGHT
-        }
-        
-        if direction_str in direction_map:
-            new_direction = direction_map[direction_str]
-            # Prevent reversing into itself
-            if (self.direction == Direction.UP and new_direction != Direction.DOWN) or \
-               (self.direction == Direction.DOWN and new_direction != Direction.UP) or \
-               (self.direction == Direction.LEFT and new_direction != Direction.RIGHT) or \
-               (self.direction == Direction.RIGHT and new_direction != Direction.LEFT):
-                self.next_direction = new_direction
+            self.clear_fruit(player_id)
+        for player_id in eaten_fruits:
+            self.place_fruit(player_id, self.generate_fruit_position())
+        return bool(eaten_fruits)
     
     def get_game_state(self):
         """Get the current game state as a dictionary."""
         return {
-            'snake': self.snake,
+            'snake': list(self.snake),
             'fruits': {pid: pos for pid, pos in self.fruits.items()},
             'score': self.score,
             'game_over': self.game_over,
@@ -154,15 +215,45 @@ class MultiplayerSnakeGame:
     
     def reset(self):
         """Reset the game."""
-        start_x = self.grid_width // 2
-        start_y = self.grid_height // 2
-        self.snake = [(start_x, start_y), (start_x - 1, start_y), (start_x - 2, start_y)]
-        self.direction = Direction.RIGHT
-        self.next_direction = Direction.RIGHT
+        self.spawn_snake()
         
         # Regenerate all fruit positions
-        for player_id in list(self.fruits.keys()):
-            self.fruits[player_id] = self.generate_fruit_position()
+        player_ids = list(self.fruits.keys()) + list(self.unplaced_fruits.keys())
+        self.fruits = {}
+        self.fruit_owners = {}
+        self.unplaced_fruits = {}
+        for player_id in player_ids:
+            self.place_fruit(player_id, self.generate_fruit_position())
         
         self.score = 0
         self.game_over = False
+        if self.spatial is not None:
+            self.spatial.rebuild(self)
+    
+    def copy_fruits(self):
+        """Copies of the fruit tables, for snapshots and clones."""
+        # Fruit tables are small (one entry per player), so they are copied outright
+        return (dict(self.fruits), {pos: dict(owners) for pos, owners in self.fruit_owners.items()},
+                dict(self.unplaced_fruits))
+    
+    def snapshot_extra(self):
+        return self.copy_fruits()
+    
+    def restore_extra(self, extra):
+        fruits, fruit_owners, unplaced_fruits = extra
+        self.fruits = dict(fruits)
+        self.fruit_owners = {pos: dict(owners) for pos, owners in fruit_owners.items()}
+        self.unplaced_fruits = dict(unplaced_fruits)
+        # Clients can't follow a rollback as a diff
+        if self.changes is not None:
+            self.changes.require_keyframe()
+        if self.spatial is not None:
+            self.spatial.rebuild(self)
+    
+    def clone_extra(self, clone):
+        # Clones are for simulation and don't feed delta broadcasts
+        clone.changes = None
+        clone.spatial = None
+        clone.bots = None
+        clone.fruits, clone.fruit_owners, clone.unplaced_fruits = self.copy_fruits()
+        clone.running = self.running
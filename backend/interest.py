@@ -0,0 +1,180 @@
+"""
+Interest management for large boards: a spatial hash and per-client viewports.
+
+Clients on the 'view' protocol only hear about the part of the board around
+them (the host around the snake's head, a fruit player around their fruit).
+Each of their frames lists what entered and left their viewport since the
+previous one, so what a client receives, and what the server encodes for it,
+grows with how busy its surroundings are rather than with the board size.
+"""
+
+# Side of a spatial hash bucket, in tiles
+BUCKET_SIZE = 8
+# Tiles visible on each side of a viewport's centre unless the client asks otherwise
+VIEW_RADIUS = 10
+MAX_VIEW_RADIUS = 32
+
+
+class SpatialHash:
+    def __init__(self, grid_width, grid_height, bucket_size=BUCKET_SIZE):
+        """
+        Snake segments and fruits bucketed by board region.
+        
+        Buckets touched since the last clear_dirty() are remembered, so a
+        viewport that hasn't moved can tell it has nothing new without
+        looking at what is inside it.
+        
+        Args:
+            grid_width: Number of tiles horizontally
+            grid_height: Number of tiles vertically
+            bucket_size: Side of a bucket in tiles
+        """
+        self.bucket_size = bucket_size
+        self.columns = (grid_width + bucket_size - 1) // bucket_size
+        self.rows = (grid_height + bucket_size - 1) // bucket_size
+        self.snake = [set() for _ in range(self.columns * self.rows)]  # bucket -> {(x, y)}
+        self.fruits = [{} for _ in range(self.columns * self.rows)]  # bucket -> {player_id: (x, y)}
+        self.dirty = set()
+    
+    def bucket(self, position):
+        x, y = position
+        return (y // self.bucket_size) * self.columns + x // self.bucket_size
+    
+    def add_snake(self, position):
+        bucket = self.bucket(position)
+        self.snake[bucket].add(position)
+        self.dirty.add(bucket)
+    
+    def remove_snake(self, position):
+        bucket = self.bucket(position)
+        self.snake[bucket].discard(position)
+        self.dirty.add(bucket)
+    
+    def add_fruit(self, player_id, position):
+        bucket = self.bucket(position)
+        self.fruits[bucket][player_id] = position
+        self.dirty.add(bucket)
+    
+    def remove_fruit(self, player_id, position):
+        bucket = self.bucket(position)
+        self.fruits[bucket].pop(player_id, None)
+        self.dirty.add(bucket)
+    
+    def rebuild(self, game):
+        """Re-index a game from scratch (after a reset or a restore)."""
+        for cells in self.snake:
+            cells.clear()
+        for fruits in self.fruits:
+            fruits.clear()
+        for position in game.snake:
+            self.add_snake(position)
+        for player_id, position in game.fruits.items():
+            self.add_fruit(player_id, position)
+        # Every viewport has to look again
+        self.dirty.update(range(len(self.snake)))
+    
+    def clear_dirty(self):
+        self.dirty.clear()
+    
+    def buckets_in(self, rect):
+        x0, y0, x1, y1 = rect
+        size = self.bucket_size
+        for row in range(y0 // size, y1 // size + 1):
+            start = row * self.columns
+            for column in range(x0 // size, x1 // size + 1):
+                yield start + column
+    
+    def is_dirty(self, rect):
+        """True if anything in the buckets overlapping rect changed since the last clear_dirty()."""
+        dirty = self.dirty
+        return bool(dirty) and any(bucket in dirty for bucket in self.buckets_in(rect))
+    
+    def query(self, rect):
+        """Snake cells and fruits inside rect (inclusive tile bounds) as ({(x, y)}, {player_id: (x, y)})."""
+        x0, y0, x1, y1 = rect
+        snake = set()
+        fruits = {}
+        for bucket in self.buckets_in(rect):
+            for position in self.snake[bucket]:
+                if x0 <= position[0] <= x1 and y0 <= position[1] <= y1:
+                    snake.add(position)
+            for player_id, position in self.fruits[bucket].items():
+                if x0 <= position[0] <= x1 and y0 <= position[1] <= y1:
+                    fruits[player_id] = position
+        return snake, fruits
+
+
+class Viewport:
+    def __init__(self, radius=VIEW_RADIUS, player_id=None):
+        """
+        One client's area of interest and what it has been told about it.
+        
+        Args:
+            radius: Tiles visible on each side of the centre
+            player_id: Fruit player whose fruit the view follows (None follows the snake's head)
+        """
+        self.radius = radius
+        self.player_id = player_id
+        self.rect = None  # (x0, y0, x1, y1), inclusive
+        self.centre = None
+        # Entities the client currently knows about
+        self.snake = set()
+        self.fruits = {}
+    
+    def locate(self, game):
+        """The view's rectangle, kept at full size by sliding it inward at the board's edges."""
+        if self.player_id is None:
+            centre = game.snake[0] if len(game.snake) else None
+        else:
+            centre = game.fruits.get(self.player_id)
+        if centre is not None:
+            self.centre = centre
+        elif self.centre is None:
+            self.centre = (game.grid_width // 2, game.grid_height // 2)
+        x, y = self.centre
+        side = 2 * self.radius + 1
+        x0 = min(max(x - self.radius, 0), max(game.grid_width - side, 0))
+        y0 = min(max(y - self.radius, 0), max(game.grid_height - side, 0))
+        return (x0, y0, min(x0 + side, game.grid_width) - 1, min(y0 + side, game.grid_height) - 1)
+    
+    def update(self, game, spatial, seq, reset=False):
+        """
+        The client's next frame: what entered and left the view since the last one.
+        
+        With reset the client is assumed to know nothing, so everything in
+        view enters (used for new clients and after a dropped frame).
+        """
+        rect = self.locate(game)
+        message = {
+            'type': 'game_view',
+            'seq': seq,
+            'ack': game.input_ack,
+            'score': game.score,
+            'game_over': game.game_over,
+            'view': rect
+        }
+        if reset:
+            self.snake = set()
+            self.fruits = {}
+            message['reset'] = True
+        if reset or rect != self.rect or spatial.is_dirty(rect):
+            snake, fruits = spatial.query(rect)
+            entered = snake - self.snake
+            left = self.snake - snake
+            known = self.fruits
+            moved = {player_id: position for player_id, position in fruits.items()
+                     if known.get(player_id) != position}
+            gone = [player_id for player_id in known if player_id not in fruits]
+            # Only include the parts that changed
+            if entered:
+                message['snake_enter'] = list(entered)
+            if left:
+                message['snake_leave'] = list(left)
+            if moved:
+                message['fruits'] = moved
+            if gone:
+                message['fruits_leave'] = gone
+            self.snake = snake
+            self.fruits = fruits
+        self.rect = rect
+        return message
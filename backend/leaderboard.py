@@ -0,0 +1,163 @@
+"""
+Leaderboard of finished games, kept in a local SQLite database.
+
+The event loop never touches the database: finished games go into an
+in-memory cache (the top entries and a count per score) and onto a queue
+that a writer thread commits in batches. Queries are answered from the
+cache alone, so however many clients ask, a query costs a lookup and a
+few list slices.
+"""
+import bisect
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+# Entries kept in memory, and most a query may ask for
+LEADERBOARD_SIZE = 100
+# Entries a query gets unless it asks for a number
+DEFAULT_LIMIT = 10
+# Most rows committed in one transaction, and seconds the writer waits to fill a batch
+WRITE_BATCH_SIZE = 500
+WRITE_BATCH_WAIT = 0.5
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY,
+    room TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    finished REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scores_by_score ON scores (score DESC, finished);
+'''
+
+
+class Leaderboard:
+    def __init__(self, path, size=LEADERBOARD_SIZE):
+        """
+        Scores of finished games with a write-behind SQLite store.
+        
+        The cache is loaded from the database once here; after that it is
+        updated as games finish, in the same order they are queued for the
+        writer, so it always matches what the database will hold.
+        
+        Args:
+            path: SQLite database file (created if missing)
+            size: Number of top entries kept in memory
+        """
+        self.path = path
+        self.size = size
+        self.top = []  # [(-score, finished, room, length)], best first
+        self.scores = []  # Distinct scores, ascending
+        self.counts = {}  # score -> number of games with that score
+        self.total = 0
+        # Encoded answers to the common queries, dropped whenever a game is recorded
+        self.replies = {}
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+        
+        database = sqlite3.connect(path)
+        try:
+            database.executescript(SCHEMA)
+            for score, count in database.execute('SELECT score, COUNT(*) FROM scores GROUP BY score'):
+                self.scores.append(score)
+                self.counts[score] = count
+                self.total += count
+            self.scores.sort()
+            self.top = [(-score, finished, room, length) for room, score, length, finished in database.execute(
+                'SELECT room, score, length, finished FROM scores ORDER BY score DESC, finished LIMIT ?',
+                (size,))]
+        finally:
+            database.close()
+    
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='leaderboard-writer', daemon=True)
+            self.thread.start()
+    
+    def stop(self):
+        """Commit everything recorded so far and stop the writer thread."""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+    
+    def record(self, room_id, score, length):
+        """Add a finished game; called on the event loop."""
+        finished = time.time()
+        if score in self.counts:
+            self.counts[score] += 1
+        else:
+            self.counts[score] = 1
+            bisect.insort(self.scores, score)
+        self.total += 1
+        entry = (-score, finished, room_id, length)
+        if len(self.top) < self.size or entry < self.top[-1]:
+            bisect.insort(self.top, entry)
+            del self.top[self.size:]
+        self.replies.clear()
+        self.start()
+        self.queue.put((room_id, score, length, finished))
+    
+    def rank(self, score):
+        """1-based position a game with this score has (ties share the best position)."""
+        above = 0
+        for higher in reversed(self.scores):
+            if higher <= score:
+                break
+            above += self.counts[higher]
+        return above + 1
+    
+    def reply(self, limit=DEFAULT_LIMIT, score=None):
+        """
+        Encoded 'leaderboard' message with the top limit entries.
+        
+        With a score, it also carries the rank that score has. Answers
+        without a score are encoded once per change of the leaderboard.
+        """
+        limit = min(max(limit, 1), self.size)
+        key = limit if score is None else (limit, score)
+        payload = self.replies.get(key)
+        if payload is None:
+            message = {
+                'type': 'leaderboard',
+                'total': self.total,
+                'entries': [{'score': -negative, 'room': room, 'length': length, 'finished': finished}
+                            for negative, finished, room, length in self.top[:limit]]
+            }
+            if score is not None:
+                message['score'] = score
+                message['rank'] = self.rank(score)
+            payload = json.dumps(message)
+            if score is None:
+                self.replies[key] = payload
+        return payload
+    
+    def run(self):
+        database = sqlite3.connect(self.path)
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # Gather whatever else arrives shortly so one commit covers many games
+            deadline = time.monotonic() + WRITE_BATCH_WAIT
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                with database:
+                    database.executemany(
+                        'INSERT INTO scores (room, score, length, finished) VALUES (?, ?, ?, ?)', batch)
+            except sqlite3.Error as e:
+                print(f"Leaderboard {self.path} write failed: {e}")
+        database.close()
@@ -0,0 +1,282 @@
+import asyncio
+import math
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as StackCounter
+from urllib.parse import parse_qs, urlsplit
+
+# Histogram buckets (seconds) for tick phases and send latency
+PHASE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+QUEUE_DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16)
+
+# Seconds between profiler samples unless the request asks otherwise
+PROFILE_INTERVAL = 0.005
+# Bounds on the sampling interval a request may ask for, in seconds
+MIN_PROFILE_INTERVAL = 0.0005
+MAX_PROFILE_INTERVAL = 0.1
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, values)) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        """Monotonic count, optionally split by label values."""
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values = {}  # label values tuple -> count
+    
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels=()):
+        """Cumulative-bucket histogram in the Prometheus layout."""
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self.series = {}  # label values tuple -> [bucket counts..., +Inf count, sum]
+    
+    def observe(self, value, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for label_values, series in sorted(self.series.items()):
+            names = self.labels + ('le',)
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                total += count
+                lines.append(f'{self.name}_bucket{format_labels(names, label_values + (bound,))} {total}')
+            labels = format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{labels} {total}')
+        return lines
+
+
+def gauge(name, help_text, samples):
+    """Render a gauge from (label names, label values, value) samples taken at scrape time."""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+    for names, values, value in samples:
+        lines.append(f'{name}{format_labels(names, values)} {value}')
+    return lines
+
+
+class GameMetrics:
+    def __init__(self, server):
+        """
+        Instruments for one GameServer, updated on the event loop.
+        
+        Rooms and connections hold a reference only while metrics are on;
+        with metrics off they skip instrumentation after a single None check.
+        Player counts and queue depths are read from the server at scrape time.
+        
+        Args:
+            server: The GameServer being measured
+        """
+        self.server = server
+        self.tick_phase = Histogram('snake_tick_phase_seconds',
+                                    'Time spent per tick phase (update, bots) and per broadcast (serialize, send)',
+                                    PHASE_BUCKETS, ('phase',))
+        self.tick_duration = Histogram('snake_tick_duration_seconds', 'Wall time of a whole room tick',
+                                       PHASE_BUCKETS)
+        self.ticks = Counter('snake_ticks_total', 'Room ticks run')
+        self.overruns = Counter('snake_tick_overruns_total', 'Ticks that started more than one period late')
+        self.skipped_ticks = Counter('snake_ticks_skipped_total', 'Ticks dropped after overruns')
+        self.send_latency = Histogram('snake_send_latency_seconds',
+                                      'Time from queueing an outbound message to the socket accepting it',
+                                      LATENCY_BUCKETS)
+        self.inbound = Counter('snake_inbound_messages_total', 'Inbound messages by client and message type',
+                               ('client', 'type'))
+        self.inbound_dropped = Counter('snake_inbound_dropped_total', 'Inbound messages rejected by the rate limit')
+        self.profiler = None
+    
+    def observe_inbound(self, client_type, msg_type):
+        # Unknown types are lumped together so clients can't create series at will
+        if msg_type not in ('direction', 'reset', 'resync', 'move', 'leaderboard'):
+            msg_type = 'other'
+        self.inbound.inc(client_type, msg_type)
+    
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        rooms = self.server.rooms.values()
+        hosts = 0
+        fruit_players = 0
+        spectators = 0
+        hibernating = 0
+        depths = Histogram('snake_outbound_queue_depth', 'Messages queued per connection', QUEUE_DEPTH_BUCKETS)
+        max_depth = 0
+        for room in rooms:
+            hosts += room.host_count()
+            fruit_players += len(room.fruit_connections)
+            spectators += room.spectator_count()
+            hibernating += room.is_hibernating()
+            for connection in room.connections():
+                depth = len(connection.outbound)
+                depths.observe(depth)
+                max_depth = max(max_depth, depth)
+        
+        lines = []
+        lines += gauge('snake_rooms', 'Rooms held by the server, by state', [
+            (('state',), ('ticking',), len(self.server.rooms) - hibernating),
+            (('state',), ('hibernating',), hibernating)
+        ])
+        lines += gauge('snake_connected_players', 'Connected clients by type', [
+            (('type',), ('host',), hosts),
+            (('type',), ('fruit_player',), fruit_players),
+            (('type',), ('spectator',), spectators)
+        ])
+        lines += depths.render()
+        lines += gauge('snake_outbound_queue_depth_max', 'Deepest outbound queue of any connection',
+                       [((), (), max_depth)])
+        for metric in (self.ticks, self.tick_duration, self.tick_phase, self.overruns, self.skipped_ticks,
+                       self.send_latency, self.inbound, self.inbound_dropped):
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        """
+        Samples one thread's Python stack from a background thread.
+        
+        The sampled thread isn't instrumented at all; it only gives up the GIL
+        briefly for each sample. Stacks are counted in the collapsed format
+        flamegraph.pl and speedscope read ("outer;inner count" per line).
+        
+        Args:
+            thread_id: Thread to sample (the event loop's)
+            interval: Seconds between samples
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = StackCounter()
+        self.samples = 0
+        # Set to stop the sampler, which waits on it between samples so it never sleeps through a stop
+        self.stopped = threading.Event()
+        self.thread = None
+        self.started = None
+    
+    def start(self):
+        self.stopped.clear()
+        self.started = time.monotonic()
+        self.thread = threading.Thread(target=self.run, name='sampling-profiler', daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        """Stop sampling and return the collapsed stacks."""
+        self.stopped.set()
+        self.thread.join()
+        return self.collapsed()
+    
+    def run(self):
+        while not self.stopped.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+            self.stopped.wait(self.interval)
+    
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class MetricsEndpoint:
+    def __init__(self, metrics):
+        """
+        Minimal HTTP server on the game's event loop.
+        
+        GET /metrics          Prometheus text
+        GET /profile/start    start sampling the loop (?interval_ms=5, kept within 0.5-100)
+        GET /profile/stop     stop, save the collapsed stacks to a .folded file and return them
+        
+        Args:
+            metrics: GameMetrics to expose
+        """
+        self.metrics = metrics
+        self.loop_thread_id = threading.get_ident()
+    
+    async def start(self, host, port):
+        """Listen for requests; must be called from the event loop thread."""
+        self.loop_thread_id = threading.get_ident()
+        return await asyncio.start_server(self.handle, host, port)
+    
+    async def handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            # Skip the headers
+            while (await reader.readline()).strip():
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) < 2 or parts[0] != 'GET':
+                status, body = '405 Method Not Allowed', 'Only GET is supported\n'
+            else:
+                status, body = self.route(parts[1])
+            payload = body.encode()
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            writer.write((f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n'
+                          f'Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n').encode() + payload)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    
+    def route(self, target):
+        url = urlsplit(target)
+        if url.path == '/metrics':
+            return '200 OK', self.metrics.render()
+        if url.path == '/profile/start':
+            if self.metrics.profiler is not None:
+                return '409 Conflict', 'Profiler already running\n'
+            try:
+                interval = float(parse_qs(url.query).get('interval_ms', [PROFILE_INTERVAL * 1000])[0]) / 1000
+            except ValueError:
+                return '400 Bad Request', 'interval_ms must be a number\n'
+            if not math.isfinite(interval):
+                return '400 Bad Request', 'interval_ms must be finite\n'
+            interval = min(max(interval, MIN_PROFILE_INTERVAL), MAX_PROFILE_INTERVAL)
+            self.metrics.profiler = SamplingProfiler(self.loop_thread_id, interval)
+            self.metrics.profiler.start()
+            return '200 OK', 'Profiler started\n'
+        if url.path == '/profile/stop':
+            profiler = self.metrics.profiler
+            if profiler is None:
+                return '409 Conflict', 'Profiler not running\n'
+            self.metrics.profiler = None
+            stacks = profiler.stop()
+            path = f"snake-profile-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+            try:
+                with open(path, 'w') as f:
+                    f.write(stacks)
+                print(f"Profile: {profiler.samples} samples over "
+                      f"{time.monotonic() - profiler.started:.1f}s written to {path}")
+            except OSError as e:
+                print(f"Could not write profile {path}: {e}")
+            return '200 OK', stacks
+        return '404 Not Found', 'Try /metrics, /profile/start or /profile/stop\n'
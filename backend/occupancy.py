@@ -0,0 +1,232 @@
+import random
+from array import array
+
+# Journal entry kinds for OccupancyGrid.undo
+UNDO_ADD_SNAKE = 0
+UNDO_REMOVE_SNAKE = 1
+UNDO_ADD_FRUIT = 2
+UNDO_REMOVE_FRUIT = 3
+UNDO_CLEAR = 4
+
+
+class CellSet:
+    __slots__ = ('items', 'slots')
+    
+    def __init__(self, size, full=False):
+        """
+        Set of grid cell indices with O(1) add, remove, membership and sampling.
+        
+        Args:
+            size: Total number of cells on the grid
+            full: Start with every cell in the set
+        """
+        # items holds the members densely; slots maps cell -> index in items (-1 if absent)
+        if full:
+            self.items = array('i', range(size))
+            self.slots = array('i', range(size))
+        else:
+            self.items = array('i')
+            self.slots = array('i', [-1]) * size
+    
+    def __len__(self):
+        return len(self.items)
+    
+    def __contains__(self, cell):
+        return self.slots[cell] >= 0
+    
+    def add(self, cell):
+        """Add a cell to the set. Returns True if it wasn't there yet."""
+        if self.slots[cell] < 0:
+            self.slots[cell] = len(self.items)
+            self.items.append(cell)
+            return True
+        return False
+    
+    def remove(self, cell):
+        """
+        Remove a cell from the set by swapping it with the last member.
+        
+        Returns the slot the cell occupied (for unremove), or -1 if it was absent.
+        """
+        slot = self.slots[cell]
+        if slot < 0:
+            return -1
+        last = self.items.pop()
+        if last != cell:
+            self.items[slot] = last
+            self.slots[last] = slot
+        self.slots[cell] = -1
+        return slot
+    
+    def unremove(self, cell, slot):
+        """Exactly undo remove(cell), restoring the previous member order."""
+        if slot == len(self.items):
+            self.items.append(cell)
+        else:
+            moved = self.items[slot]
+            self.items.append(moved)
+            self.slots[moved] = len(self.items) - 1
+            self.items[slot] = cell
+        self.slots[cell] = slot
+    
+    def unadd(self, cell):
+        """Exactly undo add(cell); the cell must be the last member."""
+        self.items.pop()
+        self.slots[cell] = -1
+    
+    def sample(self, rng=random):
+        """Return a uniformly random member, or None if the set is empty."""
+        if not self.items:
+            return None
+        return self.items[rng.randrange(len(self.items))]
+    
+    def copy(self):
+        clone = CellSet.__new__(CellSet)
+        clone.items = array('i', self.items)
+        clone.slots = array('i', self.slots)
+        return clone
+
+
+class OccupancyGrid:
+    __slots__ = ('width', 'height', 'snake', 'fruit_counts', 'empty', 'open', 'journal')
+    
+    def __init__(self, width, height):
+        """
+        Incremental occupancy of snake segments and fruits on the board.
+        
+        Snake cells hold the number of the snake on them, so boards shared
+        by several snakes (see arena.py) can tell who ran into whom.
+        
+        Args:
+            width: Number of tiles horizontally
+            height: Number of tiles vertically
+        """
+        self.width = width
+        self.height = height
+        # Undo journal while a snapshot is outstanding (None otherwise)
+        self.journal = None
+        self.clear()
+    
+    def clear(self):
+        """Mark every cell as unoccupied."""
+        if self.journal is not None:
+            self.journal.append((UNDO_CLEAR, self.snake, self.fruit_counts, self.empty, self.open))
+        size = self.width * self.height
+        self.snake = bytearray(size)
+        self.fruit_counts = array('i', [0]) * size
+        # Cells with neither snake nor fruit
+        self.empty = CellSet(size, full=True)
+        # Cells without snake (fruits may be stacked there)
+        self.open = CellSet(size, full=True)
+    
+    def copy(self):
+        """Independent copy; costs a few buffer copies of the grid, whatever is on it."""
+        clone = OccupancyGrid.__new__(OccupancyGrid)
+        clone.width = self.width
+        clone.height = self.height
+        clone.journal = None
+        clone.snake = bytearray(self.snake)
+        clone.fruit_counts = array('i', self.fruit_counts)
+        clone.empty = self.empty.copy()
+        clone.open = self.open.copy()
+        return clone
+    
+    def in_bounds(self, pos):
+        """Check if a position lies on the board."""
+        x, y = pos
+        return 0 <= x < self.width and 0 <= y < self.height
+    
+    def index(self, pos):
+        """Convert an (x, y) position to a cell index."""
+        return pos[1] * self.width + pos[0]
+    
+    def position(self, cell):
+        """Convert a cell index to an (x, y) position."""
+        return (cell % self.width, cell // self.width)
+    
+    def is_snake(self, pos):
+        """Check if a snake segment occupies an in-bounds position."""
+        return self.snake[self.index(pos)] != 0
+    
+    def snake_owner(self, pos):
+        """Owner number of the snake segment on an in-bounds position (0 if none)."""
+        return self.snake[self.index(pos)]
+    
+    def has_fruit(self, pos):
+        """Check if at least one fruit occupies an in-bounds position."""
+        return self.fruit_counts[self.index(pos)] > 0
+    
+    def add_snake(self, pos, owner=1):
+        """Put a segment of snake number owner (1-255) on a position."""
+        cell = self.index(pos)
+        self.snake[cell] = owner
+        empty_slot = self.empty.remove(cell)
+        open_slot = self.open.remove(cell)
+        if self.journal is not None:
+            self.journal.append((UNDO_ADD_SNAKE, cell, empty_slot, open_slot))
+    
+    def remove_snake(self, pos):
+        cell = self.index(pos)
+        owner = self.snake[cell]
+        self.snake[cell] = 0
+        added_open = self.open.add(cell)
+        added_empty = self.fruit_counts[cell] == 0 and self.empty.add(cell)
+        if self.journal is not None:
+            self.journal.append((UNDO_REMOVE_SNAKE, cell, added_open, added_empty, owner))
+    
+    def add_fruit(self, pos):
+        cell = self.index(pos)
+        self.fruit_counts[cell] += 1
+        empty_slot = self.empty.remove(cell)
+        if self.journal is not None:
+            self.journal.append((UNDO_ADD_FRUIT, cell, empty_slot))
+    
+    def remove_fruit(self, pos):
+        cell = self.index(pos)
+        self.fruit_counts[cell] -= 1
+        added_empty = self.fruit_counts[cell] == 0 and not self.snake[cell] and self.empty.add(cell)
+        if self.journal is not None:
+            self.journal.append((UNDO_REMOVE_FRUIT, cell, added_empty))
+    
+    def undo(self, mark):
+        """Roll back journaled changes until the journal is mark entries long."""
+        journal = self.journal
+        while len(journal) > mark:
+            entry = journal.pop()
+            kind = entry[0]
+            if kind == UNDO_ADD_SNAKE:
+                _, cell, empty_slot, open_slot = entry
+                self.snake[cell] = 0
+                if open_slot >= 0:
+                    self.open.unremove(cell, open_slot)
+                if empty_slot >= 0:
+                    self.empty.unremove(cell, empty_slot)
+            elif kind == UNDO_REMOVE_SNAKE:
+                _, cell, added_open, added_empty, owner = entry
+                self.snake[cell] = owner
+                if added_empty:
+                    self.empty.unadd(cell)
+                if added_open:
+                    self.open.unadd(cell)
+            elif kind == UNDO_ADD_FRUIT:
+                _, cell, empty_slot = entry
+                self.fruit_counts[cell] -= 1
+                if empty_slot >= 0:
+                    self.empty.unremove(cell, empty_slot)
+            elif kind == UNDO_REMOVE_FRUIT:
+                _, cell, added_empty = entry
+                self.fruit_counts[cell] += 1
+                if added_empty:
+                    self.empty.unadd(cell)
+            else:
+                _, self.snake, self.fruit_counts, self.empty, self.open = entry
+    
+    def random_empty(self, rng=random):
+        """Random position with no snake and no fruit, or None if there is none."""
+        cell = self.empty.sample(rng)
+        return None if cell is None else self.position(cell)
+    
+    def random_open(self, rng=random):
+        """Random position with no snake, or None if the snake fills the board."""
+        cell = self.open.sample(rng)
+        return None if cell is None else self.position(cell)
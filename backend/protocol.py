@@ -0,0 +1,79 @@
+# Protocol modes a client can ask for in its initial handshake message
+PROTOCOL_FULL = 'full'
+PROTOCOL_DELTA = 'delta'
+# Only what is around the client, as enter/leave events (see interest.py)
+PROTOCOL_VIEW = 'view'
+PROTOCOLS = (PROTOCOL_FULL, PROTOCOL_DELTA, PROTOCOL_VIEW)
+
+# Send a full keyframe to delta clients every this many sequence numbers
+KEYFRAME_INTERVAL = 50
+
+
+class DeltaStream:
+    def __init__(self, game, keyframe_interval=KEYFRAME_INTERVAL):
+        """
+        Sequence-numbered diffs of a game's state with periodic keyframes.
+        
+        Args:
+            game: MultiplayerSnakeGame created with track_changes=True
+            keyframe_interval: Sequence numbers between forced keyframes
+        """
+        self.game = game
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        self.last_keyframe_seq = 0
+        self.keyframe_due = True
+        self.pushed = []
+        self.popped = 0
+        self.fruits = {}
+        self.removed = []
+    
+    def advance(self):
+        """
+        Drain the game's changes into the next sequence number.
+        
+        Returns True if every delta client must get a keyframe for this
+        sequence number, either because it is periodic or because the
+        change can't be expressed as a diff (e.g. reset).
+        """
+        changes = self.game.changes
+        self.seq += 1
+        self.pushed = changes.pushed
+        self.popped = changes.popped
+        self.fruits = changes.fruits
+        self.removed = list(changes.removed)
+        self.keyframe_due = changes.keyframe or \
+            self.seq - self.last_keyframe_seq >= self.keyframe_interval
+        if self.keyframe_due:
+            self.last_keyframe_seq = self.seq
+        changes.clear()
+        return self.keyframe_due
+    
+    def delta(self):
+        """Diff message from the previous sequence number to the current one."""
+        message = {
+            'type': 'game_delta',
+            'seq': self.seq,
+            'ack': self.game.input_ack,
+            'score': self.game.score,
+            'game_over': self.game.game_over
+        }
+        # Only include the parts that changed
+        if self.pushed:
+            message['push'] = self.pushed
+        if self.popped:
+            message['pop'] = self.popped
+        if self.fruits:
+            message['fruits'] = self.fruits
+        if self.removed:
+            message['removed'] = self.removed
+        return message
+    
+    def keyframe(self):
+        """Full state at the current sequence number (also valid for full-state clients)."""
+        return {
+            'type': 'game_state',
+            'seq': self.seq,
+            'ack': self.game.input_ack,
+            **self.game.get_game_state()
+        }
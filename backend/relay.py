@@ -0,0 +1,190 @@
+"""
+Spectator relay: one upstream subscription per room, fanned out to many spectators.
+
+The relay connects to the game server as a single spectator for each room
+and encoding its own spectators ask for, keeps the frames in a FrameBuffer
+and serves them exactly like the server does. However many spectators watch
+through the relay, the game server sends each frame once.
+
+Usage: python relay.py [--upstream ws://localhost:8765 | --upstream-unix PATH] [--port 8766]
+"""
+import argparse
+import asyncio
+import json
+import struct
+
+import websockets
+
+from codec import ENCODING_JSON, ENCODINGS, MSG_DELTA, MSG_STATE
+from server import DEFAULT_ROOM, MAX_ROOM_ID_LENGTH
+from spectators import FrameBuffer, follow_frames
+
+# Sequence number right after the type byte of binary state and delta frames
+FRAME_SEQ = struct.Struct('<I')
+# JSON frame types, and whether each is a keyframe (arenas only send JSON)
+FRAME_TYPES = {'game_state': True, 'game_delta': False, 'arena_state': True, 'arena_delta': False}
+# Seconds a new spectator waits for the game server before giving up
+UPSTREAM_TIMEOUT = 10
+# Seconds between attempts to reconnect to the game server
+RECONNECT_DELAY = 1
+
+
+def read_frame(message):
+    """
+    Classify a message from the game server.
+    
+    Returns (seq, is_keyframe, None) for state frames and (None, False, data)
+    for anything else, with data the decoded JSON (None for other binary messages).
+    """
+    if isinstance(message, bytes):
+        if message and message[0] in (MSG_STATE, MSG_DELTA):
+            return FRAME_SEQ.unpack_from(message, 1)[0], message[0] == MSG_STATE, None
+        return None, False, None
+    data = json.loads(message)
+    if data.get('type') in FRAME_TYPES:
+        return data['seq'], FRAME_TYPES[data['type']], None
+    return None, False, data
+
+
+class Upstream:
+    def __init__(self, relay, room_id, encoding):
+        """
+        The relay's subscription to one room in one encoding.
+        
+        Args:
+            relay: SpectatorRelay that owns the subscription
+            room_id: Room to watch
+            encoding: Encoding the frames are requested (and relayed) in
+        """
+        self.relay = relay
+        self.room_id = room_id
+        self.encoding = encoding
+        self.buffer = FrameBuffer()
+        self.spectators = 0
+        # The server's spectator_registered message, passed on to each spectator
+        self.registration = None
+        self.ready = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+    
+    async def run(self):
+        """Follow the room on the game server, reconnecting until cancelled."""
+        while True:
+            try:
+                async with self.relay.connect() as websocket:
+                    await websocket.send(json.dumps({
+                        'type': 'spectator',
+                        'room': self.room_id,
+                        'encoding': self.encoding
+                    }))
+                    async for message in websocket:
+                        seq, is_keyframe, data = read_frame(message)
+                        if seq is not None:
+                            self.buffer.append(seq, is_keyframe, message)
+                        elif data and data.get('type') == 'spectator_registered':
+                            self.registration = data
+                            self.ready.set()
+                        elif data and data.get('type') == 'error':
+                            print(f"Game server refused room {self.room_id}: {data.get('message')}")
+            except (OSError, ValueError, websockets.exceptions.WebSocketException) as e:
+                print(f"Lost game server for room {self.room_id}: {e}")
+            # The next connection starts a new sequence from a keyframe
+            self.buffer.reset()
+            await asyncio.sleep(RECONNECT_DELAY)
+    
+    def close(self):
+        self.task.cancel()
+        self.buffer.close()
+
+
+class SpectatorRelay:
+    def __init__(self, upstream_uri, upstream_unix=None):
+        """
+        Args:
+            upstream_uri: WebSocket URI of the game server
+            upstream_unix: Unix socket path of the game server (used instead of connecting to the URI's host)
+        """
+        self.upstream_uri = upstream_uri
+        self.upstream_unix = upstream_unix
+        self.upstreams = {}  # (room_id, encoding) -> Upstream
+    
+    def connect(self):
+        # Frames are already compact and the link is local, so skip compression
+        if self.upstream_unix:
+            return websockets.unix_connect(self.upstream_unix, self.upstream_uri, compression=None)
+        return websockets.connect(self.upstream_uri, compression=None)
+    
+    def subscribe(self, room_id, encoding):
+        upstream = self.upstreams.get((room_id, encoding))
+        if upstream is None:
+            upstream = self.upstreams[(room_id, encoding)] = Upstream(self, room_id, encoding)
+        upstream.spectators += 1
+        return upstream
+    
+    def unsubscribe(self, upstream):
+        """Drop a spectator; the last one ends the upstream subscription."""
+        upstream.spectators -= 1
+        if upstream.spectators == 0:
+            upstream.close()
+            del self.upstreams[(upstream.room_id, upstream.encoding)]
+    
+    async def reject(self, websocket, message):
+        await websocket.send(json.dumps({'type': 'error', 'message': message}))
+        await websocket.close()
+    
+    async def handle_spectator(self, websocket, path=None):
+        """Serve one spectator with the same handshake as the game server."""
+        upstream = None
+        try:
+            data = json.loads(await websocket.recv())
+            if data.get('type') != 'spectator':
+                await self.reject(websocket, 'This is a spectator relay. Use "spectator"')
+                return
+            room_id = data.get('room', DEFAULT_ROOM)
+            if not isinstance(room_id, str) or not room_id or len(room_id) > MAX_ROOM_ID_LENGTH:
+                await self.reject(websocket, 'Invalid room id')
+                return
+            encoding = data.get('encoding', ENCODING_JSON)
+            if encoding not in ENCODINGS:
+                encoding = ENCODING_JSON
+            
+            upstream = self.subscribe(room_id, encoding)
+            try:
+                await asyncio.wait_for(upstream.ready.wait(), UPSTREAM_TIMEOUT)
+            except asyncio.TimeoutError:
+                await self.reject(websocket, 'Game server unavailable')
+                return
+            await websocket.send(json.dumps(upstream.registration))
+            
+            follower = asyncio.create_task(follow_frames(upstream.buffer, websocket))
+            try:
+                async for message in websocket:
+                    pass
+            finally:
+                follower.cancel()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except (ValueError, AttributeError) as e:
+            print(f"Invalid handshake from spectator: {e}")
+        finally:
+            if upstream is not None:
+                self.unsubscribe(upstream)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Spectator relay for the snake game server')
+    parser.add_argument('--upstream', default='ws://localhost:8765', help='game server URI')
+    parser.add_argument('--upstream-unix', help="game server's unix socket (see server.py --unix-socket)")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+    
+    relay = SpectatorRelay(args.upstream, args.upstream_unix)
+    print(f"Relaying spectators on ws://{args.host}:{args.port} from {args.upstream_unix or args.upstream}")
+    # Every spectator gets the same frames; compressing them per connection
+    # would cost more than the relay's whole fan-out
+    async with websockets.serve(relay.handle_spectator, args.host, args.port, compression=None):
+        await asyncio.Future()  # run forever
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
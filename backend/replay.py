@@ -0,0 +1,306 @@
+"""
+Seeded replay logs: a compact binary record of everything that fed a game.
+
+A log starts with a header carrying the board size and the game's RNG seed,
+followed by one record per input in the order the room applied it. A TICK
+record stands for one game.update(), so the records between two ticks are
+that tick's inputs. Every KEYFRAME_INTERVAL ticks a KEYFRAME record stores
+a hash of the whole state for replays to check against.
+
+Usage: python replay.py LOG [LOG ...]
+"""
+import hashlib
+import json
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from itertools import chain
+
+from codec import DIRECTION_CODES, DIRECTIONS, pack_u16
+from game_logic import MultiplayerSnakeGame
+
+MAGIC = b'SNKR'
+# Version 2: directions are queued turns (see SnakeCore.set_direction)
+VERSION = 2
+
+# Record types (first byte of every record)
+REC_TICK = 0x01
+REC_DIRECTION = 0x02
+REC_RESET = 0x03
+REC_JOIN = 0x04
+REC_LEAVE = 0x05
+REC_MOVE = 0x06
+REC_KEYFRAME = 0x07
+
+HEADER = struct.Struct('<4sBHHQ')   # magic, version, width, height, seed
+DIRECTION = struct.Struct('<BB')    # type, direction code
+JOIN = struct.Struct('<BIB')        # type, player number, id length (id bytes follow)
+LEAVE = struct.Struct('<BI')        # type, player number
+MOVE = struct.Struct('<BIHH')       # type, player number, x, y
+KEYFRAME = struct.Struct('<BI8s')   # type, tick, state hash
+
+# Ticks between state hashes
+KEYFRAME_INTERVAL = 100
+# Bytes buffered per log before they are handed to the writer thread
+FLUSH_SIZE = 64 * 1024
+
+
+def state_hash(game):
+    """8-byte digest of everything that decides how a game plays on."""
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(struct.pack('<IIB?', game.score, len(game.snake),
+                              DIRECTION_CODES[game.direction.name], game.game_over))
+    digest.update(bytes(DIRECTION_CODES[direction.name] for direction, _ in game.turns))
+    digest.update(pack_u16(chain.from_iterable(game.snake)))
+    digest.update(repr((list(game.fruits.items()), list(game.unplaced_fruits))).encode())
+    digest.update(repr(game.rng.getstate()).encode())
+    return digest.digest()
+
+
+class ReplayWriter:
+    def __init__(self):
+        """Background thread that appends buffered log chunks to their files."""
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+    
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='replay-writer', daemon=True)
+            self.thread.start()
+    
+    def write(self, path, data):
+        """Queue bytes to append to a log; data=None closes it."""
+        self.start()
+        self.queue.put((path, data))
+    
+    def stop(self):
+        """Write out everything queued so far and stop the thread."""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+    
+    def run(self):
+        files = {}
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            path, data = item
+            try:
+                log = files.get(path)
+                if data is None:
+                    if log is not None:
+                        log.close()
+                        del files[path]
+                    continue
+                if log is None:
+                    log = files[path] = open(path, 'ab')
+                log.write(data)
+                log.flush()
+            except OSError as e:
+                print(f"Replay log {path} write failed: {e}")
+        for log in files.values():
+            log.close()
+
+
+class ReplayRecorder:
+    def __init__(self, path, writer, grid_width, grid_height, seed):
+        """
+        Appends one room's inputs to a replay log.
+        
+        Records go into an in-memory buffer on the tick path; the buffer is
+        handed to the writer thread when it fills up and at every keyframe.
+        
+        Args:
+            path: File the log is written to
+            writer: ReplayWriter shared by every recorder on the server
+            grid_width: Number of tiles horizontally
+            grid_height: Number of tiles vertically
+            seed: Seed of the recorded game's random generator
+        """
+        self.path = path
+        self.writer = writer
+        self.buffer = bytearray(HEADER.pack(MAGIC, VERSION, grid_width, grid_height, seed))
+        self.players = {}  # player_id -> player number in the log
+        self.next_player = 0
+        self.ticks = 0
+        # Bytes of the log handed to the writer so far
+        self.written = 0
+    
+    def checkpoint(self):
+        """Flush, then return where the log has got to (for resume())."""
+        self.flush()
+        return (self.path, dict(self.players), self.next_player, self.ticks, self.written)
+    
+    def resume(self, state):
+        """
+        Carry on a log from a checkpoint instead of starting a new one.
+        
+        Records written after the checkpoint describe inputs the restored
+        game never saw, so the file is cut back to the checkpoint. Returns
+        False if the file doesn't reach the checkpoint (the previous process
+        died before writing it out); the log can't be continued then.
+        """
+        path, players, next_player, ticks, written = state
+        try:
+            if os.path.getsize(path) < written:
+                return False
+            os.truncate(path, written)
+        except OSError:
+            return False
+        self.path = path
+        self.buffer = bytearray()
+        self.players = dict(players)
+        self.next_player = next_player
+        self.ticks = ticks
+        self.written = written
+        return True
+    
+    def direction(self, direction_str):
+        code = DIRECTION_CODES.get(direction_str)
+        if code is not None:
+            self.buffer += DIRECTION.pack(REC_DIRECTION, code)
+    
+    def reset(self):
+        self.buffer.append(REC_RESET)
+    
+    def join(self, player_id):
+        number = self.players[player_id] = self.next_player
+        self.next_player += 1
+        encoded = player_id.encode()
+        self.buffer += JOIN.pack(REC_JOIN, number, len(encoded))
+        self.buffer += encoded
+    
+    def leave(self, player_id):
+        number = self.players.pop(player_id, None)
+        if number is not None:
+            self.buffer += LEAVE.pack(REC_LEAVE, number)
+    
+    def move(self, player_id, x, y):
+        self.buffer += MOVE.pack(REC_MOVE, self.players[player_id], x, y)
+    
+    def tick(self, game):
+        """Record one game.update() that has just run."""
+        self.buffer.append(REC_TICK)
+        self.ticks += 1
+        if self.ticks % KEYFRAME_INTERVAL == 0:
+            self.buffer += KEYFRAME.pack(REC_KEYFRAME, self.ticks, state_hash(game))
+            self.flush()
+        elif len(self.buffer) >= FLUSH_SIZE:
+            self.flush()
+    
+    def flush(self):
+        if self.buffer:
+            self.writer.write(self.path, bytes(self.buffer))
+            self.written += len(self.buffer)
+            self.buffer.clear()
+    
+    def close(self):
+        self.flush()
+        self.writer.write(self.path, None)
+
+
+def replay(path):
+    """
+    Re-simulate a log as fast as possible, checking every keyframe hash.
+    
+    Returns a dict of statistics. Raises ValueError if the log is not a
+    replay log or the game diverges from the recording.
+    """
+    with open(path, 'rb') as log, mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if len(data) < HEADER.size:
+            raise ValueError(f"{path}: too short for a replay log")
+        magic, version, grid_width, grid_height, seed = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a version {VERSION} replay log")
+        
+        game = MultiplayerSnakeGame(grid_width, grid_height, seed=seed)
+        players = {}  # player number -> player_id
+        ticks = 0
+        keyframes = 0
+        truncated = False
+        offset = HEADER.size
+        end = len(data)
+        start = time.perf_counter()
+        
+        try:
+            while offset < end:
+                record = data[offset]
+                if record == REC_TICK:
+                    game.update()
+                    ticks += 1
+                    offset += 1
+                elif record == REC_MOVE:
+                    _, number, x, y = MOVE.unpack_from(data, offset)
+                    game.update_fruit_position(players[number], x, y)
+                    offset += MOVE.size
+                elif record == REC_DIRECTION:
+                    _, code = DIRECTION.unpack_from(data, offset)
+                    game.set_direction(DIRECTIONS[code])
+                    offset += DIRECTION.size
+                elif record == REC_KEYFRAME:
+                    _, tick, expected = KEYFRAME.unpack_from(data, offset)
+                    if tick != ticks or state_hash(game) != expected:
+                        raise ValueError(f"{path}: replay diverged at tick {ticks}")
+                    keyframes += 1
+                    offset += KEYFRAME.size
+                elif record == REC_JOIN:
+                    _, number, length = JOIN.unpack_from(data, offset)
+                    offset += JOIN.size
+                    if offset + length > end:
+                        raise struct.error('truncated player id')
+                    players[number] = data[offset:offset + length].decode()
+                    game.add_fruit_player(players[number])
+                    offset += length
+                elif record == REC_LEAVE:
+                    _, number = LEAVE.unpack_from(data, offset)
+                    game.remove_fruit_player(players.pop(number))
+                    offset += LEAVE.size
+                elif record == REC_RESET:
+                    game.reset()
+                    offset += 1
+                else:
+                    raise ValueError(f"{path}: unknown record type {record} at byte {offset}")
+        except struct.error:
+            # The recording process stopped in the middle of a record
+            truncated = True
+        
+        elapsed = time.perf_counter() - start
+        return {
+            'log': path,
+            'bytes': end,
+            'grid_width': grid_width,
+            'grid_height': grid_height,
+            'seed': seed,
+            'ticks': ticks,
+            'keyframes_checked': keyframes,
+            'truncated': truncated,
+            'score': game.score,
+            'seconds': round(elapsed, 4),
+            'ticks_per_second': round(ticks / elapsed) if elapsed > 0 else None
+        }
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(2)
+    results = []
+    failed = False
+    for path in sys.argv[1:]:
+        try:
+            results.append(replay(path))
+        except (OSError, ValueError) as e:
+            results.append({'log': path, 'error': str(e)})
+            failed = True
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,700 @@
+import json
+import random
+import secrets
+import time
+import uuid
+from arena import ArenaDeltaStream, SnakeArena
+from checkpoint import RESUME_TIMEOUT
+from codec import ENCODING_BINARY, ENCODING_JSON, BinaryCodec, HandleRegistry, JsonCodec, decode_message
+from game_logic import ChangeLog, MultiplayerSnakeGame
+from interest import SpatialHash
+from leaderboard import DEFAULT_LIMIT
+from protocol import DeltaStream
+from spectators import FrameBuffer
+
+# Most fruit players a single room accepts
+MAX_FRUIT_PLAYERS = 256
+
+# What a room does after falling more than one tick behind schedule:
+# 'skip' runs one update and drops the missed ticks, 'catch_up' runs
+# the missed updates back to back (at most MAX_CATCH_UP_TICKS)
+OVERRUN_SKIP = 'skip'
+OVERRUN_CATCH_UP = 'catch_up'
+MAX_CATCH_UP_TICKS = 5
+# Print an overrun warning every this many overruns
+OVERRUN_REPORT_INTERVAL = 100
+
+def input_seq(data):
+    """The client input number of a direction message, or None if it has none that fits a u32."""
+    seq = data.get('seq')
+    # Sequence numbers go out as u32 in binary state frames
+    if not isinstance(seq, int) or isinstance(seq, bool) or not 0 <= seq < 2 ** 32:
+        return None
+    return seq
+
+class Room:
+    # Game and delta stream a room plays; ArenaRoom swaps in its own
+    game_class = MultiplayerSnakeGame
+    stream_class = DeltaStream
+    
+    def __init__(self, room_id, scheduler, grid_width=20, grid_height=20, seed=None):
+        """
+        One match: a game, its host and its fruit players.
+        
+        Args:
+            room_id: Name clients use to join the room
+            scheduler: TickScheduler shared by every room on the server
+            grid_width: Number of tiles horizontally
+            grid_height: Number of tiles vertically
+            seed: Seed for the game's random generator (random if None)
+        """
+        self.room_id = room_id
+        self.scheduler = scheduler
+        self.seed = random.getrandbits(64) if seed is None else seed
+        self.game = self.game_class(grid_width, grid_height, track_changes=True, seed=self.seed)
+        # ReplayRecorder that logs every input applied to the game, if recording
+        self.recorder = None
+        # GameMetrics the room reports tick phases and inbound messages to, if enabled
+        self.metrics = None
+        # Leaderboard finished games are recorded in and queries answered from, if kept
+        self.leaderboard = None
+        self.delta_stream = self.stream_class(self.game)
+        self.host_connection = None  # ClientConnection
+        self.fruit_connections = {}  # player_id -> ClientConnection
+        # Resume tokens let players reclaim their place after a server restart
+        self.host_token = None
+        self.resume_tokens = {}  # player_id -> token of connected fruit players
+        # After a restore: places held for players who haven't reconnected yet
+        self.reserved_host = None  # host's token
+        self.reserved_players = {}  # token -> player_id
+        self.reservation_handle = None
+        # Server bots top the fruits up to bot_fill while fewer players are connected
+        self.bot_fill = 0
+        self.bots_added = 0
+        # Spectators follow a shared buffer of encoded frames per encoding
+        # instead of having their own queues, so broadcasts don't grow with them
+        self.spectator_buffers = {}  # encoding -> FrameBuffer
+        self.spectator_counts = {}  # encoding -> number of spectators
+        # Player handles for the binary encoding; a leaving player's handle is
+        # released only after the broadcast that removes their fruit
+        self.handles = HandleRegistry()
+        self.released_players = []
+        self.codecs = {
+            ENCODING_JSON: JsonCodec(),
+            ENCODING_BINARY: BinaryCodec(self.handles)
+        }
+        self.game_speed = 0.15  # seconds between updates (about 6-7 FPS)
+        # Fruit moves are buffered per player (last write wins) and applied at
+        # tick boundaries, or every move_flush_interval seconds if set
+        self.pending_moves = {}  # player_id -> (x, y)
+        self.move_flush_interval = None
+        # Ticks run on a fixed timestep: each deadline is the previous one plus
+        # game_speed, so update and send time don't add drift
+        self.overrun_policy = OVERRUN_SKIP
+        self.next_tick = None
+        self.overruns = 0  # ticks that started more than one period late
+        self.skipped_ticks = 0
+        self.last_tick_lag = 0.0  # seconds the last tick started after its deadline
+        # Scheduler handles; None while the room is hibernating
+        self.tick_handle = None
+        self.flush_handle = None
+        self.last_active = scheduler.time()
+    
+    def is_empty(self):
+        """True if nobody is connected to the room or expected back."""
+        return self.host_connection is None and not self.fruit_connections and not self.spectator_counts \
+            and self.reservation_handle is None
+    
+    def is_hibernating(self):
+        """True if the room is not ticking."""
+        return self.tick_handle is None
+    
+    def start(self):
+        """Start ticking the room if it is hibernating and the game is still on."""
+        if self.tick_handle is None and not self.game.game_over:
+            self.next_tick = self.scheduler.time() + self.game_speed
+            self.tick_handle = self.scheduler.call_at(self.next_tick, self.tick)
+        if self.move_flush_interval and self.flush_handle is None:
+            self.flush_handle = self.scheduler.call_later(self.move_flush_interval, self.flush_moves)
+    
+    def hibernate(self):
+        """Stop ticking; the game is kept as it is until the room wakes or is evicted."""
+        self.scheduler.cancel(self.tick_handle)
+        self.scheduler.cancel(self.flush_handle)
+        self.tick_handle = None
+        self.flush_handle = None
+    
+    def close(self):
+        """Stop the room and drop all of its connections."""
+        self.hibernate()
+        self.scheduler.cancel(self.reservation_handle)
+        self.reservation_handle = None
+        if self.host_connection:
+            self.host_connection.close()
+        for connection in self.fruit_connections.values():
+            connection.close()
+        for buffer in self.spectator_buffers.values():
+            buffer.close()
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+    
+    async def register_host(self, connection, resume_token=None):
+        """
+        Register the host (snake player). Returns False if a host is already registered.
+        
+        After a restore the host's place is held for the old host, who
+        proves who they are with their resume token.
+        """
+        if self.host_connection is None and self.reserved_host in (None, resume_token):
+            self.host_connection = connection
+            self.host_token = self.reserved_host or secrets.token_urlsafe(16)
+            self.reserved_host = None
+            if connection.view is not None:
+                self.enable_spatial()
+            self.last_active = self.scheduler.time()
+            self.send_to_host({'type': 'host_registered', 'status': 'success', 'room': self.room_id,
+                               'resume_token': self.host_token})
+            print(f"Host registered in room {self.room_id}")
+            if self.game.game_over:
+                self.send_to_host({'type': 'game_over', 'score': self.game.score})
+            self.start()
+            return True
+        else:
+            await connection.websocket.send(json.dumps({'type': 'error', 'message': 'Host already registered'}))
+            await connection.websocket.close()
+            return False
+    
+    async def register_fruit_player(self, connection, resume_token=None):
+        """
+        Register a fruit player. Returns None if the room is full.
+        
+        A resume token held for a player since a restore gives them back
+        their player_id and fruit; otherwise they join as a new player.
+        """
+        if len(self.fruit_connections) >= MAX_FRUIT_PLAYERS:
+            await connection.websocket.send(json.dumps({'type': 'error', 'message': 'Room is full'}))
+            await connection.websocket.close()
+            return None
+        
+        player_id = self.reserved_players.pop(resume_token, None)
+        resumed = player_id is not None
+        if not resumed:
+            player_id = str(uuid.uuid4())
+            resume_token = secrets.token_urlsafe(16)
+        self.fruit_connections[player_id] = connection
+        self.resume_tokens[player_id] = resume_token
+        if not resumed:
+            self.game.add_fruit_player(player_id)
+            # Logged before the bot it replaces leaves, in the order the game saw them
+            if self.recorder:
+                self.recorder.join(player_id)
+        if connection.view is not None:
+            connection.view.player_id = player_id
+            self.enable_spatial()
+        self.fill_bots()
+        self.last_active = self.scheduler.time()
+        
+        # Identity is delivered once here so state broadcasts can be shared by everyone
+        connection.send(json.dumps({
+            'type': 'player_registered',
+            'player_id': player_id,
+            'handle': self.handles.acquire(player_id),
+            'room': self.room_id,
+            'grid_width': self.game.grid_width,
+            'grid_height': self.game.grid_height,
+            'resume_token': resume_token,
+            'resumed': resumed
+        }))
+        
+        print(f"Fruit player {'resumed' if resumed else 'registered'} in room {self.room_id}: {player_id}")
+        return player_id
+    
+    def enable_spatial(self):
+        """Start indexing the board for viewport clients; stays on for the life of the room."""
+        if self.game.spatial is None:
+            self.game.spatial = SpatialHash(self.game.grid_width, self.game.grid_height)
+            self.game.spatial.rebuild(self.game)
+    
+    def register_spectator(self, encoding):
+        """Add a spectator; returns the FrameBuffer of its encoding to follow."""
+        buffer = self.spectator_buffers.get(encoding)
+        if buffer is None:
+            # Filled from the next broadcast on, starting with a keyframe
+            buffer = self.spectator_buffers[encoding] = FrameBuffer()
+        self.spectator_counts[encoding] = self.spectator_counts.get(encoding, 0) + 1
+        self.last_active = self.scheduler.time()
+        return buffer
+    
+    def unregister_spectator(self, encoding):
+        """Remove a spectator; the last one of an encoding stops its frames being encoded."""
+        count = self.spectator_counts.get(encoding, 0) - 1
+        if count > 0:
+            self.spectator_counts[encoding] = count
+        else:
+            self.spectator_counts.pop(encoding, None)
+            buffer = self.spectator_buffers.pop(encoding, None)
+            if buffer is not None:
+                buffer.close()
+        self.last_active = self.scheduler.time()
+    
+    def spectator_count(self):
+        return sum(self.spectator_counts.values())
+    
+    def host_count(self):
+        return 1 if self.host_connection else 0
+    
+    def unregister_host(self, connection):
+        """Forget the host and hibernate until a new one joins."""
+        if self.host_connection is connection:
+            self.host_connection = None
+            self.host_token = None
+            self.last_active = self.scheduler.time()
+            self.hibernate()
+    
+    def unregister_fruit_player(self, player_id):
+        """Forget a fruit player and take their fruit off the board."""
+        if player_id in self.fruit_connections:
+            del self.fruit_connections[player_id]
+        self.resume_tokens.pop(player_id, None)
+        self.pending_moves.pop(player_id, None)
+        self.game.remove_fruit_player(player_id)
+        if self.recorder:
+            self.recorder.leave(player_id)
+        self.released_players.append(player_id)
+        self.last_active = self.scheduler.time()
+        self.fill_bots()
+    
+    def fill_bots(self):
+        """Add or remove bots so players and bots together have bot_fill fruits."""
+        bots = self.game.bots
+        count = len(bots) if bots is not None else 0
+        wanted = max(0, self.bot_fill - len(self.fruit_connections) - len(self.reserved_players))
+        while count < wanted:
+            self.bots_added += 1
+            player_id = f'bot-{self.bots_added}'
+            self.game.add_fruit_bot(player_id)
+            if self.recorder:
+                self.recorder.join(player_id)
+            count += 1
+        if count > wanted:
+            # Newest bots make way first
+            for player_id in list(bots.policies)[wanted - count:]:
+                self.game.remove_fruit_player(player_id)
+                if self.recorder:
+                    self.recorder.leave(player_id)
+                self.released_players.append(player_id)
+    
+    def checkpoint(self):
+        """Everything another process needs to carry the room on (see restore)."""
+        bots = self.game.bots
+        players = dict(self.reserved_players)
+        for player_id, token in self.resume_tokens.items():
+            players[token] = player_id
+        return {
+            'room_id': self.room_id,
+            'seed': self.seed,
+            'game': self.game.clone(),
+            'game_speed': self.game_speed,
+            'seq': self.delta_stream.seq,
+            'bots': (list(bots.policies), bots.rng.getstate()) if bots else None,
+            'bots_added': self.bots_added,
+            'host': self.host_token if self.host_connection else self.reserved_host,
+            'players': players,  # token -> player_id
+            'handles': (dict(self.handles.handles), list(self.handles.free), self.handles.next_handle),
+            'recorder': self.recorder.checkpoint() if self.recorder else None
+        }
+    
+    def restore(self, state):
+        """
+        Take over the game of a checkpointed room.
+        
+        The room stays asleep until its host is back. The host's place and
+        every player's fruit are held for RESUME_TIMEOUT seconds for them to
+        reconnect with their resume tokens.
+        """
+        self.game = state['game']
+        self.game.changes = ChangeLog()
+        self.game.changes.require_keyframe()
+        self.delta_stream = self.stream_class(self.game)
+        self.delta_stream.seq = self.delta_stream.last_keyframe_seq = state['seq']
+        self.game_speed = state['game_speed']
+        if state['bots']:
+            # Every bot runs the default policy; custom policies don't survive a restart
+            bot_ids, rng_state = state['bots']
+            bots = self.game.enable_bots()
+            bots.rng.setstate(rng_state)
+            for player_id in bot_ids:
+                bots.add(player_id)
+        self.bots_added = state['bots_added']
+        handles, free, next_handle = state['handles']
+        self.handles.handles = dict(handles)
+        self.handles.free = list(free)
+        self.handles.next_handle = next_handle
+        self.reserved_host = state['host']
+        self.reserved_players = dict(state['players'])
+        if self.reserved_host or self.reserved_players:
+            self.reservation_handle = self.scheduler.call_later(RESUME_TIMEOUT, self.expire_reservations)
+        self.last_active = self.scheduler.time()
+    
+    def expire_reservations(self):
+        """Stop holding places for players who didn't come back after a restore."""
+        self.reservation_handle = None
+        self.reserved_host = None
+        players, self.reserved_players = self.reserved_players, {}
+        for player_id in players.values():
+            self.unregister_fruit_player(player_id)
+    
+    async def handle_host_message(self, message, connection):
+        """Handle message from host (snake player)."""
+        try:
+            data = decode_message(message)
+            msg_type = data.get('type')
+            if self.metrics:
+                self.metrics.observe_inbound('host', msg_type)
+            
+            if msg_type == 'direction':
+                direction = data.get('direction')
+                self.game.set_direction(direction, input_seq(data))
+                if self.recorder:
+                    self.recorder.direction(direction)
+            elif msg_type == 'reset':
+                self.game.reset()
+                if self.recorder:
+                    self.recorder.reset()
+                self.broadcast_game_state()
+                self.start()
+            elif msg_type == 'resync':
+                connection.needs_keyframe = True
+            elif msg_type == 'leaderboard':
+                self.send_leaderboard(connection, data)
+        except ValueError:
+            print("Invalid message from host")
+    
+    async def handle_fruit_message(self, player_id, message):
+        """Handle message from fruit player."""
+        try:
+            data = decode_message(message)
+            msg_type = data.get('type')
+            if self.metrics:
+                self.metrics.observe_inbound('fruit_player', msg_type)
+            
+            if msg_type == 'move':
+                x = data.get('x')
+                y = data.get('y')
+                if isinstance(x, int) and isinstance(y, int):
+                    self.pending_moves[player_id] = (x, y)
+            elif msg_type == 'resync':
+                if player_id in self.fruit_connections:
+                    self.fruit_connections[player_id].needs_keyframe = True
+            elif msg_type == 'leaderboard':
+                self.send_leaderboard(self.fruit_connections.get(player_id), data)
+        except ValueError:
+            print(f"Invalid message from fruit player {player_id}")
+    
+    def send_leaderboard(self, connection, data):
+        """Answer a leaderboard query (optional 'limit' and 'score') from the leaderboard's cache."""
+        if connection is None:
+            return
+        if self.leaderboard is None:
+            connection.send(json.dumps({'type': 'error', 'message': 'This server keeps no leaderboard'}))
+            return
+        limit = data.get('limit', DEFAULT_LIMIT)
+        if not isinstance(limit, int) or isinstance(limit, bool):
+            limit = DEFAULT_LIMIT
+        score = data.get('score')
+        if not isinstance(score, int) or isinstance(score, bool):
+            score = None
+        connection.send(self.leaderboard.reply(limit, score))
+    
+    def apply_pending_moves(self):
+        """Apply buffered fruit moves. Returns True if any fruit moved."""
+        if not self.pending_moves:
+            return False
+        moves, self.pending_moves = self.pending_moves, {}
+        moved = False
+        for player_id, (x, y) in moves.items():
+            if self.game.update_fruit_position(player_id, x, y):
+                moved = True
+                # Rejected moves change nothing, so only applied ones are logged
+                if self.recorder:
+                    self.recorder.move(player_id, x, y)
+        return moved
+    
+    def move_bots(self):
+        """Let the bots take their step for this tick. Returns the seconds it took."""
+        bots = self.game.bots
+        if not bots:
+            return 0.0
+        moves = self.game.move_bots()
+        if self.recorder:
+            for player_id, x, y in moves:
+                self.recorder.move(player_id, x, y)
+        if self.metrics:
+            self.metrics.tick_phase.observe(bots.last_duration, 'bots')
+        return bots.last_duration
+    
+    def send_to_host(self, message):
+        """Queue a message for the host."""
+        if self.host_connection:
+            self.host_connection.send(self.codecs[self.host_connection.encoding].encode(message))
+    
+    def send_to_all(self, message):
+        """Queue the same message for every client, encoding it once per encoding."""
+        payloads = {}
+        for connection in self.connections():
+            payload = payloads.get(connection.encoding)
+            if payload is None:
+                payload = payloads[connection.encoding] = self.codecs[connection.encoding].encode(message)
+            connection.send(payload)
+    
+    def connections(self):
+        """All connected clients."""
+        connections = list(self.fruit_connections.values())
+        if self.host_connection:
+            connections.append(self.host_connection)
+        return connections
+    
+    def broadcast_game_state(self):
+        """Broadcast current game state to all connected clients and spectators."""
+        # Each message is encoded at most once per encoding and shared: delta
+        # clients get the diff; full-state clients, clients that need a resync
+        # and everyone on a keyframe get the full state. Spectators get the
+        # same frames through their encoding's buffer
+        metrics = self.metrics
+        serialize_time = 0.0
+        if metrics:
+            start = time.perf_counter()
+        keyframe_due = self.delta_stream.advance()
+        messages = {}
+        payloads = {}
+        
+        def encoded(encoding, kind):
+            nonlocal serialize_time
+            key = (encoding, kind)
+            payload = payloads.get(key)
+            if payload is None:
+                if metrics:
+                    encode_start = time.perf_counter()
+                message = messages.get(kind)
+                if message is None:
+                    if kind == 'delta':
+                        message = messages[kind] = self.delta_stream.delta()
+                    else:
+                        message = messages[kind] = self.delta_stream.keyframe()
+                payload = payloads[key] = self.codecs[encoding].encode(message)
+                if metrics:
+                    serialize_time += time.perf_counter() - encode_start
+            return payload
+        
+        seq = self.delta_stream.seq
+        for connection in self.connections():
+            if connection.view is not None:
+                # Viewport frames are different for every client
+                if metrics:
+                    encode_start = time.perf_counter()
+                message = connection.view.update(self.game, self.game.spatial, seq, connection.needs_keyframe)
+                payload = self.codecs[connection.encoding].encode(message)
+                if metrics:
+                    serialize_time += time.perf_counter() - encode_start
+                connection.send_frame(payload)
+                continue
+            if not keyframe_due and connection.wants_delta and not connection.needs_keyframe:
+                kind = 'delta'
+            else:
+                kind = 'keyframe'
+            connection.send_frame(encoded(connection.encoding, kind))
+        
+        for encoding, buffer in self.spectator_buffers.items():
+            is_keyframe = keyframe_due or buffer.needs_keyframe
+            buffer.append(seq, is_keyframe, encoded(encoding, 'keyframe' if is_keyframe else 'delta'))
+        
+        if self.game.spatial is not None:
+            self.game.spatial.clear_dirty()
+        
+        # Removed fruits have now gone out, so their handles can be reused
+        for player_id in self.released_players:
+            self.handles.release(player_id)
+        self.released_players = []
+        
+        if metrics:
+            # Whatever wasn't encoding was handing frames to the connections
+            metrics.tick_phase.observe(serialize_time, 'serialize')
+            metrics.tick_phase.observe(time.perf_counter() - start - serialize_time, 'send')
+    
+    def tick(self):
+        """Advance the game on its fixed timestep; called by the scheduler."""
+        self.tick_handle = None
+        if not self.host_count():  # Only update if a host is connected
+            return
+        
+        metrics = self.metrics
+        if metrics:
+            tick_start = time.perf_counter()
+        
+        # Number of deadlines that have passed, including this one
+        now = self.scheduler.time()
+        self.last_tick_lag = now - self.next_tick
+        due = int(self.last_tick_lag // self.game_speed) + 1
+        steps = 1
+        if due > 1:
+            self.overruns += 1
+            if self.overrun_policy == OVERRUN_CATCH_UP:
+                steps = min(due, MAX_CATCH_UP_TICKS)
+            self.skipped_ticks += due - steps
+            if metrics:
+                metrics.overruns.inc()
+                metrics.skipped_ticks.inc(amount=due - steps)
+            if self.overruns % OVERRUN_REPORT_INTERVAL == 1:
+                print(f"Room {self.room_id} tick overran by {self.last_tick_lag * 1000:.1f} ms "
+                      f"({self.overruns} overruns, {self.skipped_ticks} ticks skipped)")
+        
+        self.apply_pending_moves()
+        bots_time = self.move_bots()
+        for _ in range(steps):
+            self.game.update()
+            if self.recorder:
+                self.recorder.tick(self.game)
+            if self.game.game_over:
+                break
+        if metrics:
+            metrics.tick_phase.observe(time.perf_counter() - tick_start - bots_time, 'update')
+        self.broadcast_game_state()
+        if metrics:
+            metrics.ticks.inc()
+            metrics.tick_duration.observe(time.perf_counter() - tick_start)
+        
+        if self.announce_results():
+            return
+        
+        self.next_tick += due * self.game_speed
+        self.tick_handle = self.scheduler.call_at(self.next_tick, self.tick)
+    
+    def announce_results(self):
+        """Tell clients about games that ended this tick. Returns True if the room stops ticking."""
+        # If game over, notify all clients once and stop ticking until reset
+        if self.game.game_over:
+            if self.leaderboard:
+                self.leaderboard.record(self.room_id, self.game.score, len(self.game.snake))
+            self.send_to_all({
+                'type': 'game_over',
+                'score': self.game.score
+            })
+            return True
+        return False
+    
+    def flush_moves(self):
+        """Apply buffered fruit moves between ticks, one coalesced broadcast per flush."""
+        self.flush_handle = None
+        if not self.host_count():
+            return
+        
+        if self.apply_pending_moves():
+            self.broadcast_game_state()
+        
+        self.flush_handle = self.scheduler.call_later(self.move_flush_interval, self.flush_moves)
+
+class ArenaRoom(Room):
+    game_class = SnakeArena
+    stream_class = ArenaDeltaStream
+    
+    def __init__(self, room_id, scheduler, grid_width=20, grid_height=20, seed=None):
+        """
+        A room where every host steers a snake of their own in one SnakeArena.
+        
+        Frames are JSON 'arena_state'/'arena_delta' messages, so the server
+        connects everyone in an arena with the JSON encoding and no viewport.
+        An eliminated host gets a game_over message and comes back with 'reset';
+        the arena keeps ticking while any host is connected. Arenas are
+        neither recorded nor checkpointed.
+        
+        Args:
+            room_id: Name clients use to join the room
+            scheduler: TickScheduler shared by every room on the server
+            grid_width: Number of tiles horizontally
+            grid_height: Number of tiles vertically
+            seed: Seed for the game's random generator (random if None)
+        """
+        super().__init__(room_id, scheduler, grid_width, grid_height, seed)
+        self.host_connections = {}  # snake_id -> ClientConnection
+        self.snake_ids = {}  # ClientConnection -> snake_id
+    
+    def is_empty(self):
+        return not self.host_connections and super().is_empty()
+    
+    def host_count(self):
+        return len(self.host_connections)
+    
+    def connections(self):
+        connections = list(self.fruit_connections.values())
+        connections += self.host_connections.values()
+        return connections
+    
+    def close(self):
+        for connection in self.host_connections.values():
+            connection.close()
+        super().close()
+    
+    async def register_host(self, connection, resume_token=None):
+        """Give a new host a snake of their own. Returns False if the arena has no room for it."""
+        snake_id = self.game.add_snake()
+        if snake_id is None:
+            await connection.websocket.send(json.dumps({'type': 'error', 'message': 'Arena is full'}))
+            await connection.websocket.close()
+            return False
+        self.host_connections[snake_id] = connection
+        self.snake_ids[connection] = snake_id
+        self.last_active = self.scheduler.time()
+        connection.send(json.dumps({'type': 'host_registered', 'status': 'success', 'room': self.room_id,
+                                    'snake_id': snake_id, 'grid_width': self.game.grid_width,
+                                    'grid_height': self.game.grid_height}))
+        print(f"Host registered in arena {self.room_id}: snake {snake_id}")
+        self.start()
+        return True
+    
+    def unregister_host(self, connection):
+        """Take the host's snake out of the arena; the last host leaving puts the room to sleep."""
+        snake_id = self.snake_ids.pop(connection, None)
+        if snake_id is None:
+            return
+        del self.host_connections[snake_id]
+        self.game.remove_snake(snake_id)
+        self.last_active = self.scheduler.time()
+        if not self.host_connections:
+            self.hibernate()
+    
+    async def handle_host_message(self, message, connection):
+        """Handle message from the host of one of the snakes."""
+        snake_id = self.snake_ids.get(connection)
+        try:
+            data = decode_message(message)
+            msg_type = data.get('type')
+            if self.metrics:
+                self.metrics.observe_inbound('host', msg_type)
+            
+            if msg_type == 'direction':
+                self.game.steer(snake_id, data.get('direction'), input_seq(data))
+            elif msg_type == 'reset':
+                # Only the host's own snake comes back; the others play on
+                self.game.respawn(snake_id)
+            elif msg_type == 'resync':
+                connection.needs_keyframe = True
+            elif msg_type == 'leaderboard':
+                self.send_leaderboard(connection, data)
+        except ValueError:
+            print(f"Invalid message from host of snake {snake_id}")
+    
+    def announce_results(self):
+        """Tell every host whose snake was eliminated this tick; the arena plays on."""
+        eliminations, self.game.eliminations = self.game.eliminations, []
+        for snake_id, eliminated_by, score, length in eliminations:
+            if self.leaderboard:
+                self.leaderboard.record(self.room_id, score, length)
+            connection = self.host_connections.get(snake_id)
+            if connection:
+                connection.send(json.dumps({'type': 'game_over', 'score': score, 'eliminated_by': eliminated_by}))
+        return False
+    
+    def checkpoint(self):
+        """Arenas aren't checkpointed; their hosts join afresh after a restart."""
+        return None
@@ -0,0 +1,73 @@
+import asyncio
+import heapq
+import itertools
+
+
+class TickScheduler:
+    def __init__(self):
+        """
+        Single task that runs callbacks at their deadlines.
+        
+        Every room on the server schedules its ticks here instead of running
+        its own sleep loop, so thousands of rooms cost one task and one heap.
+        """
+        self.heap = []  # [deadline, order, callback]; callback is None once cancelled
+        self.counter = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task = None
+    
+    def start(self):
+        """Start the scheduler task if it is not already running."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+    
+    def time(self):
+        return asyncio.get_running_loop().time()
+    
+    def call_at(self, deadline, callback):
+        """Run callback() at the given loop time. Returns a handle for cancel()."""
+        entry = [deadline, next(self.counter), callback]
+        # Wake the task if this deadline is now the earliest one
+        if not self.heap or deadline < self.heap[0][0]:
+            self.wakeup.set()
+        heapq.heappush(self.heap, entry)
+        return entry
+    
+    def call_later(self, delay, callback):
+        """Run callback() after delay seconds. Returns a handle for cancel()."""
+        return self.call_at(self.time() + delay, callback)
+    
+    def cancel(self, handle):
+        """Cancel a scheduled callback; it stays in the heap until its deadline."""
+        if handle is not None:
+            handle[2] = None
+    
+    async def run(self):
+        """Sleep until the earliest deadline, then run everything that is due."""
+        while True:
+            # Drop cancelled entries from the top
+            while self.heap and self.heap[0][2] is None:
+                heapq.heappop(self.heap)
+            
+            self.wakeup.clear()
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+            
+            delay = self.heap[0][0] - self.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            now = self.time()
+            while self.heap and self.heap[0][0] <= now:
+                _, _, callback = heapq.heappop(self.heap)
+                if callback is None:
+                    continue
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Error in scheduled callback: {e}")
@@ -1,170 +1,342 @@
+import argparse
 import asyncio
+import contextlib
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import time
 import websockets
 import json
-import uuid
-from game_logic import MultiplayerSnakeGame
+from checkpoint import (CHECKPOINT_INTERVAL, LISTEN_FD_ENV, CheckpointWriter, checkpoint_path,
+                        read_checkpoint)
+from codec import ENCODING_JSON, ENCODINGS
+from connection import ClientConnection
+from metrics import GameMetrics, MetricsEndpoint
+from interest import MAX_VIEW_RADIUS, VIEW_RADIUS, Viewport
+from leaderboard import Leaderboard
+from protocol import PROTOCOL_DELTA, PROTOCOL_FULL, PROTOCOL_VIEW, PROTOCOLS
+from replay import ReplayRecorder, ReplayWriter
+from room import ArenaRoom, Room
+from scheduler import TickScheduler
+from sharding import WorkerLink
+from spectators import follow_frames
+
+# Room used by clients whose handshake doesn't name one
+DEFAULT_ROOM = 'default'
+MAX_ROOM_ID_LENGTH = 64
+MAX_ROOMS = 10000
+# Seconds an empty room is kept before it is evicted
+ROOM_IDLE_TIMEOUT = 60
+# Seconds between sweeps for rooms to evict
+EVICTION_INTERVAL = 10
+# Close code telling clients to reconnect (and resume) in a moment
+CLOSE_SERVICE_RESTART = 1012
 
 class GameServer:
-    def __init__(self, grid_width=20, grid_height=20):
-        self.game = MultiplayerSnakeGame(grid_width, grid_height)
-        self.host_connection = None
-        self.fruit_connections = {}  # player_id -> websocket
-        self.game_loop_task = None
-        self.game_speed = 0.15  # seconds between updates (about 6-7 FPS)
-    
-    async def register_host(self, websocket):
-        """Register the host (snake player)."""
-        if self.host_connection is None:
-            self.host_connection = websocket
-            await self.send_to_host({'type': 'host_registered', 'status': 'success'})
-            print("Host registered")
-        else:
-            await websocket.send(json.dumps({'type': 'error', 'message': 'Host already registered'}))
-            await websocket.close()
-    
-    async def register_fruit_player(self, websocket):
-        """Register a new fruit player."""
-        player_id = str(uuid.uuid4())
-        self.fruit_connections[player_id] = websocket
-        self.game.add_fruit_player(player_id)
-        
-        await websocket.send(json.dumps({
-            'type': 'player_registered',
-            'player_id': player_id,
-            'grid_width': self.game.grid_width,
-            'grid_height': self.game.grid_height
-        }))
+    def __init__(self, grid_width=20, grid_height=20, record_dir=None, bot_fill=0, checkpoint_dir=None,
+                 leaderboard_path=None):
+        """
+        Args:
+            grid_width: Number of tiles horizontally
+            grid_height: Number of tiles vertically
+            record_dir: Directory to write a replay log per room to (None to not record)
+            bot_fill: Fruits every room is topped up to with server bots
+            checkpoint_dir: Directory to checkpoint rooms to and restore them from (None to not)
+            leaderboard_path: SQLite file to keep the leaderboard in (None to not keep one)
+        """
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.scheduler = TickScheduler()
+        self.rooms = {}  # room_id -> Room
+        self.room_idle_timeout = ROOM_IDLE_TIMEOUT
+        self.max_rooms = MAX_ROOMS
+        self.eviction_handle = None
+        self.record_dir = record_dir
+        self.bot_fill = bot_fill
+        self.replay_writer = ReplayWriter()
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_writer = CheckpointWriter()
+        self.checkpoint_handle = None
+        self.leaderboard = Leaderboard(leaderboard_path) if leaderboard_path else None
+        # GameMetrics once enable_metrics() is called, and the server it is scraped from
+        self.metrics = None
+        self.metrics_server = None
+    
+    def start(self):
+        """Start the shared scheduler, the idle-room sweep and periodic checkpoints."""
+        self.scheduler.start()
+        if self.eviction_handle is None:
+            self.eviction_handle = self.scheduler.call_later(EVICTION_INTERVAL, self.evict_idle_rooms)
+        if self.checkpoint_dir and self.checkpoint_handle is None:
+            self.checkpoint_handle = self.scheduler.call_later(CHECKPOINT_INTERVAL, self.periodic_checkpoint)
+    
+    def get_room(self, room_id, arena=False):
+        """
+        Return the room with this id, creating it if needed. Returns None if the server is full.
         
-        print(f"Fruit player registered: {player_id}")
-        return player_id
+        A new room is an ArenaRoom if arena is set; an existing room keeps its kind.
+        """
+        room = self.rooms.get(room_id)
+        if room is None and len(self.rooms) < self.max_rooms:
+            room = (ArenaRoom if arena else Room)(room_id, self.scheduler, self.grid_width, self.grid_height)
+            room.metrics = self.metrics
+            room.leaderboard = self.leaderboard
+            # Replay logs only know the one snake, so arenas aren't recorded
+            if self.record_dir and not arena:
+                room.recorder = ReplayRecorder(self.replay_path(room), self.replay_writer,
+                                               self.grid_width, self.grid_height, room.seed)
+            room.bot_fill = self.bot_fill
+            room.fill_bots()
+            self.rooms[room_id] = room
+        return room
     
-    async def handle_host_message(self, message):
-        """Handle message from host (snake player)."""
-        try:
-            data = json.loads(message)
-            msg_type = data.get('type')
-            
-            if msg_type == 'direction':
-                direction = data.get('direction')
-                self.game.set_direction(direction)
-            elif msg_type == 'reset':
-                self.game.reset()
-                await self.broadcast_game_state()
-        except json.JSONDecodeError:
-            print("Invalid JSON from host")
-    
-    async def handle_fruit_message(self, player_id, message):
-        """Handle message from fruit player."""
-        try:
-            data = json.loads(message)
-            msg_type = data.get('type')
-            
-            if msg_type == 'move':
-                x = data.get('x')
-                y = data.get('y')
-                self.game.update_fruit_position(player_id, x, y)
-                # Broadcast updated state immediately when fruit moves
-                await self.broadcast_game_state()
-        except json.JSONDecodeError:
-            print(f"Invalid JSON from fruit player {player_id}")
-    
-    async def send_to_host(self, message):
-        """Send message to host."""
-        if self.host_connection:
-            try:
-                await self.host_connection.send(json.dumps(message))
-            except websockets.exceptions.ConnectionClosed:
-                self.host_connection = None
-    
-    async def send_to_fruit_player(self, player_id, message):
-        """Send message to a specific fruit player."""
-        if player_id in self.fruit_connections:
-            try:
-                await self.fruit_connections[player_id].send(json.dumps(message))
-            except websockets.exceptions.ConnectionClosed:
-                # Remove disconnected player
-                del self.fruit_connections[player_id]
-                self.game.remove_fruit_player(player_id)
-    
-    async def broadcast_game_state(self):
-        """Broadcast current game state to all connected clients."""
-        game_state = self.game.get_game_state()
+    def checkpoint(self):
+        """Queue a checkpoint of every room for the writer thread."""
+        rooms = [room.checkpoint() for room in self.rooms.values()]
+        rooms = [state for state in rooms if state is not None]
+        self.checkpoint_writer.write(checkpoint_path(self.checkpoint_dir), rooms)
+    
+    def periodic_checkpoint(self):
+        self.checkpoint()
+        self.checkpoint_handle = self.scheduler.call_later(CHECKPOINT_INTERVAL, self.periodic_checkpoint)
+    
+    def restore(self):
+        """Bring back the rooms of the latest checkpoint. Returns the number restored."""
+        self.adopt(read_checkpoint(checkpoint_path(self.checkpoint_dir)) or ())
+        return len(self.rooms)
+    
+    def adopt(self, states):
+        """Take over rooms checkpointed here or by another process (see Room.checkpoint)."""
+        for state in states:
+            game = state['game']
+            room = Room(state['room_id'], self.scheduler, game.grid_width, game.grid_height, state['seed'])
+            room.restore(state)
+            room.metrics = self.metrics
+            room.leaderboard = self.leaderboard
+            if self.record_dir and state['recorder']:
+                # Carry on the room's log; a log that can't be continued can't be replayed either
+                room.recorder = ReplayRecorder(self.replay_path(room), self.replay_writer,
+                                               game.grid_width, game.grid_height, room.seed)
+                if not room.recorder.resume(state['recorder']):
+                    print(f"Room {room.room_id}: replay log ends before the checkpoint, not recording")
+                    room.recorder = None
+            room.bot_fill = self.bot_fill
+            room.fill_bots()
+            # The checkpointed match is the one its players are coming back to
+            previous = self.rooms.get(room.room_id)
+            if previous:
+                previous.close()
+            self.rooms[room.room_id] = room
+        if states:
+            self.start()
+    
+    def release(self, room_ids):
+        """
+        Hand rooms over to another process: checkpoint them and send their clients away.
         
-        # Send to host
-        await self.send_to_host({
-            'type': 'game_state',
-            **game_state
-        })
+        Clients are closed with CLOSE_SERVICE_RESTART and resume in the room
+        wherever it is adopted. Rooms that can't be checkpointed (arenas)
+        stay here. Returns (states, ids of the rooms kept).
+        """
+        states = []
+        kept = []
+        for room_id in room_ids:
+            room = self.rooms.get(room_id)
+            if room is None:
+                continue
+            state = room.checkpoint()
+            if state is None:
+                kept.append(room_id)
+                continue
+            del self.rooms[room_id]
+            states.append(state)
+            room.hibernate()
+            self.scheduler.cancel(room.reservation_handle)
+            room.reservation_handle = None
+            for connection in room.connections():
+                connection.close()
+                asyncio.ensure_future(connection.websocket.close(CLOSE_SERVICE_RESTART, 'Room moved'))
+            for buffer in room.spectator_buffers.values():
+                buffer.close(CLOSE_SERVICE_RESTART)
+            if room.recorder:
+                room.recorder.close()
+                room.recorder = None
+        if any(state['recorder'] for state in states):
+            # The adopting process carries on the logs, so they must be on disk first
+            self.replay_writer.stop()
+        return states, kept
+    
+    def suspend(self):
+        """
+        Stop every room and write a final checkpoint, ready for another process to take over.
         
-        # Send to all fruit players
-        for player_id in list(self.fruit_connections.keys()):
-            # Send state with their specific fruit position highlighted
-            await self.send_to_fruit_player(player_id, {
-                'type': 'game_state',
-                **game_state,
-                'your_player_id': player_id
-            })
-    
-    async def game_loop(self):
-        """Main game loop that updates the game state."""
-        while True:
-            await asyncio.sleep(self.game_speed)
-            
-            if self.host_connection:  # Only update if host is connected
-                self.game.update()
-                await self.broadcast_game_state()
-                
-                # If game over, notify all clients
-                if self.game.game_over:
-                    await self.send_to_host({
-                        'type': 'game_over',
-                        'score': self.game.score
-                    })
-                    for player_id in list(self.fruit_connections.keys()):
-                        await self.send_to_fruit_player(player_id, {
-                            'type': 'game_over',
-                            'score': self.game.score
-                        })
+        Replay logs are flushed and detached, so the clients disconnecting
+        afterwards don't show up in them.
+        """
+        for room in self.rooms.values():
+            room.hibernate()
+        self.scheduler.cancel(self.checkpoint_handle)
+        self.scheduler.cancel(self.eviction_handle)
+        self.checkpoint()
+        self.checkpoint_writer.stop()
+        if self.leaderboard:
+            self.leaderboard.stop()
+        for room in self.rooms.values():
+            if room.recorder:
+                room.recorder.close()
+                room.recorder = None
+        self.replay_writer.stop()
+    
+    async def enable_metrics(self, host, port):
+        """Start collecting metrics and serve them over HTTP on the server's event loop."""
+        self.metrics = GameMetrics(self)
+        for room in self.rooms.values():
+            room.metrics = self.metrics
+        endpoint = MetricsEndpoint(self.metrics)
+        self.metrics_server = await endpoint.start(host, port)
+        print(f"Metrics on http://{host}:{port}/metrics")
+    
+    def replay_path(self, room):
+        """Log file for a new room: its id (made file-safe), start time and seed."""
+        name = re.sub(r'[^A-Za-z0-9_-]', '_', room.room_id)
+        return os.path.join(self.record_dir, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{room.seed:016x}.snkr")
+    
+    def close(self):
+        """Close every room and finish writing replay logs."""
+        for room in self.rooms.values():
+            room.close()
+        self.rooms = {}
+        self.replay_writer.stop()
+        self.checkpoint_writer.stop()
+        if self.leaderboard:
+            self.leaderboard.stop()
+    
+    def evict_idle_rooms(self):
+        """Drop rooms that have been empty for longer than the idle timeout."""
+        now = self.scheduler.time()
+        for room_id, room in list(self.rooms.items()):
+            if room.is_empty() and now - room.last_active >= self.room_idle_timeout:
+                room.close()
+                del self.rooms[room_id]
+                print(f"Evicted idle room {room_id}")
+        self.eviction_handle = self.scheduler.call_later(EVICTION_INTERVAL, self.evict_idle_rooms)
+    
+    async def reject(self, websocket, message):
+        """Send an error to a client and close its connection."""
+        await websocket.send(json.dumps({'type': 'error', 'message': message}))
+        await websocket.close()
     
     async def handle_client(self, websocket, path=None):
         """Handle a new client connection."""
         client_type = None
         player_id = None
+        connection = None
+        room = None
         
         try:
-            # Wait for initial message to determine client type
+            self.start()
+            
+            # Wait for initial message to determine client type and room
             initial_message = await websocket.recv()
             data = json.loads(initial_message)
             client_type = data.get('type')
+            protocol = data.get('protocol', PROTOCOL_FULL)
+            if protocol not in PROTOCOLS:
+                protocol = PROTOCOL_FULL
+            view_radius = data.get('view_radius', VIEW_RADIUS)
+            if not isinstance(view_radius, int) or isinstance(view_radius, bool):
+                view_radius = VIEW_RADIUS
+            view_radius = min(max(view_radius, 1), MAX_VIEW_RADIUS)
+            encoding = data.get('encoding', ENCODING_JSON)
+            if encoding not in ENCODINGS:
+                encoding = ENCODING_JSON
+            # Token from host_registered/player_registered, to take a place back after a restart
+            resume_token = data.get('resume')
+            if not isinstance(resume_token, str):
+                resume_token = None
+            
+            if client_type not in ('host', 'fruit_player', 'spectator'):
+                client_type = None
+                await self.reject(websocket, 'Invalid client type. Use "host", "fruit_player" or "spectator"')
+                return
+            
+            room_id = data.get('room', DEFAULT_ROOM)
+            if not isinstance(room_id, str) or not room_id or len(room_id) > MAX_ROOM_ID_LENGTH:
+                client_type = None
+                await self.reject(websocket, 'Invalid room id')
+                return
+            
+            # Hosts asking for an arena create the room as one; everyone else joins it as it is
+            arena = client_type == 'host' and data.get('arena') is True
+            room = self.get_room(room_id, arena)
+            if room is None:
+                client_type = None
+                await self.reject(websocket, 'Server is full')
+                return
+            if isinstance(room, ArenaRoom):
+                # Arena frames only exist as JSON states and diffs of the whole board
+                encoding = ENCODING_JSON
+                if protocol == PROTOCOL_VIEW:
+                    protocol = PROTOCOL_DELTA
+            elif arena:
+                client_type = None
+                await self.reject(websocket, f'Room {room_id} is not an arena')
+                return
             
             if client_type == 'host':
-                await self.register_host(websocket)
-                # Start game loop if not already running
-                if self.game_loop_task is None or self.game_loop_task.done():
-                    self.game_loop_task = asyncio.create_task(self.game_loop())
+                connection = ClientConnection(websocket, protocol, encoding, metrics=self.metrics)
+                if protocol == PROTOCOL_VIEW:
+                    connection.view = Viewport(view_radius)
+                if not await room.register_host(connection, resume_token):
+                    client_type = None
+                    return
                 
                 # Send initial game state
-                await self.broadcast_game_state()
+                room.broadcast_game_state()
                 
                 # Handle host messages
                 async for message in websocket:
-                    await self.handle_host_message(message)
+                    if connection.allow_inbound():
+                        await room.handle_host_message(message, connection)
             
             elif client_type == 'fruit_player':
-                player_id = await self.register_fruit_player(websocket)
+                connection = ClientConnection(websocket, protocol, encoding, metrics=self.metrics)
+                if protocol == PROTOCOL_VIEW:
+                    connection.view = Viewport(view_radius)
+                player_id = await room.register_fruit_player(connection, resume_token)
+                if player_id is None:
+                    client_type = None
+                    return
                 # Send initial game state
-                await self.broadcast_game_state()
+                room.broadcast_game_state()
                 
                 # Handle fruit player messages
                 async for message in websocket:
-                    await self.handle_fruit_message(player_id, message)
+                    if connection.allow_inbound():
+                        await room.handle_fruit_message(player_id, message)
             
-            else:
+            elif client_type == 'spectator':
+                # Spectators always get keyframe + delta frames; the protocol field is ignored
+                buffer = room.register_spectator(encoding)
+                if buffer.needs_keyframe:
+                    # Give a new buffer its first keyframe without waiting for a tick
+                    room.broadcast_game_state()
                 await websocket.send(json.dumps({
-                    'type': 'error',
-                    'message': 'Invalid client type. Use "host" or "fruit_player"'
+                    'type': 'spectator_registered',
+                    'room': room_id,
+                    'grid_width': room.game.grid_width,
+                    'grid_height': room.game.grid_height
                 }))
-                await websocket.close()
+                follower = asyncio.create_task(follow_frames(buffer, websocket))
+                try:
+                    # Spectators have nothing to say; reading only notices them leaving
+                    async for message in websocket:
+                        pass
+                finally:
+                    follower.cancel()
         
         except websockets.exceptions.ConnectionClosed:
             print(f"Client disconnected: {client_type}, player_id: {player_id}")
@@ -172,25 +344,145 @@ class GameServer:
             print(f"Error handling client: {e}")
         finally:
             # Cleanup
+            if connection:
+                connection.close()
             if client_type == 'host':
-                self.host_connection = None
+                room.unregister_host(connection)
             elif client_type == 'fruit_player' and player_id:
-                if player_id in self.fruit_connections:
-                    del self.fruit_connections[player_id]
-                self.game.remove_fruit_player(player_id)
+                room.unregister_fruit_player(player_id)
+            elif client_type == 'spectator':
+                room.unregister_spectator(encoding)
+
+def listening_sockets():
+    """
+    The sockets handed over by a restarting server, or new ones on localhost:8765.
+    
+    Like websockets.serve with a host name, there is one socket per address
+    localhost resolves to, so clients get in over IPv4 and IPv6 alike.
+    """
+    fds = os.environ.pop(LISTEN_FD_ENV, None)
+    if fds is not None:
+        return [socket.socket(fileno=int(fd)) for fd in fds.split(',')]
+    addresses = {(family, address) for family, _, _, _, address
+                 in socket.getaddrinfo('localhost', 8765, type=socket.SOCK_STREAM)}
+    listeners = []
+    try:
+        for family, address in sorted(addresses):
+            listeners.append(socket.create_server(address, family=family))
+    except OSError:
+        for listener in listeners:
+            listener.close()
+        raise
+    return listeners
+
+async def hand_over(server, ws_servers, listeners, other_servers):
+    """
+    Restart in place: a new process takes over the listening sockets and the rooms.
+    
+    The rooms are checkpointed first and the new process restores them on
+    start, so a match only pauses for as long as clients take to reconnect.
+    Connections queued on the sockets in the meantime are accepted by the
+    new process.
+    """
+    server.suspend()
+    for other in other_servers:
+        other.close()
+    fds = [os.dup(listener.fileno()) for listener in listeners]
+    # Stop accepting here; the kernel keeps the sockets listening through the duplicates
+    for ws_server in ws_servers:
+        ws_server.close(close_connections=False)
+    subprocess.Popen([sys.executable] + sys.argv, pass_fds=fds,
+                     env={**os.environ, LISTEN_FD_ENV: ','.join(map(str, fds))})
+    for fd in fds:
+        os.close(fd)
+    print("Handed over to a new server process")
+    # Clients reconnect with their resume tokens on this close code
+    await asyncio.gather(*(connection.close(CLOSE_SERVICE_RESTART, 'Server restarting')
+                           for ws_server in ws_servers for connection in ws_server.connections))
+    for ws_server in ws_servers:
+        await ws_server.wait_closed()
+
+async def run_worker(server, handler, worker_id, unix_socket, gateway):
+    """
+    Serve as one worker of a cluster until its gateway goes away.
+    
+    Clients only come through the gateway, over the unix socket. Restarts
+    are up to the launcher, so SIGHUP isn't handled here.
+    """
+    link = WorkerLink(server, worker_id, gateway)
+    try:
+        async with websockets.unix_serve(handler, unix_socket):
+            await link.start()
+            print(f"Worker {worker_id} taking clients on {unix_socket}")
+            await link.closed.wait()
+    finally:
+        link.close()
+        server.close()
 
 async def main():
-    server = GameServer(grid_width=20, grid_height=20)
+    parser = argparse.ArgumentParser(description='Snake game server')
+    parser.add_argument('--width', type=int, default=20, help='board width in tiles')
+    parser.add_argument('--height', type=int, default=20, help='board height in tiles')
+    parser.add_argument('--bots', type=int, default=0,
+                        help='top every room up to this many fruits with server-controlled bots')
+    parser.add_argument('--record-dir', help='write a replay log per room to this directory')
+    parser.add_argument('--metrics-port', type=int,
+                        help='serve Prometheus metrics and the profiler on localhost:PORT')
+    parser.add_argument('--unix-socket', help='also accept clients (e.g. a spectator relay) on this unix socket')
+    parser.add_argument('--leaderboard', help='keep a leaderboard of finished games in this SQLite file')
+    parser.add_argument('--checkpoint-dir',
+                        help='checkpoint rooms to this directory, restore them on start and restart on SIGHUP')
+    parser.add_argument('--worker', type=int,
+                        help='run as this worker of cluster.py: take clients on --unix-socket only')
+    parser.add_argument('--gateway', help="the cluster gateway's control socket (with --worker)")
+    args = parser.parse_args()
+    if args.worker is not None and not (args.unix_socket and args.gateway):
+        parser.error('--worker needs --unix-socket and --gateway')
+    if args.record_dir:
+        os.makedirs(args.record_dir, exist_ok=True)
+    if args.checkpoint_dir:
+        os.makedirs(args.checkpoint_dir, exist_ok=True)
     
-    print("Starting WebSocket server on ws://localhost:8765")
-    print("Host should connect first, then fruit players can join")
+    server = GameServer(grid_width=args.width, grid_height=args.height, record_dir=args.record_dir,
+                        bot_fill=args.bots, checkpoint_dir=args.checkpoint_dir,
+                        leaderboard_path=args.leaderboard)
+    if args.metrics_port:
+        await server.enable_metrics('localhost', args.metrics_port)
+    if args.checkpoint_dir:
+        restored = server.restore()
+        if restored:
+            print(f"Restored {restored} rooms from {args.checkpoint_dir}")
+        server.start()
     
     # Create a wrapper function to handle the websocket connection
     async def handler(websocket, path=None):
         await server.handle_client(websocket, path)
     
-    async with websockets.serve(handler, "localhost", 8765):
-        await asyncio.Future()  # run forever
+    if args.worker is not None:
+        await run_worker(server, handler, args.worker, args.unix_socket, args.gateway)
+        return
+    
+    print("Starting WebSocket server on ws://localhost:8765")
+    print("Host should connect first, then fruit players can join")
+    
+    listeners = listening_sockets()
+    restart = asyncio.Event()
+    try:
+        async with contextlib.AsyncExitStack() as stack:
+            ws_servers = [await stack.enter_async_context(websockets.serve(handler, sock=listener))
+                          for listener in listeners]
+            other_servers = []
+            if args.unix_socket:
+                other_servers.append(await websockets.unix_serve(handler, args.unix_socket))
+                print(f"Also listening on unix socket {args.unix_socket}")
+            if server.metrics_server:
+                other_servers.append(server.metrics_server)
+            if args.checkpoint_dir:
+                asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, restart.set)
+            await restart.wait()  # run until told to restart
+            await hand_over(server, ws_servers, listeners, other_servers)
+    finally:
+        server.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,152 @@
+"""
+Pieces shared by the cluster gateway (cluster.py) and its worker servers.
+
+Rooms are spread over workers by consistent hashing: every worker has
+VIRTUAL_NODES points on a hash ring and owns the rooms that hash just below
+them, so a new worker only takes over the rooms on the arcs it lands on,
+about 1/K of them, and every other room stays where it is.
+
+The gateway and its workers talk over a unix socket in length-prefixed,
+pickled messages. Only processes started by the same launcher are on
+either end (the socket lives in a private directory), like checkpoints.
+"""
+import asyncio
+import bisect
+import hashlib
+import os
+import pickle
+import struct
+
+# Points each worker has on the ring; more points spread rooms more evenly
+VIRTUAL_NODES = 160
+# Seconds between load reports from a worker
+LOAD_REPORT_INTERVAL = 1
+# Length of a control message, ahead of its pickled body
+CONTROL_HEADER = struct.Struct('<I')
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    def __init__(self, workers=(), virtual_nodes=VIRTUAL_NODES):
+        """
+        Consistent-hash ring of worker ids.
+        
+        Args:
+            workers: Ids of the workers on the ring
+            virtual_nodes: Points each worker has on the ring
+        """
+        self.virtual_nodes = virtual_nodes
+        self.workers = sorted(set(workers))
+        points = sorted((ring_hash(f'worker-{worker}-{node}'), worker)
+                        for worker in self.workers for node in range(virtual_nodes))
+        self.points = [point for point, _ in points]
+        self.owners = [worker for _, worker in points]
+    
+    def __contains__(self, worker):
+        return worker in self.workers
+    
+    def owner(self, room_id):
+        """Worker that owns a room, or None if the ring is empty."""
+        if not self.points:
+            return None
+        index = bisect.bisect(self.points, ring_hash(room_id))
+        return self.owners[index % len(self.owners)]
+    
+    def with_worker(self, worker):
+        """A copy of the ring with one more worker."""
+        return HashRing(self.workers + [worker], self.virtual_nodes)
+
+
+async def read_message(reader):
+    """Next message from a control socket, or None once the other end has closed it."""
+    try:
+        header = await reader.readexactly(CONTROL_HEADER.size)
+        (length,) = CONTROL_HEADER.unpack(header)
+        return pickle.loads(await reader.readexactly(length))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+
+def send_message(writer, message):
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    writer.write(CONTROL_HEADER.pack(len(data)) + data)
+
+
+class WorkerLink:
+    def __init__(self, server, worker_id, control_path):
+        """
+        A worker server's connection to the cluster gateway.
+        
+        Reports the worker's load every LOAD_REPORT_INTERVAL seconds. When
+        the gateway sends a new ring, rooms the ring gives to other workers
+        are checkpointed and handed back to the gateway; rooms the gateway
+        hands over are restored here.
+        
+        Args:
+            server: GameServer of this worker
+            worker_id: Id of this worker on the ring
+            control_path: Unix socket the gateway listens for workers on
+        """
+        self.server = server
+        self.worker_id = worker_id
+        self.control_path = control_path
+        self.writer = None
+        # Rooms kept here although the ring gives them to another worker (arenas can't move)
+        self.kept = set()
+        self.tasks = []
+        # Set once the gateway is gone; the worker shuts down with it
+        self.closed = asyncio.Event()
+    
+    async def start(self):
+        reader, self.writer = await asyncio.open_unix_connection(self.control_path)
+        send_message(self.writer, {'type': 'hello', 'worker': self.worker_id, 'pid': os.getpid()})
+        self.tasks = [asyncio.create_task(self.run(reader)), asyncio.create_task(self.report())]
+    
+    def close(self):
+        for task in self.tasks:
+            task.cancel()
+        if self.writer:
+            self.writer.close()
+    
+    async def run(self, reader):
+        try:
+            while True:
+                message = await read_message(reader)
+                if message is None:
+                    break
+                if message['type'] == 'ring':
+                    self.release(HashRing(message['workers']))
+                elif message['type'] == 'adopt':
+                    self.server.adopt(message['rooms'])
+                    send_message(self.writer, {'type': 'adopted', 'worker': self.worker_id,
+                                               'rooms': [state['room_id'] for state in message['rooms']]})
+        finally:
+            self.closed.set()
+    
+    def release(self, ring):
+        """Hand the rooms the ring gives to other workers over to the gateway."""
+        moving = [room_id for room_id in self.server.rooms if ring.owner(room_id) != self.worker_id]
+        states, kept = self.server.release(moving)
+        self.kept.update(kept)
+        send_message(self.writer, {'type': 'released', 'worker': self.worker_id, 'rooms': states, 'kept': kept})
+        if states:
+            print(f"Worker {self.worker_id}: handed {len(states)} rooms over")
+    
+    async def report(self):
+        while True:
+            rooms = self.server.rooms
+            # Kept rooms that have since been evicted no longer need routing here
+            gone = [room_id for room_id in self.kept if room_id not in rooms]
+            self.kept.difference_update(gone)
+            send_message(self.writer, {
+                'type': 'load',
+                'worker': self.worker_id,
+                'rooms': len(rooms),
+                'active_rooms': sum(1 for room in rooms.values() if not room.is_hibernating()),
+                'connections': sum(len(room.connections()) + room.spectator_count() for room in rooms.values()),
+                'gone': gone
+            })
+            await asyncio.sleep(LOAD_REPORT_INTERVAL)
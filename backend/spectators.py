@@ -0,0 +1,96 @@
+import asyncio
+from collections import deque
+from itertools import islice
+
+import websockets
+
+from protocol import KEYFRAME_INTERVAL
+
+# Frames kept per buffer; twice the keyframe interval always holds a keyframe
+FRAME_BUFFER_SIZE = 2 * KEYFRAME_INTERVAL
+
+
+class FrameBuffer:
+    def __init__(self, capacity=FRAME_BUFFER_SIZE):
+        """
+        Ring buffer of one room's encoded state frames, shared by its spectators.
+        
+        The producer appends each broadcast's frame once; every spectator
+        follows the buffer at its own pace with follow_frames(), so the tick
+        never does per-spectator work. Newcomers and spectators that fell
+        out of the buffer start over from the latest keyframe.
+        
+        Args:
+            capacity: Number of frames kept
+        """
+        self.frames = deque(maxlen=capacity)  # (seq, is_keyframe, payload)
+        self.keyframe_seq = None
+        # Bumped when the frames start over from an unrelated sequence (e.g. a relay reconnecting)
+        self.generation = 0
+        self.closed = False
+        # Close code followers send their spectators when the buffer closes (None to leave them connected)
+        self.close_code = None
+        self.appended = asyncio.Event()
+    
+    @property
+    def needs_keyframe(self):
+        """True if no keyframe is left to start a newcomer from."""
+        return self.keyframe_seq is None or self.frames[0][0] > self.keyframe_seq
+    
+    def append(self, seq, is_keyframe, payload):
+        self.frames.append((seq, is_keyframe, payload))
+        if is_keyframe:
+            self.keyframe_seq = seq
+        self.wake()
+    
+    def reset(self):
+        """Drop every frame; followers restart from the next keyframe."""
+        self.frames.clear()
+        self.keyframe_seq = None
+        self.generation += 1
+    
+    def close(self, code=None):
+        self.closed = True
+        self.close_code = code
+        self.wake()
+    
+    def wake(self):
+        # Waiters hold the old event; later waiters get a fresh one
+        appended, self.appended = self.appended, asyncio.Event()
+        appended.set()
+    
+    def frames_after(self, generation, seq):
+        """
+        Frames a follower that last sent seq (of generation) should send next.
+        
+        Returns [(seq, payload), ...], starting from the latest keyframe if
+        the follower is new or has fallen out of the buffer.
+        """
+        if self.needs_keyframe:
+            return []
+        first = self.frames[0][0]
+        last = self.frames[-1][0]
+        if generation == self.generation and seq is not None and first - 1 <= seq <= last:
+            start = seq + 1 - first
+        else:
+            start = self.keyframe_seq - first
+        return [(frame_seq, payload) for frame_seq, _, payload in islice(self.frames, start, None)]
+
+
+async def follow_frames(buffer, websocket):
+    """Send a buffer's frames to one spectator until either side closes."""
+    generation = None
+    seq = None
+    try:
+        while not buffer.closed:
+            frames = buffer.frames_after(generation, seq)
+            if not frames:
+                await buffer.appended.wait()
+                continue
+            generation = buffer.generation
+            for seq, payload in frames:
+                await websocket.send(payload)
+        if buffer.close_code is not None:
+            await websocket.close(buffer.close_code)
+    except websockets.exceptions.ConnectionClosed:
+        pass
@@ -0,0 +1,256 @@
+"""
+Headless tournaments: many MultiplayerSnakeGame matches across a process pool.
+
+Every pairing of a snake policy with a fruit policy plays --games matches.
+Each worker process plays its share of every pairing in a tight loop with its
+own seeded generator and streams results back in packed batches over a pipe,
+one message per BATCH_SIZE matches. The parent only concatenates batches, so
+throughput grows with the number of workers.
+
+Usage: python tournament.py [--games N] [--workers N] [--snake greedy,random] [--fruit evade,static]
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from array import array
+from collections import Counter
+from multiprocessing.connection import wait
+
+from bots import STEPS, evade
+from game_logic import MultiplayerSnakeGame
+
+# Matches a worker reports per message
+BATCH_SIZE = 256
+# Fields reported per match, as u32: pairing, score, ticks, length, died
+RESULT_FIELDS = 5
+# Ticks after which a match is stopped (a snake can circle forever)
+MAX_TICKS = 2000
+
+MOVES = dict(zip(('UP', 'DOWN', 'LEFT', 'RIGHT'), STEPS))
+
+
+def safe_moves(game):
+    """Directions that don't run the snake into a wall or its body on the next tick."""
+    head_x, head_y = game.snake[0]
+    moves = []
+    for name, (dx, dy) in MOVES.items():
+        position = (head_x + dx, head_y + dy)
+        if game.occupancy.in_bounds(position) and not game.occupancy.is_snake(position):
+            moves.append((name, position))
+    return moves
+
+
+def greedy_snake(game, rng):
+    """Head for the nearest fruit, never straight into a wall or the body."""
+    moves = safe_moves(game)
+    if not moves or not game.fruits:
+        return moves[0][0] if moves else None
+    fruits = list(game.fruits.values())
+    best = None
+    choices = []
+    for name, (x, y) in moves:
+        distance = min(abs(x - fx) + abs(y - fy) for fx, fy in fruits)
+        if best is None or distance < best:
+            best = distance
+            choices = [name]
+        elif distance == best:
+            choices.append(name)
+    return choices[0] if len(choices) == 1 else rng.choice(choices)
+
+
+def random_snake(game, rng):
+    """Any move that survives the next tick."""
+    moves = safe_moves(game)
+    return rng.choice(moves)[0] if moves else None
+
+
+def static_fruit(field, occupancy, position, rng):
+    """Never move."""
+    return None
+
+
+def wander_fruit(field, occupancy, position, rng):
+    """Step to a random neighbouring tile."""
+    dx, dy = rng.choice(STEPS)
+    return (position[0] + dx, position[1] + dy)
+
+
+SNAKE_POLICIES = {'greedy': greedy_snake, 'random': random_snake}
+FRUIT_POLICIES = {'evade': evade, 'static': static_fruit, 'wander': wander_fruit}
+
+
+def play_match(snake_policy, fruit_policy, fruits, grid_width, grid_height, max_ticks, rng):
+    """Play one match to the end (or max_ticks). Returns (score, ticks, length, died)."""
+    game = MultiplayerSnakeGame(grid_width, grid_height, seed=rng.getrandbits(64))
+    game.enable_bots(seed=rng.getrandbits(64))
+    for number in range(fruits):
+        game.add_fruit_bot(f'bot-{number}', fruit_policy)
+    ticks = 0
+    while not game.game_over and ticks < max_ticks:
+        game.move_bots()
+        direction = snake_policy(game, rng)
+        if direction is not None:
+            game.set_direction(direction)
+        game.update()
+        ticks += 1
+    return game.score, ticks, len(game.snake), int(game.game_over)
+
+
+def run_worker(worker, connection, pairings, games, options):
+    """
+    Play this worker's share of every pairing and send results in batches.
+    
+    Worker w of n plays every match number m with m % n == w, so the split
+    (and, with a given seed, every result) only depends on the worker count.
+    """
+    rng = random.Random(f"{options['seed']}-{worker}")
+    workers = options['workers']
+    batch = array('I')
+    for pairing, (snake_name, fruit_name) in enumerate(pairings):
+        snake_policy = SNAKE_POLICIES[snake_name]
+        fruit_policy = FRUIT_POLICIES[fruit_name]
+        for _ in range(worker, games, workers):
+            batch.append(pairing)
+            batch.extend(play_match(snake_policy, fruit_policy, options['fruits'], options['width'],
+                                    options['height'], options['max_ticks'], rng))
+            if len(batch) >= BATCH_SIZE * RESULT_FIELDS:
+                connection.send_bytes(batch)
+                batch = array('I')
+    if batch:
+        connection.send_bytes(batch)
+    # An empty message says the worker is done
+    connection.send_bytes(b'')
+    connection.close()
+
+
+def distribution(scores):
+    """Summary statistics and histogram of a list of scores."""
+    ordered = sorted(scores)
+    count = len(ordered)
+    mean = sum(ordered) / count
+    summary = {
+        'matches': count,
+        'mean': round(mean, 2),
+        'stdev': round(math.sqrt(sum((s - mean) ** 2 for s in ordered) / count), 2)
+    }
+    for point in (10, 50, 90, 99):
+        summary[f'p{point}'] = ordered[min(count - 1, max(0, round(point / 100 * count) - 1))]
+    summary['max'] = ordered[-1]
+    summary['histogram'] = dict(sorted(Counter(ordered).items()))
+    return summary
+
+
+def run_tournament(snakes, fruit_policies, games, workers, fruits=3, width=20, height=20,
+                   max_ticks=MAX_TICKS, seed=0):
+    """
+    Play games matches of every snake/fruit policy pairing over workers processes.
+    
+    Returns a dict with the score distribution of every pairing and the run's throughput.
+    """
+    if games < 1:
+        raise ValueError("games must be at least 1")
+    pairings = [(snake, fruit) for snake in snakes for fruit in fruit_policies]
+    options = {'workers': workers, 'fruits': fruits, 'width': width, 'height': height,
+               'max_ticks': max_ticks, 'seed': seed}
+    results = [array('I') for _ in pairings]
+    start = time.perf_counter()
+    processes = []
+    pipes = []
+    for worker in range(workers):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=run_worker, args=(worker, sender, pairings, games, options),
+                                          name=f'tournament-{worker}', daemon=True)
+        process.start()
+        sender.close()
+        processes.append(process)
+        pipes.append(receiver)
+    
+    while pipes:
+        for pipe in wait(pipes):
+            try:
+                data = pipe.recv_bytes()
+            except EOFError:
+                data = b''
+            if not data:
+                pipes.remove(pipe)
+                continue
+            batch = array('I')
+            batch.frombytes(data)
+            for offset in range(0, len(batch), RESULT_FIELDS):
+                results[batch[offset]].extend(batch[offset + 1:offset + RESULT_FIELDS])
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+    
+    report = []
+    total_ticks = 0
+    for (snake, fruit), fields in zip(pairings, results):
+        scores = fields[0::4]
+        ticks = fields[1::4]
+        total_ticks += sum(ticks)
+        report.append({
+            'snake': snake,
+            'fruit': fruit,
+            'score': distribution(scores),
+            'mean_ticks': round(sum(ticks) / len(ticks), 1),
+            'mean_length': round(sum(fields[2::4]) / len(ticks), 1),
+            'deaths': sum(fields[3::4])
+        })
+    matches = games * len(pairings)
+    return {
+        'workers': workers,
+        'matches': matches,
+        'seconds': round(elapsed, 3),
+        'matches_per_second': round(matches / elapsed, 1),
+        'ticks_per_second': round(total_ticks / elapsed),
+        'pairings': report
+    }
+
+
+def policy_list(names, policies):
+    chosen = names.split(',')
+    for name in chosen:
+        if name not in policies:
+            raise argparse.ArgumentTypeError(f"unknown policy {name!r} (choose from {', '.join(policies)})")
+    return chosen
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play headless snake matches across a process pool')
+    parser.add_argument('--games', type=positive_int, default=1000, help='matches per pairing')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes')
+    parser.add_argument('--snake', type=lambda names: policy_list(names, SNAKE_POLICIES), default=['greedy'],
+                        help=f"comma-separated snake policies ({', '.join(SNAKE_POLICIES)})")
+    parser.add_argument('--fruit', type=lambda names: policy_list(names, FRUIT_POLICIES), default=['evade'],
+                        help=f"comma-separated fruit policies ({', '.join(FRUIT_POLICIES)})")
+    parser.add_argument('--fruits', type=int, default=3, help='fruits per match')
+    parser.add_argument('--width', type=int, default=20, help='board width in tiles')
+    parser.add_argument('--height', type=int, default=20, help='board height in tiles')
+    parser.add_argument('--max-ticks', type=int, default=MAX_TICKS, help='ticks after which a match is stopped')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the whole tournament')
+    parser.add_argument('--no-histogram', action='store_true', help='leave score histograms out of the report')
+    args = parser.parse_args()
+    
+    report = run_tournament(args.snake, args.fruit, args.games, max(1, args.workers), args.fruits,
+                            args.width, args.height, args.max_ticks, args.seed)
+    if args.no_histogram:
+        for pairing in report['pairings']:
+            del pairing['score']['histogram']
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
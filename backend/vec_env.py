@@ -0,0 +1,176 @@
+import time
+import numpy as np
+
+# Actions use the same order as the Direction enum
+UP, DOWN, LEFT, RIGHT = 0, 1, 2, 3
+ACTION_DX = np.array([0, 0, -1, 1], dtype=np.int32)
+ACTION_DY = np.array([-1, 1, 0, 0], dtype=np.int32)
+OPPOSITE = np.array([DOWN, UP, RIGHT, LEFT], dtype=np.int8)
+
+# Cell values in observations
+CELL_EMPTY = 0
+CELL_BODY = 1
+CELL_HEAD = 2
+CELL_FOOD = 3
+
+# Vectorized rejection-sampling rounds before falling back to an exact draw
+FOOD_SAMPLING_ROUNDS = 8
+
+class VecSnakeEnv:
+    def __init__(self, num_envs=256, grid_width=20, grid_height=20,
+                 reward_food=1.0, reward_death=-1.0, seed=None):
+        """
+        Headless batch of snake games stepped together with NumPy.
+        
+        Follows the same rules as environment.SnakeGame.update: the snake starts
+        in the middle heading right, a reversing action is ignored, hitting the
+        border or any body segment (including the tail) ends the game, and
+        eating food grows the snake and respawns the food on a free tile.
+        Finished games are reset automatically.
+        
+        Args:
+            num_envs: Number of games in the batch
+            grid_width: Number of tiles horizontally
+            grid_height: Number of tiles vertically
+            reward_food: Reward for eating food
+            reward_death: Reward for the step that ends a game
+            seed: Seed for the batch's random generator
+        """
+        self.num_envs = num_envs
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.num_cells = grid_width * grid_height
+        self.reward_food = reward_food
+        self.reward_death = reward_death
+        self.rng = np.random.default_rng(seed)
+        
+        # Occupancy of body segments per game, cells flattened as y * width + x
+        self.grid = np.zeros((num_envs, self.num_cells), dtype=np.uint8)
+        # Ring buffer of body cells; the head is at head_ptr, the tail length - 1 slots behind
+        self.body = np.zeros((num_envs, self.num_cells), dtype=np.int32)
+        self.head_ptr = np.zeros(num_envs, dtype=np.int64)
+        self.length = np.zeros(num_envs, dtype=np.int64)
+        self.direction = np.zeros(num_envs, dtype=np.int8)
+        self.food = np.zeros(num_envs, dtype=np.int64)
+        self.score = np.zeros(num_envs, dtype=np.int64)
+        
+        self.rows = np.arange(num_envs)
+        self.reset()
+    
+    def reset(self):
+        """Reset every game. Returns the batched observations."""
+        self.reset_envs(self.rows)
+        return self.observe()
+    
+    def reset_envs(self, envs):
+        """Reset the given games to the starting position with fresh food."""
+        if len(envs) == 0:
+            return
+        start_x = self.grid_width // 2
+        start_y = self.grid_height // 2
+        start = start_y * self.grid_width + start_x
+        
+        self.grid[envs] = 0
+        # Tail to head: (start_x - 2, y), (start_x - 1, y), (start_x, y)
+        segments = np.array([start - 2, start - 1, start], dtype=np.int32)
+        self.body[envs, :3] = segments
+        self.grid[envs[:, None], segments[None, :]] = 1
+        self.head_ptr[envs] = 2
+        self.length[envs] = 3
+        self.direction[envs] = RIGHT
+        self.score[envs] = 0
+        self.food[envs] = self.sample_free_cells(envs)
+    
+    def sample_free_cells(self, envs):
+        """Uniformly random cell without a body segment for each game, -1 if the board is full."""
+        cells = self.rng.integers(0, self.num_cells, size=len(envs))
+        pending = np.flatnonzero(self.grid[envs, cells])
+        for _ in range(FOOD_SAMPLING_ROUNDS):
+            if len(pending) == 0:
+                return cells
+            retry = self.rng.integers(0, self.num_cells, size=len(pending))
+            cells[pending] = retry
+            pending = pending[self.grid[envs[pending], retry] != 0]
+        # Crowded boards: draw exactly from the free cells
+        for i in pending:
+            free = np.flatnonzero(self.grid[envs[i]] == 0)
+            cells[i] = self.rng.choice(free) if len(free) else -1
+        return cells
+    
+    def step(self, actions):
+        """
+        Advance every game by one move.
+        
+        Args:
+            actions: Array of num_envs ints (UP, DOWN, LEFT or RIGHT)
+        
+        Returns:
+            (observations, rewards, dones, infos). Games that ended are reset
+            before observing, and infos['score'] holds their final score.
+        """
+        actions = np.asarray(actions, dtype=np.int8)
+        rows = self.rows
+        
+        # Ignore actions that would reverse into the body
+        turn = actions != OPPOSITE[self.direction]
+        self.direction = np.where(turn, actions, self.direction)
+        
+        head = self.body[rows, self.head_ptr]
+        x = head % self.grid_width + ACTION_DX[self.direction]
+        y = head // self.grid_width + ACTION_DY[self.direction]
+        
+        # Border collision, then collision with any segment (the tail hasn't moved yet)
+        dead = (x < 0) | (x >= self.grid_width) | (y < 0) | (y >= self.grid_height)
+        new_head = np.where(dead, 0, y * self.grid_width + x)
+        dead |= self.grid[rows, new_head] != 0
+        alive = np.flatnonzero(~dead)
+        new_head = new_head[alive]
+        
+        ate = new_head == self.food[alive]
+        movers = alive[~ate]
+        eaters = alive[ate]
+        
+        # Tail follows the head unless food was eaten
+        tail_ptr = (self.head_ptr[movers] - self.length[movers] + 1) % self.num_cells
+        self.grid[movers, self.body[movers, tail_ptr]] = 0
+        self.length[eaters] += 1
+        
+        head_ptr = (self.head_ptr[alive] + 1) % self.num_cells
+        self.head_ptr[alive] = head_ptr
+        self.body[alive, head_ptr] = new_head
+        self.grid[alive, new_head] = 1
+        
+        self.score[eaters] += 10
+        if len(eaters):
+            self.food[eaters] = self.sample_free_cells(eaters)
+        
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        rewards[eaters] = self.reward_food
+        
+        # A snake that fills the board leaves nowhere for food; that game is over too
+        dead[eaters[self.food[eaters] < 0]] = True
+        rewards[dead] = self.reward_death
+        
+        final_scores = np.where(dead, self.score, 0)
+        self.reset_envs(np.flatnonzero(dead))
+        return self.observe(), rewards, dead, {'score': final_scores}
+    
+    def observe(self):
+        """Batched (num_envs, grid_height, grid_width) uint8 boards of CELL_* values."""
+        obs = self.grid.copy()
+        rows = self.rows
+        obs[rows, self.body[rows, self.head_ptr]] = CELL_HEAD
+        obs[rows, self.food] = CELL_FOOD
+        return obs.reshape(self.num_envs, self.grid_height, self.grid_width)
+
+if __name__ == "__main__":
+    # Measure stepping throughput with random actions
+    env = VecSnakeEnv(num_envs=4096, grid_width=20, grid_height=20, seed=0)
+    env.reset()
+    steps = 200
+    actions = env.rng.integers(0, 4, size=(steps, env.num_envs))
+    start = time.perf_counter()
+    for i in range(steps):
+        env.step(actions[i])
+    elapsed = time.perf_counter() - start
+    print(f"{steps * env.num_envs / elapsed:,.0f} env-steps/s ({env.num_envs} envs)")
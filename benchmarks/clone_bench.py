@@ -0,0 +1,51 @@
+"""
+Measure clone+step and snapshot+step+restore costs for growing snake lengths.
+
+Usage: python benchmarks/clone_bench.py [--width 100] [--height 100] [--lengths 3,300,3000,9000]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from codec_bench import build_game
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--width', type=int, default=100)
+    parser.add_argument('--height', type=int, default=100)
+    parser.add_argument('--lengths', default='3,300,3000,9000')
+    parser.add_argument('--fruits', type=int, default=100)
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    results = {'width': args.width, 'height': args.height, 'fruits': args.fruits, 'runs': []}
+    for length in (int(value) for value in args.lengths.split(',')):
+        game = build_game(args.width, args.height, length, args.fruits)
+        # The serpentine head points into the free rows above it
+        game.set_direction('UP')
+
+        def clone_step():
+            clone = game.clone()
+            clone.update()
+
+        def rollout():
+            snapshot = game.snapshot()
+            game.update()
+            game.restore(snapshot)
+
+        run = {'snake': len(game.snake)}
+        for name, fn in (('clone_step', clone_step), ('snapshot_step_restore', rollout)):
+            seconds = timeit.timeit(fn, number=args.number) / args.number
+            run[f'{name}_us'] = round(seconds * 1e6, 2)
+        game.release_snapshots()
+        results['runs'].append(run)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
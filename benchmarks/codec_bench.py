@@ -0,0 +1,75 @@
+"""
+Compare the JSON and binary wire encodings on a large board.
+
+Usage: python benchmarks/codec_bench.py [--width 100] [--height 100] [--snake 3000] [--fruits 100]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from codec import BinaryCodec, HandleRegistry, JsonCodec
+from game_logic import MultiplayerSnakeGame
+from protocol import DeltaStream
+
+
+def build_game(width, height, snake_length, fruits):
+    """Game with a serpentine snake of the given length and some fruit players."""
+    game = MultiplayerSnakeGame(width, height, track_changes=True)
+    cells = []
+    for y in range(height - 1, -1, -1):
+        row = range(width) if (height - 1 - y) % 2 == 0 else range(width - 1, -1, -1)
+        cells.extend((x, y) for x in row)
+        if len(cells) >= snake_length:
+            break
+    # Head is the last cell laid down
+    game.lay_snake(cells[:snake_length][::-1])
+    for i in range(fruits):
+        game.add_fruit_player(f'player-{i:08d}-0000-0000-0000-000000000000')
+    return game
+
+
+def measure(codec, message, number):
+    payload = codec.encode(message)
+    seconds = timeit.timeit(lambda: codec.encode(message), number=number) / number
+    return len(payload), seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--width', type=int, default=100)
+    parser.add_argument('--height', type=int, default=100)
+    parser.add_argument('--snake', type=int, default=3000)
+    parser.add_argument('--fruits', type=int, default=100)
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+
+    game = build_game(args.width, args.height, args.snake, args.fruits)
+    stream = DeltaStream(game)
+    stream.advance()
+    keyframe = stream.keyframe()
+
+    # A typical tick: the head moves, the tail follows and one fruit moves
+    game.set_direction('UP')
+    game.update()
+    fruit = next(iter(game.fruits))
+    x, y = game.fruits[fruit]
+    game.update_fruit_position(fruit, (x + 1) % args.width, y)
+    stream.advance()
+    delta = stream.delta()
+
+    codecs = [JsonCodec(), BinaryCodec(HandleRegistry())]
+    results = {'width': args.width, 'height': args.height, 'snake': len(game.snake), 'fruits': len(game.fruits)}
+    for name, message in (('keyframe', keyframe), ('delta', delta)):
+        for codec in codecs:
+            size, seconds = measure(codec, message, args.number)
+            results[f'{name}_{codec.name}_bytes'] = size
+            results[f'{name}_{codec.name}_us'] = round(seconds * 1e6, 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Helpers shared by the benchmark scripts."""
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+
+def run_info():
+    """Where and on what a benchmark ran, so results can be compared across versions."""
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        'revision': revision,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z')
+    }
+
+
+def percentiles(values, points=(50, 99, 99.9)):
+    """Nearest-rank percentiles of values, keyed 'p50', 'p99', 'p999'..."""
+    ordered = sorted(values)
+    result = {}
+    for point in points:
+        key = 'p' + f'{point:g}'.replace('.', '')
+        if not ordered:
+            result[key] = None
+            continue
+        rank = min(len(ordered) - 1, max(0, int(round(point / 100 * len(ordered))) - 1))
+        result[key] = ordered[rank]
+    return result
+
+
+def summarize(values, scale=1.0, digits=3):
+    """Count, mean, percentiles and max of a sample, multiplied by scale."""
+    if not values:
+        return {'count': 0}
+    summary = {'count': len(values), 'mean': round(sum(values) / len(values) * scale, digits)}
+    for key, value in percentiles(values).items():
+        summary[key] = round(value * scale, digits)
+    summary['max'] = round(max(values) * scale, digits)
+    return summary
+
+
+def rss_bytes():
+    """Resident set size of this process."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        # Peak rather than current RSS, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
@@ -0,0 +1,350 @@
+"""
+Load-test GameServer with one simulated host and N simulated fruit players.
+
+The server runs in a child process so its CPU and memory are measured apart
+from the clients. Results are printed as JSON.
+
+Usage: python benchmarks/load_bench.py [--fruits 1000] [--duration 10] [--click-rate 2] [--host-rate 1]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import socket
+import struct
+import sys
+import time
+
+from common import BACKEND, rss_bytes, run_info, summarize
+
+sys.path.insert(0, BACKEND)
+
+import websockets
+
+import room as room_module
+from codec import MSG_DELTA, MSG_GAME_OVER, MSG_STATE
+from server import GameServer
+
+ROOM = 'bench'
+SEQ = struct.Struct('<I')
+# Simultaneous connection attempts while clients are joining
+CONNECT_CONCURRENCY = 100
+
+
+def raise_file_limit():
+    """Allow as many sockets as the hard limit permits."""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+class ServerProbe:
+    def __init__(self):
+        """Timings collected inside the server process."""
+        self.measuring = False
+        self.tick_starts = []
+        self.tick_cpu = []
+        self.game_overs = set()  # indexes into tick_starts of ticks that ended a game
+        self.sent = {}  # seq -> monotonic time its state was broadcast
+
+    def instrument(self, room):
+        tick = room.tick
+        broadcast = room.broadcast_game_state
+
+        def timed_tick():
+            start = time.monotonic()
+            cpu = time.process_time()
+            tick()
+            if self.measuring:
+                self.tick_starts.append(start)
+                self.tick_cpu.append(time.process_time() - cpu)
+                if room.game.game_over:
+                    self.game_overs.add(len(self.tick_starts) - 1)
+
+        def timed_broadcast():
+            start = time.monotonic()
+            broadcast()
+            if self.measuring:
+                self.sent[room.delta_stream.seq] = start
+
+        # Rooms schedule self.tick, so instance attributes take over from here on
+        room.tick = timed_tick
+        room.broadcast_game_state = timed_broadcast
+
+
+async def serve(port, args, pipe):
+    room_module.MAX_FRUIT_PLAYERS = max(room_module.MAX_FRUIT_PLAYERS, args.fruits)
+    server = GameServer(args.width, args.height)
+    probe = ServerProbe()
+    loop = asyncio.get_running_loop()
+
+    get_room = server.get_room
+    def get_bench_room(room_id):
+        room = server.rooms.get(room_id)
+        if room is None:
+            room = get_room(room_id)
+            room.game_speed = args.tick
+            probe.instrument(room)
+        return room
+    server.get_room = get_bench_room
+
+    compression = None if args.no_compression else 'deflate'
+    async with websockets.serve(server.handle_client, 'localhost', port, max_queue=None,
+                                compression=compression):
+        pipe.send({'rss': rss_bytes()})
+        # Clients connect, then the measurement window opens
+        await loop.run_in_executor(None, pipe.recv)
+        rss_connected = rss_bytes()
+        probe.measuring = True
+        cpu_start = time.process_time()
+        wall_start = time.monotonic()
+        await loop.run_in_executor(None, pipe.recv)
+        probe.measuring = False
+        cpu = time.process_time() - cpu_start
+        wall = time.monotonic() - wall_start
+
+        room = server.rooms.get(ROOM)
+        dropped_inbound = sum(connection.dropped_inbound for connection in room.connections()) if room else 0
+        pipe.send({
+            'rss_connected': rss_connected,
+            'cpu': cpu,
+            'wall': wall,
+            'tick_starts': probe.tick_starts,
+            'tick_cpu': probe.tick_cpu,
+            'game_overs': sorted(probe.game_overs),
+            'sent': probe.sent,
+            'overruns': room.overruns if room else 0,
+            'skipped_ticks': room.skipped_ticks if room else 0,
+            'dropped_inbound': dropped_inbound
+        })
+        server.close()
+
+
+def run_server(port, args, pipe):
+    # Keep the server's connection logging out of the JSON on stdout
+    sys.stdout = sys.stderr
+    asyncio.run(serve(port, args, pipe))
+
+
+class SimulatedClient:
+    def __init__(self, kind, args, rng, stats):
+        """
+        One websocket client: reads every frame and sends inputs at a fixed rate.
+
+        Args:
+            kind: 'host' or 'fruit_player'
+            args: Parsed command line options
+            rng: Random generator for the inputs
+            stats: LoadStats shared by every client
+        """
+        self.kind = kind
+        self.args = args
+        self.rng = rng
+        self.stats = stats
+        self.websocket = None
+        self.bytes_received = 0
+        self.grid = (args.width, args.height)
+
+    async def connect(self, url):
+        compression = None if self.args.no_compression else 'deflate'
+        self.websocket = await websockets.connect(url, max_queue=None, open_timeout=60,
+                                                  compression=compression)
+        await self.websocket.send(json.dumps({
+            'type': self.kind,
+            'protocol': self.args.protocol,
+            'encoding': self.args.encoding,
+            'room': ROOM
+        }))
+
+    async def receive(self):
+        binary = self.args.encoding == 'binary'
+        stats = self.stats
+        try:
+            async for message in self.websocket:
+                now = time.monotonic()
+                if isinstance(message, bytes):
+                    msg_type = message[0]
+                    seq = SEQ.unpack_from(message, 1)[0] if msg_type in (MSG_STATE, MSG_DELTA) else None
+                    game_over = msg_type == MSG_GAME_OVER
+                elif binary and self.kind == 'fruit_player':
+                    # Only registration messages stay text on the binary encoding
+                    continue
+                else:
+                    data = json.loads(message)
+                    seq = data.get('seq')
+                    game_over = data.get('type') == 'game_over'
+
+                # The host restarts finished games so the room keeps ticking
+                if game_over and self.kind == 'host':
+                    await self.websocket.send(json.dumps({'type': 'reset'}))
+                if stats.measuring:
+                    self.bytes_received += len(message)
+                    if seq is not None:
+                        stats.receipts.append((seq, now))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def send_inputs(self):
+        rate = self.args.host_rate if self.kind == 'host' else self.args.click_rate
+        if rate <= 0:
+            return
+        interval = 1.0 / rate
+        # Spread clients over the interval so inputs don't arrive in lockstep
+        await asyncio.sleep(self.rng.random() * interval)
+        try:
+            while True:
+                if self.kind == 'host':
+                    message = {'type': 'direction', 'direction': self.rng.choice(('UP', 'DOWN', 'LEFT', 'RIGHT'))}
+                else:
+                    message = {'type': 'move', 'x': self.rng.randrange(self.grid[0]),
+                               'y': self.rng.randrange(self.grid[1])}
+                await self.websocket.send(json.dumps(message))
+                self.stats.inputs_sent += 1
+                await asyncio.sleep(interval)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+
+class LoadStats:
+    def __init__(self):
+        """Measurements shared by every simulated client."""
+        self.measuring = False
+        self.receipts = []  # (seq, monotonic time received)
+        self.inputs_sent = 0
+
+
+async def run_clients(port, args, pipe):
+    url = f'ws://localhost:{port}'
+    stats = LoadStats()
+    rng = random.Random(args.seed)
+    loop = asyncio.get_running_loop()
+
+    host = SimulatedClient('host', args, random.Random(rng.random()), stats)
+    fruits = [SimulatedClient('fruit_player', args, random.Random(rng.random()), stats)
+              for _ in range(args.fruits)]
+    clients = [host] + fruits
+    tasks = []
+    limit = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+    async def connect(client):
+        async with limit:
+            await client.connect(url)
+        # Read from the start so no client builds up a backlog while others join
+        tasks.append(asyncio.create_task(client.receive()))
+
+    joined = time.monotonic()
+    await connect(host)
+    await asyncio.gather(*(connect(client) for client in fruits))
+    print(f"{len(clients)} clients connected in {time.monotonic() - joined:.1f}s", file=sys.stderr)
+
+    tasks += [asyncio.create_task(client.send_inputs()) for client in clients]
+    await asyncio.sleep(args.warmup)
+
+    # Measurement window
+    await loop.run_in_executor(None, pipe.send, 'start')
+    stats.measuring = True
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    await asyncio.sleep(args.duration)
+    stats.measuring = False
+    client_cpu = time.process_time() - cpu_start
+    wall = time.monotonic() - wall_start
+    await loop.run_in_executor(None, pipe.send, 'stop')
+    server_stats = await loop.run_in_executor(None, pipe.recv)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*(client.websocket.close() for client in clients), return_exceptions=True)
+
+    return stats, server_stats, clients, client_cpu, wall
+
+
+def report(args, baseline_rss, stats, server_stats, clients, client_cpu, wall):
+    # Tick period jitter: intervals between tick starts, minus the pauses
+    # between a game ending and the host resetting it
+    starts = server_stats['tick_starts']
+    game_overs = set(server_stats['game_overs'])
+    intervals = [starts[i] - starts[i - 1] for i in range(1, len(starts)) if i - 1 not in game_overs]
+    jitter = [abs(interval - args.tick) for interval in intervals]
+
+    sent = server_stats['sent']
+    latencies = [received - sent[seq] for seq, received in stats.receipts if seq in sent]
+
+    ticks = len(starts)
+    fruit_bytes = [client.bytes_received / wall for client in clients[1:]]
+    connections = len(clients)
+    return {
+        'benchmark': 'load',
+        'run': run_info(),
+        'params': vars(args),
+        'ticks': ticks,
+        'tick_interval_ms': summarize(intervals, scale=1e3),
+        'tick_jitter_ms': summarize(jitter, scale=1e3),
+        'overruns': server_stats['overruns'],
+        'skipped_ticks': server_stats['skipped_ticks'],
+        'state_latency_ms': summarize(latencies, scale=1e3),
+        'frames_received': len(stats.receipts),
+        'host_bytes_per_s': round(clients[0].bytes_received / wall),
+        'fruit_bytes_per_client_per_s': round(sum(fruit_bytes) / len(fruit_bytes)) if fruit_bytes else None,
+        'inputs_sent': stats.inputs_sent,
+        'inputs_dropped_by_rate_limit': server_stats['dropped_inbound'],
+        'server_cpu_per_tick_ms': round(server_stats['cpu'] / ticks * 1e3, 3) if ticks else None,
+        'tick_callback_cpu_ms': summarize(server_stats['tick_cpu'], scale=1e3),
+        'server_cpu_utilization': round(server_stats['cpu'] / server_stats['wall'], 3),
+        # Near 1.0 means the clients, not the server, limited the measurements
+        'client_cpu_utilization': round(client_cpu / wall, 3),
+        'server_rss_bytes': server_stats['rss_connected'],
+        'server_rss_per_connection_bytes': round((server_stats['rss_connected'] - baseline_rss) / connections)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--fruits', type=int, default=1000, help='simulated fruit players')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds measured')
+    parser.add_argument('--warmup', type=float, default=2.0, help='seconds run before measuring')
+    parser.add_argument('--click-rate', type=float, default=2.0, help='moves per second per fruit player')
+    parser.add_argument('--host-rate', type=float, default=1.0, help='direction changes per second')
+    parser.add_argument('--tick', type=float, default=0.15, help='seconds between game updates')
+    parser.add_argument('--protocol', choices=('full', 'delta'), default='delta')
+    parser.add_argument('--encoding', choices=('json', 'binary'), default='binary')
+    parser.add_argument('--width', type=int, default=20)
+    parser.add_argument('--height', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-compression', action='store_true',
+                        help='turn off permessage-deflate (server.py leaves it on)')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    args = parser.parse_args()
+
+    raise_file_limit()
+    port = free_port()
+    pipe, child_pipe = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=run_server, args=(port, args, child_pipe), daemon=True)
+    server.start()
+    try:
+        baseline_rss = pipe.recv()['rss']
+        measurements = asyncio.run(run_clients(port, args, pipe))
+    finally:
+        server.join(timeout=10)
+        if server.is_alive():
+            server.terminate()
+
+    output = json.dumps(report(args, baseline_rss, *measurements), indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Microbenchmarks for the per-tick server work: update, fruit bots, get_game_state, broadcast_game_state
+and arena updates.
+
+Usage: python benchmarks/micro_bench.py [--width 100] [--height 100] [--snake 3000] [--fruits 100] [--clients 100]
+                                       [--bots 300] [--arena-snakes 50]
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import timeit
+
+from common import BACKEND, run_info, summarize
+
+sys.path.insert(0, BACKEND)
+
+from arena import SnakeArena
+from codec_bench import build_game
+from connection import ClientConnection
+from room import Room
+from scheduler import TickScheduler
+
+# Updates timed between two restores of the starting position
+UPDATE_BATCH = 50
+
+
+class NullWebSocket:
+    """Stands in for a client socket; broadcasts only enqueue, so it is never written to."""
+
+    async def send(self, payload):
+        pass
+
+    async def close(self):
+        pass
+
+
+def bench_update(game, batches):
+    """Per-update times, rolling back to the starting position between batches."""
+    samples = []
+    snapshot = game.snapshot()
+    for _ in range(batches):
+        for _ in range(UPDATE_BATCH):
+            start = time.perf_counter()
+            game.update()
+            samples.append(time.perf_counter() - start)
+        game.restore(snapshot)
+    game.release_snapshots()
+    return samples
+
+
+def bench_bots(args):
+    """Per-tick times of moving args.bots fruit bots, each tick after the snake has moved."""
+    game = build_game(args.width, args.height, args.snake, 0)
+    game.set_direction('UP')
+    game.enable_bots(seed=0)
+    for i in range(args.bots):
+        game.add_fruit_bot(f'bot-{i}')
+    samples = []
+    snapshot = game.snapshot()
+    for _ in range(args.batches):
+        for _ in range(UPDATE_BATCH):
+            start = time.perf_counter()
+            game.move_bots()
+            samples.append(time.perf_counter() - start)
+            game.update()
+        game.restore(snapshot)
+    game.release_snapshots()
+    return samples
+
+
+def bench_arena(args):
+    """Per-update times of an arena with args.arena_snakes snakes turning at random."""
+    arena = SnakeArena(args.width, args.height, seed=0)
+    for i in range(args.fruits):
+        arena.add_fruit_player(f'fruit-{i}')
+    for _ in range(args.arena_snakes):
+        arena.add_snake()
+    rng = random.Random(0)
+    directions = ('UP', 'DOWN', 'LEFT', 'RIGHT')
+    samples = []
+    for _ in range(args.batches * UPDATE_BATCH):
+        for snake in arena.snakes.values():
+            # Eliminated snakes come straight back so the arena stays full
+            if not snake.alive:
+                arena.respawn(snake.snake_id)
+            elif rng.random() < 0.2:
+                arena.steer(snake.snake_id, rng.choice(directions))
+        start = time.perf_counter()
+        arena.update()
+        samples.append(time.perf_counter() - start)
+        arena.eliminations.clear()
+    return samples
+
+
+def bench_get_game_state(game, number):
+    return timeit.repeat(game.get_game_state, number=1, repeat=number)
+
+
+async def bench_broadcast(args, protocol, encoding):
+    """Per-broadcast times for a room with args.clients connections after a real update."""
+    room = Room('bench', TickScheduler(), args.width, args.height)
+    room.game = game = build_game(args.width, args.height, args.snake, 0)
+    room.delta_stream.game = game
+    connections = []
+    for i in range(args.clients):
+        connection = ClientConnection(NullWebSocket(), protocol, encoding)
+        player_id = f'player-{i:08d}-0000-0000-0000-000000000000'
+        room.fruit_connections[player_id] = connection
+        if i < args.fruits:
+            game.add_fruit_player(player_id)
+        connections.append(connection)
+    room.host_connection = ClientConnection(NullWebSocket(), protocol, encoding)
+    connections.append(room.host_connection)
+    game.set_direction('UP')
+    room.broadcast_game_state()
+
+    samples = []
+    snapshot = game.snapshot()
+    fruit = next(iter(game.fruits), None)
+    for batch in range(args.batches):
+        for _ in range(UPDATE_BATCH):
+            # A typical tick: one fruit moves, the snake moves
+            if fruit is not None:
+                x, y = game.fruits[fruit]
+                game.update_fruit_position(fruit, (x + 1) % args.width, y)
+            game.update()
+            start = time.perf_counter()
+            room.broadcast_game_state()
+            samples.append(time.perf_counter() - start)
+            # Keep queues empty as if every sender had kept up
+            for connection in connections:
+                connection.outbound.clear()
+                connection.queued_frames = 0
+        game.restore(snapshot)
+
+    for connection in connections:
+        connection.close()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--width', type=int, default=100)
+    parser.add_argument('--height', type=int, default=100)
+    parser.add_argument('--snake', type=int, default=3000)
+    parser.add_argument('--fruits', type=int, default=100)
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--bots', type=int, default=300)
+    parser.add_argument('--arena-snakes', type=int, default=50)
+    parser.add_argument('--batches', type=int, default=20)
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    args = parser.parse_args()
+
+    game = build_game(args.width, args.height, args.snake, args.fruits)
+    # The serpentine head points into the free rows above it
+    game.set_direction('UP')
+
+    results = {
+        'benchmark': 'micro',
+        'run': run_info(),
+        'params': vars(args),
+        'update_us': summarize(bench_update(game, args.batches), scale=1e6),
+        'bots_us': summarize(bench_bots(args), scale=1e6),
+        'arena_update_us': summarize(bench_arena(args), scale=1e6),
+        'get_game_state_us': summarize(bench_get_game_state(game, args.batches * UPDATE_BATCH), scale=1e6)
+    }
+    for protocol in ('full', 'delta'):
+        for encoding in ('json', 'binary'):
+            samples = asyncio.run(bench_broadcast(args, protocol, encoding))
+            results[f'broadcast_{protocol}_{encoding}_us'] = summarize(samples, scale=1e6)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+// Arena frames shared by host.html and fruit_player.html.
+// Mirrors backend/arena.py: 'arena_state' keyframes and 'arena_delta' diffs, always JSON.
+
+// Arena from a keyframe: snakes by id, each with its body (head first), score, alive flag and input ack
+function arenaFromState(state) {
+    const snakes = new Map();
+    for (const snake of state.snakes) {
+        snakes.set(snake.id, snake);
+    }
+    return { seq: state.seq, snakes, fruits: state.fruits };
+}
+
+// Apply a diff in place. Returns false if a frame was missed and the arena needs a keyframe.
+function applyArenaDelta(arena, delta) {
+    if (delta.seq !== arena.seq + 1) return false;
+    arena.seq = delta.seq;
+
+    for (const id of delta.left || []) {
+        arena.snakes.delete(id);
+    }
+    for (const [id, eliminatedBy, score] of delta.eliminated || []) {
+        const snake = arena.snakes.get(id) || { id, ack: null };
+        arena.snakes.set(id, { ...snake, body: [], score, alive: false, eliminated_by: eliminatedBy });
+    }
+    for (const snake of delta.spawned || []) {
+        arena.snakes.set(snake.id, snake);
+    }
+    for (const [id, pushed, popped, score, ack] of delta.moves || []) {
+        const snake = arena.snakes.get(id);
+        for (const cell of pushed) {
+            snake.body.unshift(cell);
+        }
+        if (popped) {
+            snake.body.length -= popped;
+        }
+        snake.score = score;
+        snake.ack = ack;
+    }
+    // Removals first: a fruit may be placed again in the same delta
+    for (const playerId of delta.removed || []) {
+        delete arena.fruits[playerId];
+    }
+    Object.assign(arena.fruits, delta.fruits || {});
+    return true;
+}
+
+// Every snake in the arena except the one with skipId, as { id, body }
+function arenaSnakes(arena, skipId) {
+    const snakes = [];
+    for (const snake of arena.snakes.values()) {
+        if (snake.id === skipId || snake.body.length === 0) continue;
+        snakes.push({ id: snake.id, body: snake.body });
+    }
+    return snakes;
+}
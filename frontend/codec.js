@@ -0,0 +1,159 @@
+// Binary wire encoding shared by host.html and fruit_player.html.
+// Mirrors backend/codec.py: little-endian, u16 coordinates, u16 player handles.
+
+const MSG_STATE = 0x01;
+const MSG_DELTA = 0x02;
+const MSG_GAME_OVER = 0x03;
+const MSG_VIEW = 0x04;
+const MSG_DIRECTION = 0x10;
+const MSG_MOVE = 0x11;
+const MSG_RESET = 0x12;
+const MSG_RESYNC = 0x13;
+
+const FLAG_GAME_OVER = 0x01;
+const FLAG_RESET = 0x02;
+
+const DIRECTIONS = ['UP', 'DOWN', 'LEFT', 'RIGHT'];
+
+function readCells(view, offset, count) {
+    const cells = new Array(count);
+    for (let i = 0; i < count; i++) {
+        cells[i] = [view.getUint16(offset, true), view.getUint16(offset + 2, true)];
+        offset += 4;
+    }
+    return [cells, offset];
+}
+
+function readHandles(view, offset) {
+    const count = view.getUint16(offset, true);
+    offset += 2;
+    const handles = [];
+    for (let i = 0; i < count; i++) {
+        handles.push(view.getUint16(offset, true));
+        offset += 2;
+    }
+    return [handles, offset];
+}
+
+function readFruits(view, offset) {
+    const count = view.getUint16(offset, true);
+    offset += 2;
+    const fruits = {};
+    for (let i = 0; i < count; i++) {
+        // Fruits are keyed by player handle instead of player id
+        fruits[view.getUint16(offset, true)] = [view.getUint16(offset + 2, true), view.getUint16(offset + 4, true)];
+        offset += 6;
+    }
+    return [fruits, offset];
+}
+
+// Decode a binary server frame into the same shape as the JSON messages
+function decodeBinary(buffer) {
+    const view = new DataView(buffer);
+    const type = view.getUint8(0);
+
+    if (type === MSG_STATE) {
+        const snakeLength = view.getUint32(14, true);
+        const [snake, offset] = readCells(view, 22, snakeLength);
+        const [fruits] = readFruits(view, offset);
+        return {
+            type: 'game_state',
+            seq: view.getUint32(1, true),
+            score: view.getUint32(5, true),
+            game_over: (view.getUint8(9) & FLAG_GAME_OVER) !== 0,
+            grid_width: view.getUint16(10, true),
+            grid_height: view.getUint16(12, true),
+            ack: view.getUint32(18, true),
+            snake,
+            fruits
+        };
+    }
+
+    if (type === MSG_DELTA) {
+        let offset = 16;
+        let push;
+        [push, offset] = readCells(view, offset, view.getUint16(10, true));
+        const pop = view.getUint16(offset, true);
+        let fruits;
+        [fruits, offset] = readFruits(view, offset + 2);
+        const [removed] = readHandles(view, offset);
+        return {
+            type: 'game_delta',
+            seq: view.getUint32(1, true),
+            score: view.getUint32(5, true),
+            game_over: (view.getUint8(9) & FLAG_GAME_OVER) !== 0,
+            ack: view.getUint32(12, true),
+            push,
+            pop,
+            fruits,
+            removed
+        };
+    }
+
+    if (type === MSG_VIEW) {
+        let offset = 22;
+        let snakeEnter, snakeLeave, fruits;
+        [snakeEnter, offset] = readCells(view, offset + 2, view.getUint16(offset, true));
+        [snakeLeave, offset] = readCells(view, offset + 2, view.getUint16(offset, true));
+        [fruits, offset] = readFruits(view, offset);
+        const [fruitsLeave] = readHandles(view, offset);
+        const flags = view.getUint8(9);
+        return {
+            type: 'game_view',
+            seq: view.getUint32(1, true),
+            score: view.getUint32(5, true),
+            game_over: (flags & FLAG_GAME_OVER) !== 0,
+            reset: (flags & FLAG_RESET) !== 0,
+            view: [view.getUint16(10, true), view.getUint16(12, true), view.getUint16(14, true), view.getUint16(16, true)],
+            ack: view.getUint32(18, true),
+            snake_enter: snakeEnter,
+            snake_leave: snakeLeave,
+            fruits,
+            fruits_leave: fruitsLeave
+        };
+    }
+
+    if (type === MSG_GAME_OVER) {
+        return { type: 'game_over', score: view.getUint32(1, true) };
+    }
+
+    return { type: 'unknown' };
+}
+
+// Encode a client message as a binary frame
+function encodeBinary(message) {
+    if (message.type === 'direction') {
+        if (message.seq === undefined) {
+            return new Uint8Array([MSG_DIRECTION, DIRECTIONS.indexOf(message.direction)]).buffer;
+        }
+        const view = new DataView(new ArrayBuffer(6));
+        view.setUint8(0, MSG_DIRECTION);
+        view.setUint8(1, DIRECTIONS.indexOf(message.direction));
+        view.setUint32(2, message.seq, true);
+        return view.buffer;
+    }
+    if (message.type === 'move') {
+        const view = new DataView(new ArrayBuffer(5));
+        view.setUint8(0, MSG_MOVE);
+        view.setUint16(1, message.x, true);
+        view.setUint16(3, message.y, true);
+        return view.buffer;
+    }
+    if (message.type === 'reset') {
+        return new Uint8Array([MSG_RESET]).buffer;
+    }
+    if (message.type === 'resync') {
+        return new Uint8Array([MSG_RESYNC]).buffer;
+    }
+    return JSON.stringify(message);
+}
+
+// Decode any server frame: text frames are JSON, binary frames use the headers above
+function decodeMessage(data) {
+    return typeof data === 'string' ? JSON.parse(data) : decodeBinary(data);
+}
+
+// Encode a client message for the negotiated encoding ('json' or 'binary')
+function encodeMessage(message, encoding) {
+    return encoding === 'binary' ? encodeBinary(message) : JSON.stringify(message);
+}
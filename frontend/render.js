@@ -0,0 +1,271 @@
+// Canvas renderer shared by host.html and fruit_player.html.
+// The checkerboard is drawn once to offscreen canvases and copied back cell by
+// cell; messages only set what the board should show, and the canvas catches up
+// on the next animation frame, repainting just the cells that changed. Snakes
+// that moved one step slide into their new head and out of their old tail over
+// the time between ticks.
+
+// Bounds on the time a step is spread over, in ms
+const MIN_STEP_TIME = 30;
+const MAX_STEP_TIME = 1000;
+
+class BoardRenderer {
+    constructor(canvas, colors) {
+        this.canvas = canvas;
+        this.ctx = canvas.getContext('2d');
+        this.colors = colors; // { light, dark, border }
+        this.originX = 0;
+        this.originY = 0;
+        this.columns = 0;
+        this.rows = 0;
+        this.tileSize = 0;
+        // Checkerboards of the view, one for each parity of its origin
+        this.backgrounds = [null, null];
+        this.background = null;
+        // Cell key -> color: what the board should show, and what the canvas shows
+        this.target = new Map();
+        this.painted = new Map();
+        this.targetChanged = false;
+        this.fullRedraw = true;
+        // Snake id -> { head, tail, length } as of the last show(), to spot single steps
+        this.bodies = new Map();
+        // Head and tail cells sliding in and out, and the cells they hold back from the steady board
+        this.animations = [];
+        this.held = new Set();
+        // Cells of animations cut short by the next step, cleared on the next frame
+        this.stale = [];
+        this.stepStart = 0;
+        this.stepTime = 150;
+        this.lastStep = null;
+        this.scheduled = false;
+        this.frame = this.frame.bind(this);
+    }
+
+    // Board area on the canvas; a new size rebuilds the checkerboards, a new origin repaints everything
+    setView(originX, originY, columns, rows, tileSize) {
+        if (columns !== this.columns || rows !== this.rows || tileSize !== this.tileSize) {
+            this.columns = columns;
+            this.rows = rows;
+            this.tileSize = tileSize;
+            this.backgrounds = [this.drawCheckerboard(0), this.drawCheckerboard(1)];
+            this.fullRedraw = true;
+        } else if (originX !== this.originX || originY !== this.originY) {
+            this.fullRedraw = true;
+        }
+        this.originX = originX;
+        this.originY = originY;
+        this.background = this.backgrounds[(originX + originY) % 2];
+        if (this.fullRedraw) this.schedule();
+    }
+
+    drawCheckerboard(parity) {
+        const background = document.createElement('canvas');
+        background.width = this.canvas.width;
+        background.height = this.canvas.height;
+        const ctx = background.getContext('2d');
+        for (let y = 0; y < this.rows; y++) {
+            for (let x = 0; x < this.columns; x++) {
+                const [px, py, w, h] = this.rect(x, y);
+                ctx.fillStyle = (x + y + parity) % 2 === 0 ? this.colors.light : this.colors.dark;
+                ctx.fillRect(px, py, w, h);
+            }
+        }
+        return background;
+    }
+
+    // What the board should show: snakes as [{ id, body (head first), color }] drawn
+    // over fruits as [{ position, color }]. Painting waits for the next animation frame.
+    show(snakes, fruits) {
+        const target = new Map();
+        for (const { position, color } of fruits) {
+            target.set(cellKey(position), color);
+        }
+        const steps = [];
+        const bodies = new Map();
+        for (const { id, body, color } of snakes) {
+            for (const cell of body) {
+                target.set(cellKey(cell), color);
+            }
+            if (body.length === 0) continue;
+            const head = cellKey(body[0]);
+            const tail = cellKey(body[body.length - 1]);
+            const last = this.bodies.get(id);
+            bodies.set(id, { head, tail, length: body.length });
+            // A single step: the old head is now the neck
+            if (last && body.length > 1 && cellKey(body[1]) === last.head && last.head !== head) {
+                steps.push({ body, color, last });
+            }
+        }
+        this.bodies = bodies;
+        this.target = target;
+        this.targetChanged = true;
+        if (steps.length) {
+            this.startStep(steps, target);
+        } else if (this.animations.length) {
+            // Keep animating between ticks, unless a snake jumped or left meanwhile
+            this.animations = this.animations.filter((animation) => {
+                const key = cellKey(animation.cell);
+                const current = animation.grow ? target.get(key) === animation.color : !target.has(key);
+                if (!current) {
+                    this.stale.push(animation.cell);
+                    this.held.delete(key);
+                }
+                return current;
+            });
+        }
+        this.schedule();
+    }
+
+    startStep(steps, target) {
+        const now = performance.now();
+        if (this.lastStep !== null) {
+            const elapsed = Math.min(MAX_STEP_TIME, Math.max(MIN_STEP_TIME, now - this.lastStep));
+            this.stepTime = 0.7 * this.stepTime + 0.3 * elapsed;
+        }
+        this.lastStep = now;
+        this.stepStart = now;
+        for (const { cell } of this.animations) {
+            this.stale.push(cell);
+        }
+        this.animations = [];
+        this.held.clear();
+        for (const { body, color, last } of steps) {
+            // The head grows out of the neck
+            const head = body[0];
+            this.animations.push({ cell: head, color, side: sideOf(head, body[1]), grow: true });
+            this.held.add(cellKey(head));
+            // The old tail shrinks into the new one, unless the snake grew or something took its place
+            const tail = body[body.length - 1];
+            if (body.length === last.length && !target.has(last.tail)) {
+                const oldTail = keyCell(last.tail);
+                const side = sideOf(oldTail, tail);
+                if (side) {
+                    this.animations.push({ cell: oldTail, color, side, grow: false });
+                    this.held.add(last.tail);
+                }
+            }
+        }
+    }
+
+    schedule() {
+        if (!this.scheduled) {
+            this.scheduled = true;
+            requestAnimationFrame(this.frame);
+        }
+    }
+
+    frame(now) {
+        this.scheduled = false;
+        if (!this.background) return;
+        const ctx = this.ctx;
+        if (this.fullRedraw) {
+            ctx.drawImage(this.background, 0, 0);
+            this.painted.clear();
+            this.fullRedraw = false;
+            this.targetChanged = true;
+            this.stale = [];
+        }
+        for (const cell of this.stale) {
+            this.clearCell(cell);
+            this.painted.delete(cellKey(cell));
+        }
+        this.stale = [];
+
+        // Bring the steady board in line with the target, leaving animated cells alone
+        if (this.targetChanged) {
+            for (const [key, color] of this.painted) {
+                if (this.target.get(key) !== color || this.held.has(key)) {
+                    this.clearCell(keyCell(key));
+                    this.painted.delete(key);
+                }
+            }
+            for (const [key, color] of this.target) {
+                if (!this.held.has(key) && this.painted.get(key) !== color) {
+                    this.fillCell(keyCell(key), color);
+                    this.painted.set(key, color);
+                }
+            }
+            this.targetChanged = false;
+        }
+
+        if (this.animations.length) {
+            const progress = Math.min(1, Math.max(0, (now - this.stepStart) / this.stepTime));
+            for (const { cell, color, side, grow } of this.animations) {
+                this.clearCell(cell);
+                this.fillPart(cell, color, side, grow ? progress : 1 - progress);
+            }
+            if (progress >= 1) {
+                // Heads are now steady cells; tails are gone
+                for (const { cell, color, grow } of this.animations) {
+                    if (grow) this.painted.set(cellKey(cell), color);
+                }
+                this.animations = [];
+                this.held.clear();
+                this.targetChanged = true;
+            }
+            this.schedule();
+        }
+    }
+
+    // Pixel rect of a view cell, snapped to whole pixels so neighbouring cells don't bleed
+    rect(x, y) {
+        const left = Math.round(x * this.tileSize);
+        const top = Math.round(y * this.tileSize);
+        return [left, top, Math.round((x + 1) * this.tileSize) - left, Math.round((y + 1) * this.tileSize) - top];
+    }
+
+    inView(x, y) {
+        return x >= this.originX && y >= this.originY && x < this.originX + this.columns && y < this.originY + this.rows;
+    }
+
+    clearCell([x, y]) {
+        if (!this.inView(x, y)) return;
+        const [px, py, w, h] = this.rect(x - this.originX, y - this.originY);
+        this.ctx.drawImage(this.background, px, py, w, h, px, py, w, h);
+    }
+
+    fillCell(cell, color) {
+        this.fillPart(cell, color, null, 1);
+    }
+
+    // Fill the fraction of a cell that touches side ([dx, dy] towards a neighbour; null for all of it)
+    fillPart([x, y], color, side, fraction) {
+        if (fraction <= 0 || !this.inView(x, y)) return;
+        let [px, py, w, h] = this.rect(x - this.originX, y - this.originY);
+        if (side && fraction < 1) {
+            const [dx, dy] = side;
+            if (dx) {
+                const width = Math.round(w * fraction);
+                if (dx > 0) px += w - width;
+                w = width;
+            } else {
+                const height = Math.round(h * fraction);
+                if (dy > 0) py += h - height;
+                h = height;
+            }
+        }
+        if (w <= 0 || h <= 0) return;
+        const ctx = this.ctx;
+        ctx.fillStyle = color;
+        ctx.fillRect(px, py, w, h);
+        // Borders stay inside the cell so clearing a cell never eats into its neighbours
+        ctx.strokeStyle = this.colors.border;
+        ctx.lineWidth = 1;
+        ctx.strokeRect(px + 0.5, py + 0.5, w - 1, h - 1);
+    }
+}
+
+function cellKey([x, y]) {
+    return y * 65536 + x;
+}
+
+function keyCell(key) {
+    return [key % 65536, Math.floor(key / 65536)];
+}
+
+// Direction from a cell to an adjacent one, or null if they aren't adjacent
+function sideOf([x, y], [nx, ny]) {
+    const dx = nx - x;
+    const dy = ny - y;
+    return Math.abs(dx) + Math.abs(dy) === 1 ? [dx, dy] : null;
+}
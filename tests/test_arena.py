@@ -0,0 +1,143 @@
+import random
+
+from arena import SnakeArena
+from core import Direction
+
+DIRECTIONS = ['UP', 'DOWN', 'LEFT', 'RIGHT']
+
+
+def arena_with(*snakes):
+    """An arena with snakes laid out as given: (segments head first, direction) each."""
+    arena = SnakeArena(10, 10, seed=0)
+    ids = []
+    for segments, direction in snakes:
+        snake_id = arena.add_snake()
+        snake = arena.snakes[snake_id]
+        arena.clear_body(snake)
+        arena.lay(snake, segments, direction)
+        ids.append(snake_id)
+    return arena, ids
+
+
+def outcome(arena, snake_id):
+    snake = arena.snakes[snake_id]
+    return (list(snake.body), snake.eliminated_by) if snake.alive else ('out', snake.eliminated_by)
+
+
+def test_equal_heads_meeting_on_a_tile_are_all_eliminated():
+    arena, (a, b) = arena_with(([(3, 5), (2, 5), (1, 5)], Direction.RIGHT),
+                               ([(5, 5), (6, 5), (7, 5)], Direction.LEFT))
+    arena.update()
+    assert outcome(arena, a) == ('out', None)
+    assert outcome(arena, b) == ('out', None)
+    assert not any(arena.occupancy.snake)
+    assert sorted(entry[0] for entry in arena.eliminations) == [a, b]
+
+
+def test_the_longest_head_takes_the_tile():
+    arena, (a, b, c) = arena_with(([(3, 5), (2, 5), (1, 5), (0, 5)], Direction.RIGHT),
+                                  ([(5, 5), (6, 5), (7, 5)], Direction.LEFT),
+                                  ([(4, 7), (4, 8), (4, 9)], Direction.UP))
+    arena.update()
+    assert outcome(arena, a) == ([(4, 5), (3, 5), (2, 5), (1, 5)], None)
+    assert outcome(arena, b) == ('out', a)
+    # c moved up to (4, 6) and met nobody
+    assert outcome(arena, c) == ([(4, 6), (4, 7), (4, 8)], None)
+    assert arena.occupancy.snake_owner((4, 5)) == a
+    assert arena.occupancy.snake_owner((5, 5)) == 0
+
+
+def test_a_tie_among_the_longest_eliminates_every_contender():
+    arena, (a, b, c) = arena_with(([(3, 5), (2, 5), (1, 5), (0, 5)], Direction.RIGHT),
+                                  ([(5, 5), (6, 5), (7, 5), (8, 5)], Direction.LEFT),
+                                  ([(4, 6), (4, 7), (4, 8)], Direction.UP))
+    arena.update()
+    assert [outcome(arena, snake_id)[0] for snake_id in (a, b, c)] == ['out'] * 3
+    assert outcome(arena, c) == ('out', None)
+
+
+def test_heads_swapping_places_run_into_each_other():
+    arena, (a, b) = arena_with(([(4, 5), (3, 5), (2, 5)], Direction.RIGHT),
+                               ([(5, 5), (6, 5), (7, 5)], Direction.LEFT))
+    arena.update()
+    assert outcome(arena, a) == ('out', b)
+    assert outcome(arena, b) == ('out', a)
+
+
+def test_a_head_may_follow_a_leaving_tail_unless_that_snake_grows():
+    follower = ([(5, 4), (5, 3), (5, 2)], Direction.DOWN)
+    leader = ([(6, 6), (6, 5), (5, 5)], Direction.DOWN)
+    arena, (a, b) = arena_with(follower, leader)
+    arena.update()
+    assert outcome(arena, a) == ([(5, 5), (5, 4), (5, 3)], None)
+    assert outcome(arena, b) == ([(6, 7), (6, 6), (6, 5)], None)
+    
+    # The same moves with a fruit ahead of the leader: its tail stays put
+    arena, (a, b) = arena_with(follower, leader)
+    arena.add_fruit_player('fruit')
+    arena.update_fruit_position('fruit', 6, 7)
+    arena.update()
+    assert outcome(arena, a) == ('out', b)
+    assert outcome(arena, b)[0] == [(6, 7), (6, 6), (6, 5), (5, 5)]
+    assert arena.snakes[b].score == 10
+
+
+def test_a_head_leaving_the_board_is_eliminated():
+    arena, (a,) = arena_with(([(9, 5), (8, 5), (7, 5)], Direction.RIGHT))
+    arena.update()
+    assert outcome(arena, a) == ('out', None)
+    assert arena.respawn(a)
+    assert arena.snakes[a].alive and len(arena.snakes[a].body) == 3
+
+
+def test_restore_puts_back_snakes_that_joined_left_and_died():
+    def state(arena):
+        return (arena.get_game_state(), bytes(arena.occupancy.snake), list(arena.occupancy.empty.items),
+                list(arena.free_ids), list(arena.eliminations),
+                [(snake.snake_id, snake.direction, list(snake.turns), snake.eliminated_by)
+                 for snake in arena.snakes.values()], arena.rng.getstate())
+    
+    for seed in range(20):
+        rng = random.Random(seed)
+        arena = SnakeArena(12, 12, track_changes=True, seed=seed)
+        for _ in range(4):
+            arena.add_snake()
+        for player in range(3):
+            arena.add_fruit_player(f'p{player}')
+        
+        def play(ticks):
+            for tick in range(ticks):
+                for snake_id in list(arena.snakes):
+                    if rng.random() < 0.3:
+                        arena.steer(snake_id, rng.choice(DIRECTIONS), tick)
+                roll = rng.random()
+                if roll < 0.05:
+                    arena.add_snake()
+                elif roll < 0.08 and arena.snakes:
+                    arena.remove_snake(rng.choice(list(arena.snakes)))
+                elif roll < 0.2:
+                    for snake_id, snake in list(arena.snakes.items()):
+                        if not snake.alive:
+                            arena.respawn(snake_id)
+                arena.update()
+        
+        play(20)
+        before = state(arena)
+        clone = arena.clone()
+        outer = arena.snapshot()
+        play(15)
+        middle = state(arena)
+        inner = arena.snapshot()
+        play(30)
+        arena.restore(inner)
+        assert state(arena) == middle
+        play(10)
+        arena.restore(outer)
+        assert state(arena) == before
+        arena.release_snapshots()
+        assert all(snake.body.journal is None for snake in arena.snakes.values())
+        # After the rollback the arena plays on exactly like a copy that never moved
+        for tick in range(40):
+            arena.update()
+            clone.update()
+            assert arena.get_game_state() == clone.get_game_state()
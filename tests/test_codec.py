@@ -0,0 +1,148 @@
+import json
+import os
+import shutil
+import struct
+import subprocess
+
+import pytest
+
+from codec import BinaryCodec, HandleRegistry, decode_message
+
+CODEC_JS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'frontend', 'codec.js')
+
+STATE = {'type': 'game_state', 'seq': 70000, 'ack': 12, 'snake': [(5, 4), (4, 4), (300, 4)],
+         'fruits': {'alice': (1, 2), 'bob': (1000, 7)}, 'score': 30, 'game_over': False,
+         'grid_width': 1024, 'grid_height': 20}
+DELTA = {'type': 'game_delta', 'seq': 70001, 'ack': None, 'score': 40, 'game_over': True,
+         'push': [(6, 4), (7, 4)], 'pop': 1, 'fruits': {'carol': (3, 3)}, 'removed': ['alice']}
+VIEW = {'type': 'game_view', 'seq': 9, 'ack': 3, 'score': 0, 'game_over': False, 'reset': True,
+        'view': [10, 20, 30, 40], 'snake_enter': [(11, 21)], 'snake_leave': [(12, 22), (13, 23)],
+        'fruits': {'bob': (14, 24)}, 'fruits_leave': ['carol']}
+GAME_OVER = {'type': 'game_over', 'score': 123456}
+
+
+def expected(message, handles):
+    """The message as the pages decode it: fruits keyed by handle, players gone as handles."""
+    decoded = dict(message)
+    decoded['ack'] = message.get('ack') or 0
+    for key in ('snake', 'push', 'snake_enter', 'snake_leave'):
+        if key in message:
+            decoded[key] = [list(cell) for cell in message[key]]
+    if 'fruits' in message:
+        decoded['fruits'] = {str(handles.handles[player_id]): list(position)
+                             for player_id, position in message['fruits'].items()}
+    for key in ('removed', 'fruits_leave'):
+        if key in message:
+            decoded[key] = [handles.handles[player_id] for player_id in message[key] if player_id in handles.handles]
+    if message['type'] == 'game_over':
+        del decoded['ack']
+    return decoded
+
+
+def encode_all():
+    handles = HandleRegistry()
+    codec = BinaryCodec(handles)
+    # Handles are assigned as fruits are first encoded
+    frames = [codec.encode(message) for message in (STATE, DELTA, VIEW, GAME_OVER)]
+    return handles, frames
+
+
+def read_cells(frame, offset, count):
+    cells = [list(struct.unpack_from('<HH', frame, offset + 4 * i)) for i in range(count)]
+    return cells, offset + 4 * count
+
+
+def read_fruits(frame, offset):
+    (count,) = struct.unpack_from('<H', frame, offset)
+    fruits = {}
+    for i in range(count):
+        handle, x, y = struct.unpack_from('<HHH', frame, offset + 2 + 6 * i)
+        fruits[str(handle)] = [x, y]
+    return fruits, offset + 2 + 6 * count
+
+
+def read_handles(frame, offset):
+    (count,) = struct.unpack_from('<H', frame, offset)
+    return list(struct.unpack_from(f'<{count}H', frame, offset + 2)), offset + 2 + 2 * count
+
+
+def decode_like_codec_js(frame):
+    """Decoder at the fixed offsets frontend/codec.js reads, field by field."""
+    u8 = lambda offset: frame[offset]
+    u16 = lambda offset: struct.unpack_from('<H', frame, offset)[0]
+    u32 = lambda offset: struct.unpack_from('<I', frame, offset)[0]
+    if frame[0] == 0x01:
+        snake, offset = read_cells(frame, 22, u32(14))
+        fruits, _ = read_fruits(frame, offset)
+        return {'type': 'game_state', 'seq': u32(1), 'score': u32(5), 'game_over': bool(u8(9) & 1),
+                'grid_width': u16(10), 'grid_height': u16(12), 'ack': u32(18), 'snake': snake, 'fruits': fruits}
+    if frame[0] == 0x02:
+        push, offset = read_cells(frame, 16, u16(10))
+        pop = u16(offset)
+        fruits, offset = read_fruits(frame, offset + 2)
+        removed, _ = read_handles(frame, offset)
+        return {'type': 'game_delta', 'seq': u32(1), 'score': u32(5), 'game_over': bool(u8(9) & 1),
+                'ack': u32(12), 'push': push, 'pop': pop, 'fruits': fruits, 'removed': removed}
+    if frame[0] == 0x04:
+        enter, offset = read_cells(frame, 24, u16(22))
+        leave, offset = read_cells(frame, offset + 2, u16(offset))
+        fruits, offset = read_fruits(frame, offset)
+        fruits_leave, _ = read_handles(frame, offset)
+        return {'type': 'game_view', 'seq': u32(1), 'score': u32(5), 'game_over': bool(u8(9) & 1),
+                'reset': bool(u8(9) & 2), 'view': [u16(10), u16(12), u16(14), u16(16)], 'ack': u32(18),
+                'snake_enter': enter, 'snake_leave': leave, 'fruits': fruits, 'fruits_leave': fruits_leave}
+    assert frame[0] == 0x03
+    return {'type': 'game_over', 'score': u32(1)}
+
+
+def test_server_frames_decode_at_the_offsets_of_codec_js():
+    handles, frames = encode_all()
+    for message, frame in zip((STATE, DELTA, VIEW, GAME_OVER), frames):
+        assert decode_like_codec_js(frame) == expected(message, handles)
+
+
+def test_fruit_handles_are_reused_once_released():
+    handles = HandleRegistry()
+    assert [handles.acquire(player_id) for player_id in ('a', 'b', 'a')] == [0, 1, 0]
+    handles.release('a')
+    assert handles.acquire('c') == 0
+    assert handles.acquire('d') == 2
+
+
+def test_client_messages_decode():
+    assert decode_message(bytes([0x10, 2])) == {'type': 'direction', 'direction': 'LEFT'}
+    assert decode_message(struct.pack('<BBI', 0x10, 3, 77)) == {'type': 'direction', 'direction': 'RIGHT', 'seq': 77}
+    assert decode_message(struct.pack('<BHH', 0x11, 513, 2)) == {'type': 'move', 'x': 513, 'y': 2}
+    assert decode_message(bytes([0x12])) == {'type': 'reset'}
+    assert decode_message(bytes([0x13])) == {'type': 'resync'}
+    assert decode_message('{"type": "move", "x": 1, "y": 2}') == {'type': 'move', 'x': 1, 'y': 2}
+    for malformed in (b'', bytes([0x11, 1]), bytes([0x10, 9]), bytes([0x7f])):
+        with pytest.raises(ValueError):
+            decode_message(malformed)
+
+
+NODE_SCRIPT = '''
+const fs = require('fs');
+const codec = new Function(fs.readFileSync(process.argv[1], 'utf8') + '; return { decodeBinary, encodeBinary };')();
+const input = JSON.parse(fs.readFileSync(0, 'utf8'));
+const toBuffer = (hex) => new Uint8Array(Buffer.from(hex, 'hex')).buffer;
+const toHex = (data) => Buffer.from(data).toString('hex');
+console.log(JSON.stringify({
+    decoded: input.frames.map((hex) => codec.decodeBinary(toBuffer(hex))),
+    encoded: input.messages.map((message) => toHex(codec.encodeBinary(message)))
+}));
+'''
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='needs node to run frontend/codec.js')
+def test_frontend_codec_round_trips_with_the_server():
+    handles, frames = encode_all()
+    client_messages = [{'type': 'direction', 'direction': 'DOWN'}, {'type': 'direction', 'direction': 'UP', 'seq': 70000},
+                       {'type': 'move', 'x': 700, 'y': 3}, {'type': 'reset'}, {'type': 'resync'}]
+    result = subprocess.run(['node', '-e', NODE_SCRIPT, CODEC_JS], capture_output=True, text=True, check=True,
+                            input=json.dumps({'frames': [frame.hex() for frame in frames], 'messages': client_messages}))
+    output = json.loads(result.stdout)
+    for message, decoded in zip((STATE, DELTA, VIEW, GAME_OVER), output['decoded']):
+        assert decoded == expected(message, handles)
+    for message, encoded in zip(client_messages, output['encoded']):
+        assert decode_message(bytes.fromhex(encoded)) == message
@@ -0,0 +1,84 @@
+import asyncio
+
+# connection.py catches websockets.exceptions, which the server has always imported by then
+import websockets.exceptions
+
+from connection import CLOSE_TOO_SLOW, ClientConnection
+from protocol import PROTOCOL_DELTA, PROTOCOL_FULL
+
+
+class StalledSocket:
+    """A websocket whose client never reads: the first send never finishes."""
+    
+    def __init__(self):
+        self.sent = []
+        self.close_code = None
+        self.stalled = asyncio.Event()
+    
+    async def send(self, payload):
+        self.sent.append(payload)
+        await self.stalled.wait()
+    
+    async def close(self, code=1000, reason=''):
+        self.close_code = code
+
+
+def run(test):
+    async def main():
+        websocket = StalledSocket()
+        await test(websocket)
+    asyncio.run(main())
+
+
+def queued(connection):
+    return [payload for payload, _, _ in connection.outbound]
+
+
+def test_full_states_replace_older_frames_but_not_control_messages():
+    async def test(websocket):
+        connection = ClientConnection(websocket, PROTOCOL_FULL, max_queue=2)
+        await asyncio.sleep(0)
+        connection.send('registered')
+        for frame in range(5):
+            connection.send_frame(f'state {frame}')
+        connection.send('game over')
+        connection.send_frame('state 5')
+        assert queued(connection) == ['registered', 'game over', 'state 5']
+        connection.close()
+    run(test)
+
+
+def test_deltas_piling_up_are_dropped_for_a_keyframe_and_control_messages_stay():
+    async def test(websocket):
+        connection = ClientConnection(websocket, PROTOCOL_DELTA, max_queue=3)
+        connection.send_frame('keyframe 0')
+        await asyncio.sleep(0)
+        assert websocket.sent == ['keyframe 0']
+        connection.send('registered')
+        for seq in range(1, 4):
+            connection.send_frame(f'delta {seq}')
+        connection.send('leaderboard')
+        connection.send_frame('delta 4')
+        assert queued(connection) == ['registered', 'leaderboard']
+        assert connection.needs_keyframe
+        # Until a keyframe arrives, the client has nothing to apply deltas to
+        connection.send_frame('keyframe 5')
+        connection.send_frame('delta 6')
+        assert queued(connection) == ['registered', 'leaderboard', 'keyframe 5', 'delta 6']
+        connection.close()
+    run(test)
+
+
+def test_too_many_control_messages_close_the_connection():
+    async def test(websocket):
+        connection = ClientConnection(websocket, max_queue=2, max_control=4)
+        await asyncio.sleep(0)
+        for message in range(4):
+            connection.send(f'message {message}')
+        assert not connection.closed
+        connection.send('one too many')
+        assert connection.closed
+        await connection.closing_task
+        assert websocket.close_code == CLOSE_TOO_SLOW
+        assert connection.sender_task.cancelled()
+    run(test)
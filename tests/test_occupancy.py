@@ -0,0 +1,120 @@
+import random
+
+from core import ClassicSnake
+from game_logic import MultiplayerSnakeGame
+from occupancy import OccupancyGrid
+
+DIRECTIONS = ['UP', 'DOWN', 'LEFT', 'RIGHT']
+
+
+def grid_state(grid):
+    """Everything undo must put back, including the order of the cell sets (sampling depends on it)."""
+    return (bytes(grid.snake), list(grid.fruit_counts), list(grid.empty.items), list(grid.empty.slots),
+            list(grid.open.items), list(grid.open.slots))
+
+
+def check_sets(grid):
+    for cell in range(grid.width * grid.height):
+        assert (cell in grid.open) == (grid.snake[cell] == 0)
+        assert (cell in grid.empty) == (grid.snake[cell] == 0 and grid.fruit_counts[cell] == 0)
+
+
+def random_changes(grid, rng, count):
+    positions = [(x, y) for y in range(grid.height) for x in range(grid.width)]
+    for _ in range(count):
+        position = rng.choice(positions)
+        roll = rng.random()
+        if roll < 0.01:
+            grid.clear()
+        elif roll < 0.4:
+            if grid.is_snake(position):
+                grid.remove_snake(position)
+            else:
+                grid.add_snake(position, rng.randrange(1, 5))
+        elif grid.has_fruit(position) and roll < 0.7:
+            grid.remove_fruit(position)
+        else:
+            grid.add_fruit(position)
+
+
+def test_undo_puts_back_every_change_in_nested_marks():
+    for seed in range(30):
+        rng = random.Random(seed)
+        grid = OccupancyGrid(7, 5)
+        random_changes(grid, rng, 50)
+        grid.journal = []
+        marks = []
+        for _ in range(4):
+            marks.append((len(grid.journal), grid_state(grid)))
+            random_changes(grid, rng, 40)
+            check_sets(grid)
+        for mark, state in reversed(marks):
+            grid.undo(mark)
+            assert grid_state(grid) == state
+            check_sets(grid)
+        assert grid.journal == []
+
+
+def test_undo_of_removing_a_missing_segment_keeps_the_cell_open():
+    grid = OccupancyGrid(4, 3)
+    grid.add_snake((1, 1), 1)
+    grid.add_fruit((2, 1))
+    grid.journal = []
+    state = grid_state(grid)
+    for position in [(0, 0), (2, 1), (1, 1), (3, 2)]:
+        grid.remove_snake(position)
+    grid.undo(0)
+    assert grid_state(grid) == state
+    check_sets(grid)
+
+
+def test_restored_game_replays_the_same_future():
+    for seed in range(20):
+        rng = random.Random(seed)
+        game = MultiplayerSnakeGame(12, 12, seed=seed)
+        for player in range(4):
+            game.add_fruit_player(f'p{player}')
+        moves = [(rng.choice(DIRECTIONS), rng.randrange(12), rng.randrange(12)) for _ in range(200)]
+        
+        def play(start, end):
+            states = []
+            for tick in range(start, end):
+                direction, x, y = moves[tick]
+                game.set_direction(direction, tick)
+                game.update_fruit_position(f'p{tick % 4}', x, y)
+                if game.game_over:
+                    game.reset()
+                game.update()
+                states.append((game.get_game_state(), game.input_ack, grid_state(game.occupancy)))
+            return states
+        
+        play(0, 40)
+        outer = game.snapshot()
+        first = play(40, 120)
+        inner = game.snapshot()
+        second = play(120, 200)
+        game.restore(inner)
+        assert play(120, 200) == second
+        game.restore(outer)
+        assert play(40, 120) == first
+        game.release_snapshots()
+        assert game.occupancy.journal is None and game.snake.journal is None
+
+
+def test_clone_is_independent_and_plays_on_identically():
+    game = ClassicSnake(10, 10, seed=4)
+    for tick in range(30):
+        game.set_direction(DIRECTIONS[tick % 4] if tick % 7 == 0 else 'UP')
+        game.update()
+    clone = game.clone()
+    assert type(clone) is ClassicSnake
+    for tick in range(60):
+        for copy in (game, clone):
+            copy.set_direction(DIRECTIONS[tick % 4])
+            copy.update()
+        assert (list(clone.snake), clone.food, clone.score, clone.game_over) == \
+               (list(game.snake), game.food, game.score, game.game_over)
+    state = (list(game.snake), game.food, game.score, game.rng.getstate())
+    clone.reset()
+    clone.update()
+    assert (list(game.snake), game.food, game.score, game.rng.getstate()) == state
@@ -0,0 +1,79 @@
+import random
+
+from game_logic import MultiplayerSnakeGame
+from protocol import DeltaStream
+
+DIRECTIONS = ['UP', 'DOWN', 'LEFT', 'RIGHT']
+
+
+def apply_delta(state, delta):
+    """Apply a game_delta to a client's copy of the state, as the pages do."""
+    for cell in delta.get('push', []):
+        state['snake'].insert(0, cell)
+    if delta.get('pop'):
+        del state['snake'][-delta['pop']:]
+    state['fruits'].update(delta.get('fruits', {}))
+    for player_id in delta.get('removed', []):
+        state['fruits'].pop(player_id, None)
+    state['score'] = delta['score']
+    state['game_over'] = delta['game_over']
+
+
+def play(seed, ticks, keyframe_interval=50):
+    """Run a seeded game through a DeltaStream. Yields (keyframe_due, stream) every tick."""
+    rng = random.Random(seed)
+    game = MultiplayerSnakeGame(10, 10, track_changes=True, seed=seed)
+    for player in range(3):
+        game.add_fruit_player(f'p{player}')
+    stream = DeltaStream(game, keyframe_interval)
+    for tick in range(ticks):
+        if rng.random() < 0.3:
+            game.set_direction(rng.choice(DIRECTIONS), tick)
+        if rng.random() < 0.2:
+            player_id = f'p{rng.randrange(3)}'
+            game.update_fruit_position(player_id, rng.randrange(10), rng.randrange(10))
+        if rng.random() < 0.02:
+            game.remove_fruit_player(f'p{rng.randrange(3)}')
+        if game.game_over:
+            game.reset()
+        else:
+            game.update()
+        yield stream.advance(), stream
+
+
+def test_deltas_rebuild_the_state_of_every_keyframe():
+    for seed in range(20):
+        client = None
+        for keyframe_due, stream in play(seed, 300):
+            keyframe = stream.keyframe()
+            if keyframe_due or client is None:
+                client = {key: keyframe[key] for key in ('snake', 'fruits', 'score', 'game_over')}
+                client['snake'] = list(client['snake'])
+                continue
+            delta = stream.delta()
+            assert delta['seq'] == keyframe['seq']
+            apply_delta(client, delta)
+            assert client['snake'] == keyframe['snake']
+            assert client['fruits'] == keyframe['fruits']
+            assert (client['score'], client['game_over']) == (keyframe['score'], keyframe['game_over'])
+
+
+def test_seq_counts_up_and_keyframes_come_at_least_every_interval():
+    last_keyframe = 0
+    for seq, (keyframe_due, stream) in enumerate(play(1, 500, keyframe_interval=20), 1):
+        assert stream.seq == seq
+        if keyframe_due:
+            last_keyframe = seq
+        assert seq - last_keyframe < 20
+
+
+def test_reset_forces_a_keyframe():
+    game = MultiplayerSnakeGame(10, 10, track_changes=True, seed=0)
+    stream = DeltaStream(game)
+    stream.advance()
+    game.update()
+    assert not stream.advance()
+    game.reset()
+    assert stream.advance()
+    game.update()
+    assert not stream.advance()
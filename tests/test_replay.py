@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from game_logic import MultiplayerSnakeGame
+from replay import KEYFRAME, KEYFRAME_INTERVAL, REC_KEYFRAME, ReplayRecorder, ReplayWriter, replay
+
+DIRECTIONS = ['UP', 'DOWN', 'LEFT', 'RIGHT']
+
+
+def record(path, seed, ticks):
+    """Play a seeded game with players and bots coming and going, logging it as a room does."""
+    rng = random.Random(seed)
+    game = MultiplayerSnakeGame(15, 15, seed=seed)
+    game.enable_bots(seed=seed)
+    writer = ReplayWriter()
+    recorder = ReplayRecorder(str(path), writer, 15, 15, seed)
+    players = []
+    for tick in range(ticks):
+        roll = rng.random()
+        if roll < 0.03 or not players:
+            player_id = f'player-{tick}'
+            if rng.random() < 0.5:
+                game.add_fruit_bot(player_id)
+            else:
+                game.add_fruit_player(player_id)
+            recorder.join(player_id)
+            players.append(player_id)
+        elif roll < 0.05 and len(players) > 1:
+            player_id = players.pop(rng.randrange(len(players)))
+            game.remove_fruit_player(player_id)
+            recorder.leave(player_id)
+        if rng.random() < 0.3:
+            direction = rng.choice(DIRECTIONS)
+            game.set_direction(direction)
+            recorder.direction(direction)
+        player_id = rng.choice(players)
+        x, y = rng.randrange(15), rng.randrange(15)
+        if game.update_fruit_position(player_id, x, y):
+            recorder.move(player_id, x, y)
+        for player_id, x, y in game.move_bots():
+            recorder.move(player_id, x, y)
+        if game.game_over:
+            game.reset()
+            recorder.reset()
+        game.update()
+        recorder.tick(game)
+    recorder.close()
+    writer.stop()
+    return game
+
+
+def keyframe_offset(data, tick):
+    """Offset of the keyframe record for a tick (its type and tick bytes don't occur earlier in these logs)."""
+    return data.index(KEYFRAME.pack(REC_KEYFRAME, tick, bytes(8))[:5])
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_replay_reproduces_the_recorded_game(tmp_path, seed):
+    path = tmp_path / 'game.snkr'
+    game = record(path, seed, 1050)
+    result = replay(str(path))
+    assert result['ticks'] == 1050
+    assert result['keyframes_checked'] == 1050 // KEYFRAME_INTERVAL
+    assert result['score'] == game.score
+    assert not result['truncated']
+
+
+def test_replay_detects_a_diverging_game(tmp_path):
+    path = tmp_path / 'game.snkr'
+    record(path, 1, 250)
+    data = bytearray(path.read_bytes())
+    # Corrupt the state hash of the first keyframe
+    data[keyframe_offset(data, KEYFRAME_INTERVAL) + 5] ^= 0xFF
+    path.write_bytes(data)
+    with pytest.raises(ValueError, match='diverged at tick 100'):
+        replay(str(path))
+
+
+def test_replay_of_a_log_cut_mid_record_is_truncated(tmp_path):
+    path = tmp_path / 'game.snkr'
+    record(path, 2, 150)
+    data = path.read_bytes()
+    path.write_bytes(data[:keyframe_offset(data, KEYFRAME_INTERVAL) + 3])
+    result = replay(str(path))
+    assert result['truncated']
+    assert result['ticks'] == KEYFRAME_INTERVAL
+    assert result['keyframes_checked'] == 0
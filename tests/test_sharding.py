@@ -0,0 +1,45 @@
+import asyncio
+
+from sharding import HashRing, read_message, send_message
+
+ROOMS = [f'room-{number}' for number in range(4000)]
+
+
+def test_owner_is_stable_and_spread_over_workers():
+    ring = HashRing(range(4))
+    owners = [ring.owner(room_id) for room_id in ROOMS]
+    reordered = HashRing([3, 2, 1, 0])
+    assert owners == [reordered.owner(room_id) for room_id in ROOMS]
+    for worker in range(4):
+        # Each worker should get about a quarter of the rooms
+        assert 0.15 < owners.count(worker) / len(ROOMS) < 0.35
+
+
+def test_a_new_worker_only_takes_rooms_from_the_others():
+    ring = HashRing(range(4))
+    bigger = ring.with_worker(4)
+    assert 4 in bigger and 4 not in ring
+    moved = [room_id for room_id in ROOMS if ring.owner(room_id) != bigger.owner(room_id)]
+    assert all(bigger.owner(room_id) == 4 for room_id in moved)
+    assert 0.1 < len(moved) / len(ROOMS) < 0.3
+
+
+def test_empty_ring_owns_nothing():
+    assert HashRing().owner('default') is None
+    assert HashRing([7]).owner('default') == 7
+
+
+def test_control_messages_round_trip():
+    async def main():
+        reader = asyncio.StreamReader()
+        
+        class Writer:
+            def write(self, data):
+                reader.feed_data(data)
+        
+        messages = [{'type': 'hello', 'worker': 1}, {'type': 'released', 'rooms': [{'room_id': 'é' * 70000}]}]
+        for message in messages:
+            send_message(Writer(), message)
+        reader.feed_eof()
+        assert [await read_message(reader) for _ in range(3)] == messages + [None]
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+import numpy as np
+
+from core import ClassicSnake
+from vec_env import CELL_FOOD, CELL_HEAD, VecSnakeEnv
+
+DIRECTIONS = ['UP', 'DOWN', 'LEFT', 'RIGHT']
+REWARD_FOOD = 1.0
+REWARD_DEATH = -1.0
+
+
+def vec_body(env, i):
+    """Body cells of game i, head first."""
+    return [int(env.body[i, (env.head_ptr[i] - k) % env.num_cells]) for k in range(env.length[i])]
+
+
+def classic_body(game):
+    return [y * game.grid_width + x for x, y in game.snake]
+
+
+def food_of(env, i):
+    return divmod(int(env.food[i]), env.grid_width)[::-1]
+
+
+def check_same(env, games):
+    for i, game in enumerate(games):
+        assert vec_body(env, i) == classic_body(game)
+        assert env.score[i] == game.score
+        assert food_of(env, i) == game.food
+
+
+def test_vec_env_follows_the_classic_rules():
+    for seed in range(6):
+        env = VecSnakeEnv(num_envs=16, grid_width=6 + seed % 3, grid_height=5, reward_food=REWARD_FOOD,
+                          reward_death=REWARD_DEATH, seed=seed)
+        games = [ClassicSnake(env.grid_width, env.grid_height, seed=seed) for _ in range(env.num_envs)]
+        # The food is drawn by each side's own generator, so the classic games take the batch's
+        for i, game in enumerate(games):
+            game.food = food_of(env, i)
+        rng = np.random.default_rng(seed)
+        resets = 0
+        for _ in range(800):
+            actions = rng.integers(0, 4, size=env.num_envs)
+            # Mostly keep going straight, so snakes live long enough to grow
+            actions = np.where(rng.random(env.num_envs) < 0.6, env.direction, actions)
+            observations, rewards, dones, infos = env.step(actions)
+            for i, game in enumerate(games):
+                score = game.score
+                game.set_direction(DIRECTIONS[actions[i]])
+                game.update()
+                if game.game_over:
+                    reward = REWARD_DEATH
+                else:
+                    reward = REWARD_FOOD if game.score > score else 0.0
+                assert rewards[i] == reward
+                assert dones[i] == game.game_over
+                if game.game_over:
+                    assert infos['score'][i] == game.score
+                    game.reset()
+                    resets += 1
+                game.food = food_of(env, i)
+            check_same(env, games)
+            heads = observations.reshape(env.num_envs, -1) == CELL_HEAD
+            assert (np.flatnonzero(heads) % env.num_cells == [vec_body(env, i)[0] for i in range(env.num_envs)]).all()
+            assert ((observations.reshape(env.num_envs, -1) == CELL_FOOD).sum(axis=1) == 1).all()
+        assert resets > 0